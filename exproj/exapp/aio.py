@@ -0,0 +1,201 @@
+"""
+asyncio dispatch for model signals.
+
+    dispatcher = AsyncDispatcher(timeout=2)
+
+    @dispatcher.receiver(post_save, sender=Customer)
+    async def push_to_search(sender, instance, **kwargs):
+        ...
+
+Receivers connected to an ``AsyncDispatcher`` may be coroutine functions or
+plain functions returning an awaitable (plain functions returning anything
+else are simply called).  ``asend()`` returns an awaitable that runs every
+receiver concurrently with ``asyncio.gather``, each under its own timeout,
+and resolves to ``[(receiver, result_or_exception), ...]`` like
+``Signal.send_robust``.
+
+Existing synchronous call sites such as ``Model.save()`` keep working: the
+dispatcher connects one bridge receiver per (signal, sender) that runs the
+async receivers on a per-thread event loop and waits for them, or, if an
+event loop is already running in the calling thread, schedules them as a
+task (see ``pending`` and ``drain``).  Like a synchronous receiver, an async
+receiver that raises or times out makes the sending call (``save()``, say)
+raise, once every receiver has finished; failures of scheduled receivers
+are logged to the ``exapp.aio`` logger.
+
+Requires Python 3.5+; the dispatcher refuses to start on Python 2.
+"""
+import inspect
+import logging
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import asyncio
+except ImportError:  # Python 2
+    asyncio = None
+
+from .dispatch import receiver_label
+
+logger = logging.getLogger(__name__)
+
+
+def _running_loop():
+    get_running = getattr(asyncio, '_get_running_loop', None)
+    if get_running is not None:
+        return get_running()
+    return None
+
+
+def _log_failures(task):
+    if task.cancelled():
+        return
+    for receiver, result in task.result():
+        if isinstance(result, Exception):
+            logger.error("Async receiver %s failed", receiver_label(receiver),
+                         exc_info=(type(result), result, result.__traceback__))
+
+
+class AsyncDispatcher(object):
+
+    def __init__(self, timeout=None):
+        if asyncio is None:
+            raise ImproperlyConfigured("AsyncDispatcher requires asyncio (Python 3.5+).")
+        self.timeout = timeout
+        self._receivers = {}
+        self._bridges = {}
+        self._local = threading.local()
+        self.pending = set()
+
+    def connect(self, signal, receiver, sender=None, timeout=None):
+        """
+        Connect ``receiver`` for ``sender`` (or every sender if None), with
+        a per-receiver ``timeout`` overriding the dispatcher default.
+        """
+        key = (signal, sender)
+        receivers = self._receivers.setdefault(key, [])
+        if any(r is receiver for r, _ in receivers):
+            return
+        receivers.append((receiver, timeout))
+        if key not in self._bridges:
+            def bridge(sender, **kwargs):
+                kwargs.pop('signal', None)
+                responses = self._send_sync(self._receivers.get(key, ()), signal, sender, kwargs)
+                for receiver, result in responses or ():
+                    if isinstance(result, Exception):
+                        raise result
+                return responses
+            self._bridges[key] = bridge
+            signal.connect(bridge, sender=sender, weak=False)
+
+    def disconnect(self, signal, receiver, sender=None):
+        key = (signal, sender)
+        receivers = [(r, t) for r, t in self._receivers.get(key, []) if r is not receiver]
+        self._receivers[key] = receivers
+        if not receivers and key in self._bridges:
+            signal.disconnect(self._bridges.pop(key), sender=sender)
+            del self._receivers[key]
+
+    def receiver(self, signal, sender=None, timeout=None):
+        """Decorator form of ``connect``."""
+        def _decorator(func):
+            self.connect(signal, func, sender=sender, timeout=timeout)
+            return func
+        return _decorator
+
+    def receivers_for(self, signal, sender):
+        found = list(self._receivers.get((signal, sender), []))
+        if sender is not None:
+            found.extend(self._receivers.get((signal, None), []))
+        return found
+
+    def _call(self, receiver, timeout, signal, sender, kwargs):
+        result = receiver(signal=signal, sender=sender, **kwargs)
+        if not inspect.isawaitable(result):
+            return None, result
+        timeout = self.timeout if timeout is None else timeout
+        if timeout is not None:
+            result = asyncio.wait_for(result, timeout)
+        return result, None
+
+    def asend(self, signal, sender, **kwargs):
+        """
+        Awaitable resolving to ``[(receiver, result_or_exception), ...]``.
+        Uses the running event loop, or the thread's current one.
+        """
+        loop = _running_loop() or asyncio.get_event_loop()
+        return self._asend(loop, self.receivers_for(signal, sender), signal, sender, kwargs)
+
+    def _asend(self, loop, receivers, signal, sender, kwargs):
+        responses = []
+        futures = []
+        for receiver, timeout in receivers:
+            try:
+                awaitable, result = self._call(receiver, timeout, signal, sender, kwargs)
+            except Exception as err:
+                awaitable, result = None, err
+            responses.append([receiver, result])
+            if awaitable is not None:
+                futures.append((responses[-1], asyncio.ensure_future(awaitable, loop=loop)))
+
+        outer = loop.create_future()
+        if not futures:
+            outer.set_result([tuple(r) for r in responses])
+            return outer
+
+        gathered = asyncio.gather(*[f for _, f in futures], return_exceptions=True)
+
+        def _done(fut):
+            if outer.cancelled():
+                return
+            if fut.cancelled():
+                outer.cancel()
+                return
+            for (response, _), result in zip(futures, fut.result()):
+                response[1] = result
+            outer.set_result([tuple(r) for r in responses])
+        gathered.add_done_callback(_done)
+        return outer
+
+    def _thread_loop(self):
+        loop = getattr(self._local, 'loop', None)
+        if loop is None or loop.is_closed():
+            loop = self._local.loop = asyncio.new_event_loop()
+        return loop
+
+    def send_sync(self, signal, sender, **kwargs):
+        """
+        Bridge for synchronous callers.  Blocks until every receiver has
+        finished, unless an event loop is already running in this thread,
+        in which case the receivers are scheduled and ``None`` is returned.
+        """
+        return self._send_sync(self.receivers_for(signal, sender), signal, sender, kwargs)
+
+    def _send_sync(self, receivers, signal, sender, kwargs):
+        running = _running_loop()
+        if running is not None:
+            task = self._asend(running, receivers, signal, sender, kwargs)
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+            task.add_done_callback(_log_failures)
+            return None
+        loop = self._thread_loop()
+        return loop.run_until_complete(self._asend(loop, receivers, signal, sender, kwargs))
+
+    def drain(self):
+        """
+        Awaitable waiting for receivers scheduled by ``send_sync`` while a
+        loop was running.
+        """
+        return asyncio.gather(*list(self.pending), return_exceptions=True)
+
+    def close(self):
+        for key, bridge in list(self._bridges.items()):
+            signal, sender = key
+            signal.disconnect(bridge, sender=sender)
+        self._bridges.clear()
+        self._receivers.clear()
+        loop = getattr(self._local, 'loop', None)
+        if loop is not None and not loop.is_closed():
+            loop.close()
@@ -0,0 +1,23 @@
+from django.apps import AppConfig, apps
+from django.conf import settings
+
+
+class ExappConfig(AppConfig):
+    name = 'exapp'
+
+    def ready(self):
+        from . import (bus, counters, dispatch, journal, loadtest, outbox, profiling,
+                       relation_signals, relcache, topology)
+        topology.configure()
+        relation_signals.install(self.get_models())
+        if getattr(settings, 'SIGNAL_COMPILED_RECEIVERS', True):
+            models = list(apps.get_models(include_auto_created=True))
+            for signal in dispatch.MODEL_SIGNALS:
+                dispatch.compile_signal(signal, senders=models)
+        profiling.configure()
+        journal.configure()
+        outbox.configure()
+        relcache.configure()
+        counters.configure()
+        bus.configure()
+        loadtest.configure()
@@ -0,0 +1,352 @@
+"""
+Benchmarks for the cost of signal dispatch on each kind of relation
+operation exercised in ``exproj/tests.py``.
+
+Each scenario is run at several sizes, once with the receivers in
+``exapp.models`` connected and once with them disconnected, inside a
+transaction that is rolled back afterwards.  Results are plain dicts so they
+can be dumped as JSON and compared across Django versions; see the
+``signal_benchmark`` management command.
+"""
+import contextlib
+import gc
+import platform
+import sys
+import time
+import weakref
+
+import django
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import signals as model_signals
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from . import dispatch, models, related, signals as exapp_signals
+from .querycount import QueryCounter
+
+
+DEFAULT_SIZES = (1, 1000, 100000)
+
+# Keeps relation operations under SQLite's bound-parameter limit.
+CHUNK_SIZE = 500
+
+MODEL_SIGNALS = (
+    model_signals.pre_save,
+    model_signals.post_save,
+    model_signals.pre_delete,
+    model_signals.post_delete,
+    exapp_signals.pre_bulk_related_save,
+    exapp_signals.post_bulk_related_save,
+    exapp_signals.pre_bulk_save,
+    exapp_signals.post_bulk_save,
+    exapp_signals.pre_bulk_delete,
+    exapp_signals.post_bulk_delete,
+)
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def _chunks(seq, size=CHUNK_SIZE):
+    for start in range(0, len(seq), size):
+        yield seq[start:start + size]
+
+
+def _resolve(receiver_ref):
+    if isinstance(receiver_ref, weakref.ReferenceType):
+        return receiver_ref()
+    return receiver_ref
+
+
+@contextlib.contextmanager
+def receivers_disconnected(module=models.__name__):
+    """Temporarily remove every model-signal receiver defined in ``module``."""
+    saved = []
+    for signal in MODEL_SIGNALS:
+        with signal.lock:
+            saved.append((signal, signal.receivers[:]))
+            signal.receivers[:] = [
+                entry for entry in signal.receivers
+                if getattr(_resolve(entry[1]), '__module__', None) != module
+            ]
+            signal.sender_receivers_cache.clear()
+            dispatch.invalidate(signal)
+    try:
+        yield
+    finally:
+        for signal, receivers in saved:
+            with signal.lock:
+                signal.receivers[:] = receivers
+                signal.sender_receivers_cache.clear()
+                dispatch.invalidate(signal)
+                signal.sender_receivers_cache.clear()
+
+
+def _set_related(instance, accessor, objs):
+    # RelatedManager.set() appeared in 1.9; 1.8 only has assignment.
+    manager = getattr(instance, accessor)
+    if hasattr(manager, 'set'):
+        manager.set(objs)
+    else:
+        setattr(instance, accessor, objs)
+
+
+def _make_customers(n, company=None):
+    models.Customer.objects.bulk_create(
+        [models.Customer(name='bench %d' % i, company=company) for i in range(n)],
+        batch_size=CHUNK_SIZE)
+    return list(models.Customer.objects.filter(name__startswith='bench ').order_by('pk'))
+
+
+def _make_categories(n):
+    models.CustomerCategory.objects.bulk_create(
+        [models.CustomerCategory(name='bench cat %d' % i) for i in range(n)],
+        batch_size=CHUNK_SIZE)
+    return list(models.CustomerCategory.objects.order_by('pk'))
+
+
+class Scenario(object):
+    """A relation operation touching ``n`` rows; ``setup`` is not timed."""
+
+    name = None
+    description = None
+
+    def setup(self, n):
+        raise NotImplementedError
+
+    def run(self, fixture):
+        raise NotImplementedError
+
+
+class OneToOneForward(Scenario):
+    name = '1to1_forward'
+    description = 'extra = CustomerExtraJunk(customer=c); extra.save()'
+
+    def setup(self, n):
+        return _make_customers(n)
+
+    def run(self, customers):
+        for customer in customers:
+            models.CustomerExtraJunk(customer=customer).save()
+
+
+class OneToOneReverse(Scenario):
+    name = '1to1_reverse'
+    description = 'customer.extrajunk = extra; extra.save()'
+
+    def setup(self, n):
+        return _make_customers(n)
+
+    def run(self, customers):
+        for customer in customers:
+            extra = models.CustomerExtraJunk()
+            customer.extrajunk = extra
+            extra.save()
+
+
+class ForeignKeyForward(Scenario):
+    name = '1toM_forward'
+    description = 'customer.company = company; customer.save()'
+
+    def setup(self, n):
+        company = models.Company.objects.create(name='bench')
+        return company, _make_customers(n)
+
+    def run(self, fixture):
+        company, customers = fixture
+        for customer in customers:
+            customer.company = company
+            customer.save()
+
+
+class ForeignKeyReverseAdd(Scenario):
+    name = '1toM_reverse_add'
+    description = 'company.customers.add(*customers)'
+
+    def setup(self, n):
+        company = models.Company.objects.create(name='bench')
+        return company, _make_customers(n)
+
+    def run(self, fixture):
+        company, customers = fixture
+        for chunk in _chunks(customers):
+            company.customers.add(*chunk)
+
+
+class ForeignKeyReverseBulkAdd(ForeignKeyReverseAdd):
+    name = '1toM_reverse_bulk_add'
+    description = "related.bulk_add(company, 'customers', customers)"
+
+    def run(self, fixture):
+        company, customers = fixture
+        related.bulk_add(company, 'customers', customers)
+
+
+class ForeignKeyReverseAssign(Scenario):
+    name = '1toM_reverse_assign'
+    description = 'company.customers = customers'
+
+    def setup(self, n):
+        customers = _make_customers(n)
+        companies = [models.Company.objects.create(name='bench %d' % i)
+                     for i, _ in enumerate(_chunks(customers))]
+        return companies, customers
+
+    def run(self, fixture):
+        companies, customers = fixture
+        for company, chunk in zip(companies, _chunks(customers)):
+            _set_related(company, 'customers', chunk)
+
+
+class ManyToManyDirectAdd(Scenario):
+    name = 'm2m_direct_add'
+    description = 'category.customers_direct.add(*customers)'
+
+    def setup(self, n):
+        return _make_categories(1)[0], _make_customers(n)
+
+    def run(self, fixture):
+        category, customers = fixture
+        for chunk in _chunks(customers):
+            category.customers_direct.add(*chunk)
+
+
+class ManyToManyThroughSave(Scenario):
+    name = 'm2m_through_save'
+    description = 'CustomerCategoryRel(customer=c, category=cat).save()'
+
+    def setup(self, n):
+        return _make_categories(1)[0], _make_customers(n)
+
+    def run(self, fixture):
+        category, customers = fixture
+        for customer in customers:
+            models.CustomerCategoryRel(customer=customer, category=category).save()
+
+
+class CascadeDelete(Scenario):
+    name = 'cascade_delete'
+    description = 'Customer.objects.filter(pk__in=...).delete() with extra and rel rows'
+
+    def setup(self, n):
+        category = _make_categories(1)[0]
+        customers = _make_customers(n)
+        models.CustomerExtraJunk.objects.bulk_create(
+            [models.CustomerExtraJunk(customer=c) for c in customers],
+            batch_size=CHUNK_SIZE)
+        models.CustomerCategoryRel.objects.bulk_create(
+            [models.CustomerCategoryRel(customer=c, category=category) for c in customers],
+            batch_size=CHUNK_SIZE)
+        return [c.pk for c in customers]
+
+    def run(self, pks):
+        for chunk in _chunks(pks):
+            models.Customer.objects.filter(pk__in=chunk).delete()
+
+
+class PlannedCascadeDelete(CascadeDelete):
+    name = 'cascade_delete_planned'
+    description = 'Same as cascade_delete, with planned_delete() batching the signals'
+
+    def run(self, pks):
+        for chunk in _chunks(pks):
+            models.Customer.objects.filter(pk__in=chunk).planned_delete()
+
+
+SCENARIOS = (
+    OneToOneForward(),
+    OneToOneReverse(),
+    ForeignKeyForward(),
+    ForeignKeyReverseAdd(),
+    ForeignKeyReverseBulkAdd(),
+    ForeignKeyReverseAssign(),
+    ManyToManyDirectAdd(),
+    ManyToManyThroughSave(),
+    CascadeDelete(),
+    PlannedCascadeDelete(),
+)
+
+
+class AllocationTracker(object):
+    """
+    Measures allocations during a block.
+
+    Uses tracemalloc where available; on Python 2 falls back to the net
+    change in gc-tracked objects, which undercounts short-lived garbage.
+    """
+
+    def __enter__(self):
+        gc.collect()
+        if tracemalloc is not None:
+            self.method = 'tracemalloc'
+            tracemalloc.start()
+        else:
+            self.method = 'gc_objects'
+            self._gc_was_enabled = gc.isenabled()
+            gc.disable()
+            self._before = len(gc.get_objects())
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if tracemalloc is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.result = {'method': self.method, 'net_bytes': current, 'peak_bytes': peak}
+        else:
+            self.result = {'method': self.method,
+                           'net_objects': len(gc.get_objects()) - self._before}
+            if self._gc_was_enabled:
+                gc.enable()
+
+
+@contextlib.contextmanager
+def _nothing():
+    yield None
+
+
+def run_scenario(scenario, n, receivers=True, using=DEFAULT_DB_ALIAS, allocations=True):
+    """Time one scenario at size ``n``; all rows are rolled back."""
+    disconnect = _nothing() if receivers else receivers_disconnected()
+    with disconnect, transaction.atomic(using=using):
+        fixture = scenario.setup(n)
+        models.signal_log.clear()
+        tracker = AllocationTracker() if allocations else _nothing()
+        with QueryCounter(using) as counter, tracker as allocs:
+            start = timer()
+            scenario.run(fixture)
+            elapsed = timer() - start
+        transaction.set_rollback(True, using=using)
+    return {
+        'scenario': scenario.name,
+        'rows': n,
+        'receivers': receivers,
+        'seconds': elapsed,
+        'ops_per_sec': n / elapsed if elapsed else None,
+        'queries': counter.count,
+        'allocations': allocs.result if allocs is not None else None,
+    }
+
+
+def environment():
+    return {
+        'django': django.get_version(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': sys.platform,
+    }
+
+
+def run_all(sizes=DEFAULT_SIZES, scenarios=SCENARIOS, using=DEFAULT_DB_ALIAS,
+            allocations=True, progress=None):
+    results = []
+    for scenario in scenarios:
+        for n in sizes:
+            for receivers in (True, False):
+                result = run_scenario(scenario, n, receivers=receivers, using=using,
+                                      allocations=allocations)
+                if progress is not None:
+                    progress(result)
+                results.append(result)
+    return {'environment': environment(), 'results': results}
@@ -0,0 +1,469 @@
+"""
+Broadcasting model events to the other processes on this host.
+
+    transport = UnixDatagramTransport('/run/exapp/bus')
+    broadcaster = Broadcaster(transport)           # in every worker
+    Subscriber(transport, ignore=broadcaster.origin).start()
+
+A ``Broadcaster`` turns post_save, post_delete, the batched save/delete
+signals and ``related_changed`` into compact events (signal, model label,
+pk, changed fields) and publishes them, once the write commits, in batches
+of up to ``batch_size`` events or every ``flush_interval`` seconds.  Events
+for the same row are merged within a batch.  If more than ``max_pending``
+rows are waiting, pending events collapse into one "any row may have
+changed" event per model, so a write burst costs subscribers a bounded
+amount of work.
+
+A ``Subscriber`` receives batches and sends ``exapp.signals.remote_signal``
+for each event in its own process.  Batches are numbered per publisher;
+when a transport drops one (a full subscriber socket, say) the subscriber
+sends a ``remote_signal`` with ``sender=None``, meaning anything may have
+changed.
+
+Transports: ``UnixDatagramTransport`` (one socket per subscriber in a
+shared directory; sends never block, a full socket drops the datagram) and
+``MemoryTransport`` for tests.  Django 1.8 has no commit hook, so there
+events are published as soon as they are sent.
+
+Set ``SIGNAL_BUS = {'transport': <dotted path>, 'transport_options': {...}}``,
+plus any ``Broadcaster`` options and ``'subscribe': False`` for publish-only
+processes, to enable it for the exapp models.
+"""
+import atexit
+import collections
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import six
+from django.utils.module_loading import import_string
+
+from .recording import signal_name
+from .signals import remote_signal
+
+
+RemoteEvent = collections.namedtuple(
+    'RemoteEvent', ['origin', 'signal', 'model', 'pk', 'fields'])
+
+DEFAULT_MAX_PAYLOAD = 32 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def _label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name)
+
+
+class Transport(object):
+    """Carries payloads (bytes) from publishers to every bound endpoint."""
+
+    max_payload = DEFAULT_MAX_PAYLOAD
+
+    def send(self, payload):
+        """Deliver ``payload``; returns how many endpoints dropped it."""
+        raise NotImplementedError
+
+    def bind(self):
+        """A new endpoint, with ``receive(timeout)`` and ``close()``."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class _MemoryEndpoint(object):
+
+    def __init__(self, transport, capacity):
+        self.transport = transport
+        self.queue = collections.deque()
+        self.capacity = capacity
+        self.ready = threading.Condition()
+
+    def put(self, payload):
+        with self.ready:
+            if len(self.queue) >= self.capacity:
+                return False
+            self.queue.append(payload)
+            self.ready.notify()
+            return True
+
+    def receive(self, timeout=None):
+        with self.ready:
+            if not self.queue and timeout != 0:
+                self.ready.wait(timeout)
+            return self.queue.popleft() if self.queue else None
+
+    def close(self):
+        self.transport._endpoints.remove(self)
+
+
+class MemoryTransport(Transport):
+    """In-process transport; each endpoint buffers ``capacity`` payloads."""
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._endpoints = []
+
+    def send(self, payload):
+        return sum(1 for endpoint in list(self._endpoints) if not endpoint.put(payload))
+
+    def bind(self):
+        endpoint = _MemoryEndpoint(self, self.capacity)
+        self._endpoints.append(endpoint)
+        return endpoint
+
+
+class _UnixEndpoint(object):
+
+    def __init__(self, path, max_payload):
+        self.path = path
+        self.max_payload = max_payload
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(path)
+
+    def receive(self, timeout=None):
+        self.sock.settimeout(timeout)
+        try:
+            return self.sock.recv(self.max_payload)
+        except socket.timeout:
+            return None
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return None
+            raise
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class UnixDatagramTransport(Transport):
+    """
+    Subscribers bind sockets in ``directory``; publishers send each payload
+    to all of them without blocking.  Sockets left behind by dead processes
+    are removed on the first failed send.
+    """
+
+    SUFFIX = '.sock'
+
+    def __init__(self, directory, max_payload=DEFAULT_MAX_PAYLOAD, rescan_interval=1.0):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_payload = max_payload
+        self.rescan_interval = rescan_interval
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._peers = None
+        self._scanned = 0
+
+    def _peer_paths(self):
+        now = time.time()
+        if self._peers is None or now - self._scanned >= self.rescan_interval:
+            self._peers = [os.path.join(self.directory, name)
+                           for name in os.listdir(self.directory)
+                           if name.endswith(self.SUFFIX)]
+            self._scanned = now
+        return self._peers
+
+    def send(self, payload):
+        dropped = 0
+        for path in self._peer_paths():
+            try:
+                self._sock.sendto(payload, path)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    dropped += 1
+                elif e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                    self._peers = None
+                else:
+                    raise
+        return dropped
+
+    def bind(self):
+        name = '%d-%s%s' % (os.getpid(), uuid.uuid4().hex[:8], self.SUFFIX)
+        self._peers = None
+        return _UnixEndpoint(os.path.join(self.directory, name), self.max_payload)
+
+    def close(self):
+        self._sock.close()
+
+
+def _encode(origin, seq, events):
+    return json.dumps({'o': origin, 's': seq, 'e': events},
+                      separators=(',', ':')).encode('utf-8')
+
+
+class Broadcaster(object):
+
+    def __init__(self, transport, batch_size=256, flush_interval=0.05, max_pending=10000):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.origin = '%s:%d:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending = collections.OrderedDict()
+        self._seq = 0
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        self.stats = collections.Counter()
+
+    def publish(self, signal, model, pk, fields=()):
+        """Queue an event; ``model`` is a label, ``pk`` None for any row."""
+        with self._lock:
+            key = (signal, model, pk)
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = set(fields)
+            else:
+                pending.update(fields)
+            if len(self._pending) > self.max_pending:
+                self._collapse()
+            full = len(self._pending) >= self.batch_size
+        if full:
+            if self.flush_interval is None:
+                self.flush()
+            else:
+                self._wake.set()
+        self._start()
+
+    def _collapse(self):
+        # Caller holds the lock.
+        models = collections.OrderedDict((key[1], None) for key in self._pending)
+        self.stats['collapsed'] += len(self._pending)
+        self._pending = collections.OrderedDict(
+            ((None, model, None), set()) for model in models)
+
+    def record_signal(self, sender, kwargs):
+        """Publish one model signal, straight from a receiver, after commit."""
+        signal = signal_name(kwargs.get('signal'))
+        if 'relation' in kwargs:
+            # related_changed's sender is the relation field's model, which
+            # for a reverse relation isn't the model of ``instance``.
+            label = _label(kwargs['instance']._meta.concrete_model)
+        else:
+            label = _label(sender)
+        if 'pks' in kwargs:
+            fields = kwargs.get('update_fields') or ()
+            # Unknown pks (bulk creates on some backends): any row may have changed.
+            pks = kwargs['pks'] if kwargs['pks'] is not None else [None]
+            events = [(signal, label, pk, fields) for pk in pks]
+        else:
+            if 'relation' in kwargs:
+                fields = (kwargs['relation'],)
+            elif kwargs.get('update_fields') is not None:
+                fields = kwargs['update_fields']
+            elif signal == 'post_save':
+                fields = getattr(kwargs['instance'], 'saved_changes', None) or ()
+            else:
+                fields = ()
+            events = [(signal, label, kwargs['instance'].pk, fields)]
+
+        def publish():
+            for event in events:
+                self.publish(*event)
+        using = kwargs.get('using')
+        if (using is not None and connections[using].in_atomic_block and
+                hasattr(transaction, 'on_commit')):
+            transaction.on_commit(publish, using=using)
+        else:
+            publish()
+
+    def _start(self):
+        if self.flush_interval is None or self._thread is not None or self._closed:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='exapp-bus')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Keep flushing; the lost batch shows up as a gap downstream.
+                logger.exception("exapp bus: flush failed")
+
+    def flush(self):
+        with self._send_lock:
+            with self._lock:
+                pending, self._pending = self._pending, collections.OrderedDict()
+            events = [[signal, model, pk, sorted(fields)]
+                      for (signal, model, pk), fields in pending.items()]
+            for start in range(0, len(events), self.batch_size):
+                self._send(events[start:start + self.batch_size])
+
+    def _send(self, events):
+        # Caller holds _send_lock.  A batch that can't be sent still uses up
+        # its number, so subscribers see the gap and assume anything changed.
+        payload = _encode(self.origin, self._seq + 1, events)
+        if len(payload) > self.transport.max_payload and len(events) > 1:
+            half = len(events) // 2
+            self._send(events[:half])
+            self._send(events[half:])
+            return
+        self._seq += 1
+        if len(payload) > self.transport.max_payload:
+            logger.warning("exapp bus: dropped an event of %d bytes (max_payload %d): %s",
+                           len(payload), self.transport.max_payload, events[0][:3])
+            self.stats['oversized'] += 1
+            return
+        try:
+            self.stats['dropped'] += self.transport.send(payload)
+        except EnvironmentError:
+            logger.exception("exapp bus: dropped a batch of %d events", len(events))
+            self.stats['errors'] += 1
+            return
+        self.stats['batches'] += 1
+        self.stats['events'] += len(events)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+class Subscriber(object):
+    """
+    Receives batches from ``transport`` and sends ``remote_signal`` for
+    their events, skipping those published with origin ``ignore``.
+    """
+
+    def __init__(self, transport, ignore=None):
+        self.endpoint = transport.bind()
+        self.ignore = ignore
+        self._last_seq = {}
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def _decode(self, payload):
+        batch = json.loads(payload.decode('utf-8'))
+        origin, seq = batch['o'], batch['s']
+        if origin == self.ignore:
+            return []
+        events = []
+        last = self._last_seq.get(origin)
+        if last is not None and seq != last + 1:
+            events.append(RemoteEvent(origin, None, None, None, ()))
+        self._last_seq[origin] = seq
+        for signal, model, pk, fields in batch['e']:
+            events.append(RemoteEvent(origin, signal, model, pk, tuple(fields)))
+        return events
+
+    def dispatch(self, event):
+        from django.apps import apps
+        sender = None
+        if event.model is not None:
+            try:
+                sender = apps.get_model(event.model)
+            except LookupError:
+                return
+        remote_signal.send(sender=sender, event=event.signal, pk=event.pk,
+                           fields=event.fields, origin=event.origin)
+
+    def poll(self, timeout=0, max_batches=100):
+        """
+        Dispatch the batches waiting (waiting up to ``timeout`` for the
+        first); returns their events.
+        """
+        events = []
+        payload = self.endpoint.receive(timeout)
+        while payload is not None:
+            for event in self._decode(payload):
+                self.dispatch(event)
+                events.append(event)
+            max_batches -= 1
+            if not max_batches:
+                break
+            payload = self.endpoint.receive(0)
+        return events
+
+    def start(self, timeout=0.5):
+        """Poll on a daemon thread until ``stop()``."""
+        def run():
+            while not self._stopped.is_set():
+                self.poll(timeout)
+        self._thread = threading.Thread(target=run, name='exapp-bus-subscriber')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.endpoint.close()
+
+
+broadcaster = None
+subscriber = None
+
+
+def _published_signals():
+    from django.db.models import signals as model_signals
+    from . import signals as exapp_signals
+    return (model_signals.post_save, model_signals.post_delete,
+            exapp_signals.post_bulk_save, exapp_signals.post_bulk_delete,
+            exapp_signals.related_changed)
+
+
+def connect(broadcaster, models):
+    """Publish the events of ``models`` through ``broadcaster``."""
+    def bus_receiver(sender, **kwargs):
+        broadcaster.record_signal(sender, kwargs)
+    for model in models:
+        for signal in _published_signals():
+            signal.connect(bus_receiver, sender=model, weak=False,
+                           dispatch_uid='exapp.bus.%s' % broadcaster.origin)
+
+
+def disconnect(broadcaster, models):
+    for model in models:
+        for signal in _published_signals():
+            signal.disconnect(sender=model, dispatch_uid='exapp.bus.%s' % broadcaster.origin)
+
+
+def configure():
+    """Apply the ``SIGNAL_BUS`` setting; called from ``AppConfig.ready``."""
+    global broadcaster, subscriber
+    options = getattr(settings, 'SIGNAL_BUS', None)
+    if not options or broadcaster is not None:
+        return broadcaster
+    from django.apps import apps
+    from .models import INTERNAL_MODELS
+
+    options = dict(options)
+    transport = options.pop('transport')
+    if isinstance(transport, six.string_types):
+        transport = import_string(transport)(**options.pop('transport_options', {}))
+    subscribe = options.pop('subscribe', True)
+    broadcaster = Broadcaster(transport, **options)
+    connect(broadcaster, [m for m in apps.get_app_config('exapp').get_models()
+                          if m not in INTERNAL_MODELS])
+    atexit.register(broadcaster.close)
+    if subscribe:
+        subscriber = Subscriber(transport, ignore=broadcaster.origin).start()
+    return broadcaster
@@ -0,0 +1,109 @@
+"""
+Coalescing repeated saves of the same row into one post_save.
+
+    with coalesce_saves():
+        company.customers = [customer2]
+        company.save()
+        company.save()
+
+Inside the block every post_save receiver call is held back and merged per
+(model, pk): the single event delivered when the block exits carries the
+most recent instance, ``created=True`` if any of the saves created the row,
+and the union of their ``update_fields`` (None if any save was a full
+save).  Receiver work then scales with the number of distinct rows saved
+rather than the number of ``save()`` calls.  pre_save is not affected.
+
+Unlike ``deferred_signals()`` this does not open a transaction.  If the
+block raises, the events it held are dropped, as the work they describe
+is presumably being abandoned or rolled back; wrap the block in
+``transaction.atomic()`` to make sure the saves are undone too.  Nested
+blocks deliver when the outermost one exits.
+"""
+import functools
+import threading
+
+from django.db.models.signals import post_save
+
+from . import dispatch
+from .deferred import DeferredEvent, DeferredQueue
+
+
+_state = threading.local()
+_lock = threading.Lock()
+_active_blocks = [0]
+
+
+def _stack():
+    try:
+        return _state.stack
+    except AttributeError:
+        stack = _state.stack = []
+        return stack
+
+
+class CoalescedSave(DeferredEvent):
+
+    __slots__ = ()
+
+    def merge(self, kwargs):
+        old_fields = self.kwargs.get('update_fields')
+        new_fields = kwargs.get('update_fields')
+        super(CoalescedSave, self).merge(kwargs)
+        if old_fields is None or new_fields is None:
+            kwargs['update_fields'] = None
+        else:
+            kwargs['update_fields'] = frozenset(old_fields) | frozenset(new_fields)
+
+
+class SaveQueue(DeferredQueue):
+
+    event_class = CoalescedSave
+
+
+def _hold(signal, sender, receiver):
+    stack = _stack()
+    if not stack:
+        return receiver
+    queue = stack[-1]
+
+    def held(**kwargs):
+        kwargs.pop('sender', None)
+        queue.add(receiver, signal, sender, kwargs)
+    return held
+
+
+class coalesce_saves(object):
+    """
+    Context manager (and decorator) merging post_save per (model, pk) and
+    delivering the merged events on a clean exit.  Yields the ``SaveQueue``.
+    """
+
+    def __enter__(self):
+        with _lock:
+            if not _active_blocks[0]:
+                dispatch.add_wrapper(post_save, _hold)
+            _active_blocks[0] += 1
+        self.queue = SaveQueue()
+        _stack().append(self.queue)
+        return self.queue
+
+    def __exit__(self, exc_type, exc_value, tb):
+        stack = _stack()
+        stack.pop()
+        with _lock:
+            _active_blocks[0] -= 1
+            if not _active_blocks[0]:
+                dispatch.remove_wrapper(post_save, _hold)
+        if exc_type is not None:
+            return
+        if stack:
+            stack[-1].extend(self.queue)
+        else:
+            self.queue.flush()
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            with self.__class__():
+                return func(*args, **kwargs)
+        return inner
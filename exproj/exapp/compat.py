@@ -0,0 +1,22 @@
+"""
+Helpers papering over differences between the supported Django versions.
+"""
+
+
+def remote_field(field):
+    # ``remote_field`` replaced ``rel`` in Django 1.9.
+    return getattr(field, 'remote_field', None) or field.rel
+
+
+try:
+    from django.db.models import prefetch_related_objects as _prefetch_related_objects
+except ImportError:  # Django < 1.10
+    from django.db.models.query import prefetch_related_objects as _prefetch_lookup_list
+
+    def _prefetch_related_objects(instances, *lookups):
+        _prefetch_lookup_list(instances, list(lookups))
+
+
+def prefetch_related_objects(instances, *lookups):
+    # Public, with varargs lookups, since 1.10; a lookup list before that.
+    _prefetch_related_objects(list(instances), *lookups)
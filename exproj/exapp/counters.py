@@ -0,0 +1,332 @@
+"""
+Relation counts kept in a table and maintained from signals.
+
+    counts = RelationCounts(['exapp.Company.customers']).connect()
+    counts.get(company, 'customers')        # no COUNT(*)
+
+Each counted accessor (a reverse foreign key or either side of a
+many-to-many) has one ``RelationCount`` row per owning object.  Rows are
+adjusted with ``F()`` updates in the writer's transaction:
+
+* ``related_changed`` from either side of the relation, which covers
+  foreign key reassignment, ``add``/``remove``/``clear``/``set``, direct
+  M2M changes, ``through`` rows saved or deleted and deletes of related
+  rows;
+* ``bulk_create_with_signals()`` and ``update_with_signals()`` of the
+  related model, which send no ``related_changed``; updates that move
+  rows between owners cost a grouped SELECT before and after the UPDATE;
+* deleting an owner removes its rows.
+
+A missing row is created from a real count the first time it is read or
+adjusted.  Changes that send no signals make counts drift; ``manage.py
+recount`` repairs them in bulk.
+
+Set ``SIGNAL_RELATION_COUNTS = {}`` to count ``DEFAULT_RELATIONS`` from
+app-ready time, or list labels under ``relations``.
+"""
+import collections
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F
+from django.db.models import signals as model_signals
+
+from . import relation_signals, signals as exapp_signals, topology
+
+
+DEFAULT_RELATIONS = (
+    'exapp.Company.customers',
+    'exapp.CustomerCategory.customers_direct',
+    'exapp.CustomerCategory.customers_indirect',
+)
+
+CHUNK_SIZE = 500
+
+
+def _chunks(seq, size=CHUNK_SIZE):
+    for start in range(0, len(seq), size):
+        yield seq[start:start + size]
+
+
+def _count_model():
+    from .models import RelationCount
+    return RelationCount
+
+
+def _label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name)
+
+
+class CountedRelation(object):
+    """``owner.accessor``, counted; ``other`` is (model, name) of the far side."""
+
+    def __init__(self, owner, accessor):
+        self.owner = owner
+        self.accessor = accessor
+        self.label = '%s.%s' % (_label(owner), accessor)
+        relation = topology.get_topology().get(owner, accessor)
+        if relation is None or not relation.to_many:
+            raise ValueError("%s is not a relation." % self.label)
+        self.other = (relation.related_model, relation.reverse_name)
+        self.fk = None
+        if relation.reverse:
+            self.query_name = relation.field.related_query_name()
+            if relation.kind == topology.FK:
+                self.fk = relation.field
+        else:
+            self.query_name = relation.name
+        if self.fk is None:
+            spec = relation_signals.spec_for(owner, accessor)
+        else:
+            spec = relation_signals.spec_for(self.fk.model, self.fk.name)
+        if spec is None:
+            raise ValueError("%s is not tracked by relation_signals." % self.label)
+        self.sender = spec.sender
+
+    def counter_rows(self, using):
+        return _count_model().objects.using(using).filter(
+            model=_label(self.owner), relation=self.accessor)
+
+    def actual(self, pks, using):
+        """Real counts for the owners with ``pks``, by str(pk)."""
+        qs = self.owner._base_manager.using(using).filter(pk__in=pks).annotate(
+            n=Count(self.query_name)).values_list('pk', 'n')
+        return dict((str(pk), n) for pk, n in qs)
+
+
+class RelationCounts(object):
+
+    def __init__(self, relations=DEFAULT_RELATIONS):
+        from django.apps import apps
+        self.relations = {}
+        for label in relations:
+            app_model, accessor = label.rsplit('.', 1)
+            relation = CountedRelation(apps.get_model(app_model), accessor)
+            self.relations[(relation.owner, accessor)] = relation
+        self._by_other = dict((r.other, r) for r in self.relations.values())
+        self._local = threading.local()
+        self._connected = []
+
+    @property
+    def _uid(self):
+        return 'exapp.counters.%x' % id(self)
+
+    def connect(self):
+        receivers = []
+        for relation in self.relations.values():
+            receivers.extend([
+                (exapp_signals.related_changed, self._related_changed, relation.sender),
+                (model_signals.post_delete, self._owner_deleted, relation.owner),
+                (exapp_signals.post_bulk_delete, self._owners_deleted, relation.owner),
+            ])
+            if relation.fk is not None:
+                receivers.extend([
+                    (exapp_signals.pre_bulk_save, self._pre_bulk_save, relation.fk.model),
+                    (exapp_signals.post_bulk_save, self._post_bulk_save, relation.fk.model),
+                ])
+        for signal, receiver, sender in receivers:
+            signal.connect(receiver, sender=sender, weak=False, dispatch_uid=self._uid)
+            self._connected.append((signal, sender))
+        return self
+
+    def disconnect(self):
+        for signal, sender in self._connected:
+            signal.disconnect(sender=sender, dispatch_uid=self._uid)
+        self._connected = []
+
+    def _relation(self, instance, accessor):
+        try:
+            return self.relations[(instance._meta.concrete_model, accessor)]
+        except KeyError:
+            raise ValueError("%s.%s is not counted." % (type(instance).__name__, accessor))
+
+    # Reads
+
+    def get(self, instance, accessor):
+        return self.get_many([instance], accessor)[instance.pk]
+
+    def get_many(self, instances, accessor):
+        """Counts for ``instances`` (of one model), by pk."""
+        instances = list(instances)
+        if not instances:
+            return {}
+        relation = self._relation(instances[0], accessor)
+        using = router.db_for_read(relation.owner, instance=instances[0])
+        keys = dict((str(obj.pk), obj.pk) for obj in instances)
+        counts = {}
+        for chunk in _chunks(list(keys)):
+            counts.update(relation.counter_rows(using).filter(object_pk__in=chunk)
+                          .values_list('object_pk', 'count'))
+        missing = [key for key in keys if key not in counts]
+        if missing:
+            counts.update(self._initialize(relation, [keys[key] for key in missing], using))
+        return dict((keys[key], counts.get(key, 0)) for key in keys)
+
+    # Writes
+
+    def _initialize(self, relation, pks, using):
+        """Create rows for ``pks`` from real counts; returns the counts."""
+        RelationCount = _count_model()
+        counts = {}
+        for chunk in _chunks(pks):
+            actual = relation.actual(chunk, using)
+            counts.update(actual)
+            rows = [RelationCount(model=_label(relation.owner), relation=relation.accessor,
+                                  object_pk=key, count=n) for key, n in actual.items()]
+            try:
+                with transaction.atomic(using=using):
+                    RelationCount.objects.using(using).bulk_create(rows)
+            except IntegrityError:
+                # Created concurrently, from a count at least as recent.
+                pass
+        return counts
+
+    def adjust(self, relation, deltas, using):
+        """Add ``deltas`` ({owner pk: change}) to ``relation``'s counts."""
+        by_delta = collections.defaultdict(list)
+        for pk, delta in deltas.items():
+            if delta and pk is not None:
+                by_delta[delta].append(pk)
+        for delta, pks in by_delta.items():
+            for chunk in _chunks(pks):
+                keys = [str(pk) for pk in chunk]
+                rows = relation.counter_rows(using).filter(object_pk__in=keys)
+                if rows.update(count=F('count') + delta) == len(keys):
+                    continue
+                existing = set(rows.values_list('object_pk', flat=True))
+                # Counted after the change, so the new row is already current.
+                self._initialize(relation, [pk for pk, key in zip(chunk, keys)
+                                            if key not in existing], using)
+
+    def _related_changed(self, sender, instance, relation, added, removed, previous=None,
+                         using=None, **kwargs):
+        model = instance._meta.concrete_model
+        counted = self.relations.get((model, relation))
+        if counted is not None:
+            deltas = collections.Counter()
+            deltas[instance.pk] += len(added) - len(removed)
+            for old in (previous or {}).values():
+                if old is not None:
+                    deltas[old] -= 1
+            self.adjust(counted, deltas, using)
+        counted = self._by_other.get((model, relation))
+        if counted is not None:
+            deltas = collections.Counter()
+            for pk in added:
+                deltas[pk] += 1
+            for pk in removed:
+                deltas[pk] -= 1
+            self.adjust(counted, deltas, using)
+
+    def _owner_deleted(self, sender, instance, using=None, **kwargs):
+        self._owners_deleted(sender, [instance.pk], using=using)
+
+    def _owners_deleted(self, sender, pks, using=None, **kwargs):
+        model = sender._meta.concrete_model
+        for relation in self.relations.values():
+            if relation.owner is model:
+                for chunk in _chunks([str(pk) for pk in pks]):
+                    relation.counter_rows(using).filter(object_pk__in=chunk).delete()
+
+    def _moved(self, sender, update_fields):
+        model = sender._meta.concrete_model
+        return [r for r in self.relations.values() if r.fk is not None and
+                r.fk.model is model and (r.fk.name in update_fields or
+                                         r.fk.attname in update_fields)]
+
+    def _grouped(self, relation, pks, using):
+        attname = relation.fk.attname
+        return relation.fk.model._base_manager.using(using).filter(pk__in=pks).values(
+            attname).annotate(n=Count('pk')).values_list(attname, 'n')
+
+    def _pre_bulk_save(self, sender, pks=None, created=False, update_fields=None,
+                       using=None, **kwargs):
+        if created or not update_fields:
+            return
+        before = {}
+        for relation in self._moved(sender, update_fields):
+            before[relation] = list(self._grouped(relation, pks, using))
+        self._local.before = before
+
+    def _post_bulk_save(self, sender, instances=None, pks=None, created=False,
+                        update_fields=None, using=None, **kwargs):
+        model = sender._meta.concrete_model
+        if created:
+            for relation in self.relations.values():
+                if relation.fk is not None and relation.fk.model is model:
+                    deltas = collections.Counter(
+                        getattr(obj, relation.fk.attname) for obj in instances)
+                    self.adjust(relation, deltas, using)
+            return
+        before = getattr(self._local, 'before', None)
+        self._local.before = None
+        for relation, groups in (before or {}).items():
+            deltas = collections.Counter()
+            for pk, n in groups:
+                deltas[pk] -= n
+            for pk, n in self._grouped(relation, pks, using):
+                deltas[pk] += n
+            self.adjust(relation, deltas, using)
+
+    # Repair
+
+    def recount(self, relation, using=None, batch_size=CHUNK_SIZE, dry_run=False):
+        """
+        Compare ``relation``'s stored counts with real ones, fixing any
+        difference unless ``dry_run``; returns the number of owners checked, of
+        counts fixed, of rows created and of rows removed for deleted owners.
+        """
+        RelationCount = _count_model()
+        using = using or router.db_for_write(RelationCount)
+        checked = fixed = created = removed = 0
+        last = None
+        owners = relation.owner._base_manager.using(using).order_by('pk')
+        while True:
+            page = owners if last is None else owners.filter(pk__gt=last)
+            pks = list(page.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            last = pks[-1]
+            with transaction.atomic(using=using):
+                actual = relation.actual(pks, using)
+                stored = dict(relation.counter_rows(using).filter(
+                    object_pk__in=list(actual)).values_list('object_pk', 'count'))
+                wrong = collections.defaultdict(list)
+                new = []
+                for key, n in actual.items():
+                    if key not in stored:
+                        new.append(RelationCount(model=_label(relation.owner),
+                                                 relation=relation.accessor,
+                                                 object_pk=key, count=n))
+                    elif stored[key] != n:
+                        wrong[n].append(key)
+                checked += len(actual)
+                fixed += sum(len(keys) for keys in wrong.values())
+                created += len(new)
+                if not dry_run:
+                    for n, keys in wrong.items():
+                        relation.counter_rows(using).filter(object_pk__in=keys).update(count=n)
+                    RelationCount.objects.using(using).bulk_create(new)
+        # Rows of owners that no longer exist.
+        keys = list(relation.counter_rows(using).values_list('object_pk', flat=True))
+        for chunk in _chunks(keys):
+            alive = set(str(pk) for pk in owners.filter(pk__in=chunk).values_list('pk', flat=True))
+            dead = [key for key in chunk if key not in alive]
+            removed += len(dead)
+            if dead and not dry_run:
+                relation.counter_rows(using).filter(object_pk__in=dead).delete()
+        return checked, fixed, created, removed
+
+
+relation_counts = None
+
+
+def configure():
+    """Apply the ``SIGNAL_RELATION_COUNTS`` setting; called from ``AppConfig.ready``."""
+    global relation_counts
+    config = getattr(settings, 'SIGNAL_RELATION_COUNTS', None)
+    if config is None or relation_counts is not None:
+        return relation_counts
+    relation_counts = RelationCounts(config.get('relations', DEFAULT_RELATIONS)).connect()
+    return relation_counts
@@ -0,0 +1,245 @@
+"""
+Transaction-aware deferral of signal receivers.
+
+Receivers connected with ``@deferred_receiver`` behave like ordinary
+receivers, except inside a ``deferred_signals()`` block:
+
+    with deferred_signals():
+        customer.save()
+        customer.save()
+        extra.delete()
+
+There, calls are queued instead of run inline, deduplicated per
+(signal, sender, pk), and delivered in one batch once the block's
+transaction commits.  If the block raises, its transaction is rolled back
+and the queued events are dropped; so are events queued inside an inner
+``transaction.atomic()`` that rolls back to its savepoint.  Repeated saves of one row collapse into
+a single event carrying the most recent instance and ``created=True`` if any
+of the saves created the row.
+
+When the block is nested inside an enclosing transaction, delivery waits for
+the enclosing transaction to commit (``transaction.on_commit``, Django 1.9+).
+Django 1.8 has no commit hook, so there delivery happens when the outermost
+``deferred_signals()`` block exits.
+"""
+import collections
+import functools
+import sys
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import six
+
+from . import dispatch
+from .prefetch import PREFETCH_ATTR, prefetch_for_events
+
+
+_state = threading.local()
+
+
+def _stacks():
+    try:
+        return _state.stacks
+    except AttributeError:
+        stacks = _state.stacks = {}
+        return stacks
+
+
+class DeferredEvent(object):
+    """
+    One pending (signal, sender, pk) with the receivers waiting for it,
+    mapping each unwrapped receiver to the callable to deliver to (the
+    first wrapper built for it, see ``exapp.dispatch``).  ``savepoints``
+    are the savepoints active when it was first queued.
+    """
+
+    __slots__ = ('signal', 'sender', 'kwargs', 'receivers', 'savepoints')
+
+    def __init__(self, signal, sender, kwargs, savepoints=frozenset()):
+        self.signal = signal
+        self.sender = sender
+        self.kwargs = kwargs
+        self.receivers = collections.OrderedDict()
+        self.savepoints = savepoints
+
+    def merge(self, kwargs):
+        created = self.kwargs.get('created') or kwargs.get('created')
+        self.kwargs = kwargs
+        if 'created' in kwargs:
+            kwargs['created'] = created
+
+    def deliver(self):
+        """Call every receiver; returns the ``exc_info`` of those that raised."""
+        kwargs = dict(self.kwargs, signal=self.signal)
+        errors = []
+        for receiver in self.receivers.values():
+            try:
+                receiver(sender=self.sender, **kwargs)
+            except Exception:
+                errors.append(sys.exc_info())
+        return errors
+
+
+def _savepoints(using):
+    return frozenset(sid for sid in connections[using or DEFAULT_DB_ALIAS].savepoint_ids
+                     if sid is not None)
+
+
+class DeferredQueue(object):
+
+    event_class = DeferredEvent
+
+    def __init__(self):
+        self.events = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, receiver, signal, sender, kwargs):
+        instance = kwargs.get('instance')
+        key = (signal, sender, getattr(instance, 'pk', None))
+        kwargs = dict(kwargs)
+        kwargs.pop('signal', None)
+        event = self.events.get(key)
+        if event is None:
+            event = self.events[key] = self.event_class(
+                signal, sender, kwargs, _savepoints(kwargs.get('using')))
+        else:
+            event.merge(kwargs)
+        event.receivers.setdefault(dispatch.unwrap(receiver), receiver)
+
+    def extend(self, other):
+        for key, event in other.events.items():
+            mine = self.events.get(key)
+            if mine is None:
+                self.events[key] = event
+            else:
+                mine.merge(event.kwargs)
+                for key, receiver in event.receivers.items():
+                    mine.receivers.setdefault(key, receiver)
+
+    def discard(self, sid):
+        """Drop the events queued since savepoint ``sid``, which rolled back."""
+        for key in [key for key, event in self.events.items() if sid in event.savepoints]:
+            del self.events[key]
+
+    def flush(self):
+        """
+        Deliver every event.  If receivers raise, the rest still run and the
+        first exception is re-raised afterwards.
+        """
+        events, self.events = self.events, collections.OrderedDict()
+        undo = prefetch_for_events(events.values())
+        errors = []
+        try:
+            for event in events.values():
+                errors.extend(event.deliver())
+        finally:
+            undo()
+        if errors:
+            six.reraise(*errors[0])
+
+
+def _discarding_rollback(connection, using):
+    savepoint_rollback = connection.savepoint_rollback
+
+    def rollback(sid):
+        savepoint_rollback(sid)
+        for queue in _stacks().get(using, ()):
+            queue.discard(sid)
+    return rollback
+
+
+class deferred_signals(object):
+    """
+    Context manager (and decorator) running its body in
+    ``transaction.atomic(using)`` with deferred receivers queued until
+    commit.
+    """
+
+    def __init__(self, using=None):
+        self.using = using or DEFAULT_DB_ALIAS
+
+    def __enter__(self):
+        self.atomic = transaction.atomic(using=self.using)
+        self.atomic.__enter__()
+        self.queue = DeferredQueue()
+        stack = _stacks().setdefault(self.using, [])
+        if not stack:
+            # Drop events whose savepoint rolls back; see DeferredQueue.discard.
+            connection = connections[self.using]
+            self._rollback = connection.__dict__.get('savepoint_rollback')
+            connection.savepoint_rollback = _discarding_rollback(connection, self.using)
+        stack.append(self.queue)
+        return self.queue
+
+    def __exit__(self, exc_type, exc_value, tb):
+        connection = connections[self.using]
+        stack = _stacks()[self.using]
+        stack.pop()
+        if not stack:
+            if self._rollback is None:
+                del connection.savepoint_rollback
+            else:
+                connection.savepoint_rollback = self._rollback
+        # A failed inner atomic(savepoint=False) rolls the block back silently.
+        rolled_back = exc_type is not None or connection.needs_rollback
+        committed = self.atomic.__exit__(exc_type, exc_value, tb)
+        if rolled_back or not self.queue:
+            return committed
+        if stack:
+            stack[-1].extend(self.queue)
+        elif connections[self.using].in_atomic_block and hasattr(transaction, 'on_commit'):
+            transaction.on_commit(self.queue.flush, using=self.using)
+        else:
+            self.queue.flush()
+        return committed
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            with self.__class__(self.using):
+                return func(*args, **kwargs)
+        return inner
+
+
+def current_queue(using=DEFAULT_DB_ALIAS):
+    """The innermost active queue for ``using``, or None."""
+    stack = _stacks().get(using)
+    return stack[-1] if stack else None
+
+
+def _make_proxy(func, signal):
+    @functools.wraps(func)
+    def proxy(sender, **kwargs):
+        queue = current_queue(kwargs.get('using') or DEFAULT_DB_ALIAS)
+        if queue is None:
+            return func(sender=sender, **kwargs)
+        queue.add(func, signal, sender, kwargs)
+    return proxy
+
+
+def deferred_receiver(signal, prefetch=None, **kwargs):
+    """
+    Like ``django.dispatch.receiver``, but calls to the receiver are queued
+    while a ``deferred_signals()`` block is active.  ``prefetch`` lookups
+    are loaded for each delivered batch; see ``exapp.prefetch``.
+
+    Intended for post_save/post_delete style signals whose ``instance``
+    identifies the row.  Note that Django clears ``instance.pk`` once a
+    delete completes, so deferred post_delete receivers see ``pk=None``.
+    """
+    def _decorator(func):
+        signals = signal if isinstance(signal, (list, tuple)) else [signal]
+        proxies = func.__dict__.setdefault('deferred_proxies', [])
+        if prefetch:
+            setattr(func, PREFETCH_ATTR, tuple(prefetch))
+        for s in signals:
+            proxy = _make_proxy(func, s)
+            if prefetch:
+                setattr(proxy, PREFETCH_ATTR, tuple(prefetch))
+            # Keep the proxy alive; signals only hold weak references.
+            proxies.append(proxy)
+            s.connect(proxy, **kwargs)
+        return func
+    return _decorator
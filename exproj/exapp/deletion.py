@@ -0,0 +1,145 @@
+"""
+Deletes that send one batched signal per model instead of one per row.
+
+    plan = DeletePlan(Company.objects.filter(name__startswith='old'))
+    plan.summary()   # -> {'exapp.Company': 3, 'exapp.Customer': 2400, ...}
+    plan.execute()
+
+Django's ``Collector`` builds the cascade graph once, as for an ordinary
+delete.  When the plan runs, each affected model gets a single
+``pre_bulk_delete`` before any row is deleted and a single
+``post_bulk_delete`` afterwards, carrying the pks of all its deleted rows
+(see ``exapp.signals``).  pre_delete/post_delete are only delivered, per
+row, to receivers marked with ``@per_instance_delete``; other
+pre_delete/post_delete receivers are skipped and should listen to the bulk
+signals instead.
+"""
+from operator import attrgetter
+
+from django.db import router, transaction
+from django.db.models import signals, sql
+from django.db.models.deletion import Collector
+from django.utils import six
+
+from . import dispatch
+from .signals import post_bulk_delete, pre_bulk_delete
+
+
+PER_INSTANCE_ATTR = 'per_instance_delete'
+
+
+def per_instance_delete(func):
+    """
+    Mark a pre_delete/post_delete receiver as needing one call per deleted
+    row even when the delete is batched.  Apply before ``@receiver``.
+    """
+    setattr(func, PER_INSTANCE_ATTR, True)
+    return func
+
+
+def _per_instance_receivers(signal, model):
+    receivers = [r for r in dispatch.receivers_for(signal, model)
+                 if getattr(r, PER_INSTANCE_ATTR, False)]
+    return dispatch.wrap_receivers(signal, model, receivers)
+
+
+def _label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name)
+
+
+class BatchedCollector(Collector):
+    """``Collector`` whose ``delete()`` sends batched signals."""
+
+    def _send_per_instance(self, signal, model, instances):
+        receivers = _per_instance_receivers(signal, model)
+        for obj in instances if receivers else ():
+            for receiver in receivers:
+                receiver(signal=signal, sender=model, instance=obj, using=self.using)
+
+    def delete(self):
+        # Mirrors Collector.delete(), minus the per-row signals.
+        for model, instances in self.data.items():
+            self.data[model] = sorted(instances, key=attrgetter('pk'))
+        self.sort()
+        counts = {}
+
+        with transaction.atomic(using=self.using, savepoint=False):
+            for model, instances in six.iteritems(self.data):
+                if not model._meta.auto_created:
+                    pre_bulk_delete.send(sender=model, pks=[obj.pk for obj in instances],
+                                         using=self.using)
+                    self._send_per_instance(signals.pre_delete, model, instances)
+
+            for qs in self.fast_deletes:
+                # None on Django 1.8, which doesn't report counts.
+                count = qs._raw_delete(using=self.using)
+                if count is not None:
+                    label = _label(qs.model)
+                    counts[label] = counts.get(label, 0) + count
+
+            for model, instances_for_fieldvalues in six.iteritems(self.field_updates):
+                for (field, value), instances in six.iteritems(instances_for_fieldvalues):
+                    query = sql.UpdateQuery(model)
+                    query.update_batch([obj.pk for obj in instances],
+                                       {field.name: value}, self.using)
+
+            for instances in six.itervalues(self.data):
+                instances.reverse()
+
+            for model, instances in six.iteritems(self.data):
+                pks = [obj.pk for obj in instances]
+                sql.DeleteQuery(model).delete_batch(pks, self.using)
+                label = _label(model)
+                counts[label] = counts.get(label, 0) + len(pks)
+                if not model._meta.auto_created:
+                    self._send_per_instance(signals.post_delete, model, instances)
+                    post_bulk_delete.send(sender=model, pks=pks, using=self.using)
+
+        for model, instances_for_fieldvalues in six.iteritems(self.field_updates):
+            for (field, value), instances in six.iteritems(instances_for_fieldvalues):
+                for obj in instances:
+                    setattr(obj, field.attname, value)
+        for model, instances in six.iteritems(self.data):
+            for instance in instances:
+                setattr(instance, model._meta.pk.attname, None)
+        return sum(counts.values()), counts
+
+
+class DeletePlan(object):
+    """
+    The cascade of deleting ``objs`` (a queryset, or instances of one
+    model), collected once and executed with batched signals.
+    """
+
+    def __init__(self, objs, using=None):
+        if hasattr(objs, 'model') and hasattr(objs, '_raw_delete'):
+            model = objs.model
+            using = using or objs._db or router.db_for_write(model)
+        else:
+            objs = list(objs)
+            if not objs:
+                raise ValueError("Nothing to delete.")
+            model = type(objs[0])
+            using = using or router.db_for_write(model, instance=objs[0])
+        self.model = model
+        self.using = using
+        self.collector = BatchedCollector(using=using)
+        self.collector.collect(objs)
+        self.executed = False
+
+    def summary(self):
+        """Rows per model label the plan will delete, fast deletes excluded."""
+        return dict((_label(model), len(instances))
+                    for model, instances in self.collector.data.items() if instances)
+
+    def execute(self):
+        """Run the delete; returns (total rows, {model label: rows})."""
+        if self.executed:
+            raise ValueError("This plan has already been executed.")
+        self.executed = True
+        return self.collector.delete()
+
+
+def planned_delete(objs, using=None):
+    """Delete ``objs`` and their cascade with batched signals."""
+    return DeletePlan(objs, using=using).execute()
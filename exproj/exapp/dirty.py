@@ -0,0 +1,134 @@
+"""
+Dirty-field tracking for models whose saves fire expensive receivers.
+
+    class Customer(DirtyFieldsMixin, models.Model):
+        ...
+
+Instances remember the field values they were loaded with (or last saved),
+so ``get_dirty_fields()`` can tell which fields have changed since.  On
+``save()``:
+
+* with ``narrow_update_fields = True`` on the model, an update of a loaded
+  row writes only the fields whose values differ from the snapshot.  They
+  are picked after pre_save, so changes made by pre_save receivers and by
+  field ``pre_save()`` hooks (``auto_now``) are written too, and a row that
+  was deleted meanwhile is inserted again as with a full save.  Receivers
+  still see ``update_fields=None``;
+* with ``skip_unchanged_saves = True`` on the model, or
+  ``save(skip_unchanged=True)``, saving an unchanged row is a no-op: no
+  query and no pre_save/post_save;
+* ``instance.saved_changes`` maps each changed field name to its previous
+  value (None for new rows) while the save's receivers run, so they can
+  skip work that doesn't concern them.  post_save receivers also see the
+  changes made during pre_save.
+
+Unchanged saves still do a full save and fire their signals unless skipping
+is asked for, as existing receivers may rely on them.
+"""
+from django.db import models
+
+
+SNAPSHOT_ATTR = '_dirty_snapshot'
+NARROW_ATTR = '_dirty_narrow'
+
+
+class DirtyFieldsMixin(models.Model):
+
+    narrow_update_fields = False
+    skip_unchanged_saves = False
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(DirtyFieldsMixin, cls).from_db(db, field_names, values)
+        instance._take_dirty_snapshot()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(DirtyFieldsMixin, self).refresh_from_db(*args, **kwargs)
+        self._take_dirty_snapshot()
+
+    def _tracked_fields(self):
+        return [f for f in self._meta.concrete_fields if not f.primary_key]
+
+    def _take_dirty_snapshot(self, fields=None):
+        values = self.__dict__
+        snapshot = values.get(SNAPSHOT_ATTR)
+        if snapshot is None:
+            snapshot = values[SNAPSHOT_ATTR] = {}
+        for field in fields if fields is not None else self._tracked_fields():
+            if field.attname in values:
+                snapshot[field.attname] = values[field.attname]
+
+    def get_dirty_fields(self):
+        """
+        Map of changed field name -> value at load/last save.  Every loaded
+        field is reported for instances that were never loaded or saved.
+        """
+        values = self.__dict__
+        snapshot = values.get(SNAPSHOT_ATTR)
+        dirty = {}
+        for field in self._tracked_fields():
+            attname = field.attname
+            if attname not in values:
+                # Deferred and never assigned.
+                continue
+            if snapshot is None:
+                dirty[field.name] = None
+            elif attname not in snapshot or snapshot[attname] != values[attname]:
+                dirty[field.name] = snapshot.get(attname)
+        return dirty
+
+    def is_dirty(self):
+        return bool(self.get_dirty_fields())
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None,
+             skip_unchanged=None):
+        if skip_unchanged is None:
+            skip_unchanged = self.skip_unchanged_saves
+        dirty = self.get_dirty_fields()
+        tracked = SNAPSHOT_ATTR in self.__dict__ and self.pk is not None and not force_insert
+        narrow = False
+        if tracked and update_fields is None:
+            if not dirty and skip_unchanged:
+                self.saved_changes = {}
+                return
+            narrow = self.narrow_update_fields
+        saved_fields = self._tracked_fields()
+        if update_fields is not None:
+            names = set(update_fields)
+            saved_fields = [f for f in saved_fields if f.name in names or f.attname in names]
+            dirty = dict((f.name, dirty[f.name]) for f in saved_fields if f.name in dirty)
+        self.saved_changes = dirty
+        self.__dict__[NARROW_ATTR] = narrow
+        try:
+            super(DirtyFieldsMixin, self).save(
+                force_insert=force_insert, force_update=force_update, using=using,
+                update_fields=update_fields)
+        finally:
+            del self.__dict__[NARROW_ATTR]
+        self._take_dirty_snapshot(saved_fields)
+    save.alters_data = True
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Runs after pre_save with the values about to be written, so it sees
+        # what receivers and field pre_save() hooks changed.
+        snapshot = self.__dict__.get(SNAPSHOT_ATTR)
+        if snapshot is not None and NARROW_ATTR in self.__dict__:
+            changed = [value for value in values
+                       if value[0].attname not in snapshot
+                       or snapshot[value[0].attname] != value[2]]
+            for field, _, _ in changed:
+                if not field.primary_key:
+                    self.saved_changes.setdefault(field.name, snapshot.get(field.attname))
+            if self.__dict__[NARROW_ATTR]:
+                # With no values left Django checks that the row still exists.
+                values = changed
+        updated = super(DirtyFieldsMixin, self)._do_update(
+            base_qs, using, pk_val, values, update_fields, forced_update)
+        if not updated and NARROW_ATTR in self.__dict__:
+            # The row is gone and will be inserted.
+            self.saved_changes = dict((f.name, None) for f in self._tracked_fields())
+        return updated
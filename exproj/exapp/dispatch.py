@@ -0,0 +1,272 @@
+"""
+Control over how a signal finds and calls its receivers, without touching
+how receivers are connected.
+
+Receiver wrappers pass every receiver a signal calls through a factory:
+
+    def factory(signal, sender, receiver):
+        def wrapped(**kwargs):
+            ...
+            return receiver(**kwargs)
+        return wrapped
+
+    dispatch.add_wrapper(post_save, factory)
+
+Wrappers apply in registration order (the last one added is outermost),
+except that those added with ``innermost=True`` go inside all the others.
+Factories build a new wrapper per send; a wrapper standing in for a
+receiver should name it in ``wrapped_receiver``, so that code queuing
+calls for later can tell them apart by ``unwrap(wrapper)``.
+
+Compiled signals (``compile_signal()``, done for the model and exapp signals
+at app-ready time) look their receivers up in a per-sender table of frozen
+tuples, built on first use, instead of filtering the whole receiver list.
+The table is the signal's own ``sender_receivers_cache``, filled in the
+format Django uses for ``use_caching`` signals, so Django's ``connect()``
+and ``disconnect()`` throw it away and ``send()`` returns early for senders
+with no receivers.  Together with ``has_receivers()``, this lets senders
+skip building kwargs for senders no one listens to.
+
+Either feature shadows the signal's ``_live_receivers`` with an instance
+attribute; once a signal has neither, the attribute is deleted again, so
+such signals dispatch exactly as before.
+"""
+import threading
+import weakref
+
+from django.db.models import signals as model_signals
+from django.dispatch.dispatcher import NO_RECEIVERS, NONE_ID, _make_id
+
+from . import signals as exapp_signals
+
+
+# Signals whose senders are models; compiled at app-ready time unless the
+# SIGNAL_COMPILED_RECEIVERS setting is False.
+MODEL_SIGNALS = (
+    model_signals.pre_init,
+    model_signals.post_init,
+    model_signals.pre_save,
+    model_signals.post_save,
+    model_signals.pre_delete,
+    model_signals.post_delete,
+    model_signals.m2m_changed,
+    exapp_signals.pre_bulk_related_save,
+    exapp_signals.post_bulk_related_save,
+    exapp_signals.related_changed,
+    exapp_signals.pre_bulk_save,
+    exapp_signals.post_bulk_save,
+    exapp_signals.pre_bulk_delete,
+    exapp_signals.post_bulk_delete,
+    exapp_signals.remote_signal,
+)
+
+WRAPPED_ATTR = 'wrapped_receiver'
+
+_lock = threading.RLock()
+_wrappers = {}
+_compiled = {}
+
+
+class _StrongRefs(tuple):
+    """Cached receivers that can be returned as they are."""
+
+
+class _WeakRefs(tuple):
+    """Cached receivers including weak references to resolve on lookup."""
+
+
+class CompiledReceivers(object):
+    """
+    Frozen per-sender receiver tuples for one signal, kept in its
+    ``sender_receivers_cache``.  Entries hold their sender unless the signal
+    was created with ``use_caching=True``, so this is meant for signals sent
+    by long-lived objects such as model classes.
+    """
+
+    def __init__(self, signal):
+        self.signal = signal
+
+    def invalidate(self):
+        self.signal.sender_receivers_cache.clear()
+
+    def _build(self, sender):
+        signal = self.signal
+        with signal.lock:
+            signal._clear_dead_receivers()
+            senderkey = _make_id(sender)
+            refs = [receiver for (_, r_senderkey), receiver in signal.receivers
+                    if r_senderkey == NONE_ID or r_senderkey == senderkey]
+        if any(isinstance(ref, weakref.ReferenceType) for ref in refs):
+            return _WeakRefs(refs)
+        return _StrongRefs(refs)
+
+    def lookup(self, sender):
+        """The live receivers for ``sender``, as a tuple."""
+        signal = self.signal
+        cache = signal.sender_receivers_cache
+        if signal._dead_receivers:
+            cache.clear()
+        try:
+            refs = cache.get(sender)
+        except TypeError:
+            # A use_caching signal's WeakKeyDictionary can't hold None.
+            refs = cache = None
+        if refs is NO_RECEIVERS:
+            return ()
+        if refs is None or not isinstance(refs, (_StrongRefs, _WeakRefs)):
+            refs = self._build(sender)
+            if cache is not None:
+                cache[sender] = refs or NO_RECEIVERS
+        if isinstance(refs, _StrongRefs):
+            return refs
+        live = []
+        for ref in refs:
+            if isinstance(ref, weakref.ReferenceType):
+                ref = ref()
+                if ref is None:
+                    continue
+            live.append(ref)
+        return tuple(live)
+
+
+def receivers_for(signal, sender):
+    """``signal``'s live receivers for ``sender``, unwrapped."""
+    compiled = _compiled.get(signal)
+    if compiled is not None:
+        return compiled.lookup(sender)
+    return type(signal)._live_receivers(signal, sender)
+
+
+def has_receivers(signal, sender=None):
+    """
+    Whether sending ``signal`` from ``sender`` would call anything; cheap
+    for compiled signals.
+    """
+    if not signal.receivers:
+        return False
+    return bool(receivers_for(signal, sender))
+
+
+def wrap_receivers(signal, sender, receivers):
+    """
+    Pass ``receivers`` through ``signal``'s wrappers, for code that calls
+    some of a signal's receivers itself rather than through ``send()``.
+    """
+    factories = _wrappers.get(signal)
+    if not factories:
+        return receivers
+    wrapped = []
+    for receiver in receivers:
+        for factory in factories:
+            receiver = factory(signal, sender, receiver)
+        wrapped.append(receiver)
+    return wrapped
+
+
+def _live_receivers_for(signal):
+    def _live_receivers(sender):
+        return wrap_receivers(signal, sender, receivers_for(signal, sender))
+    return _live_receivers
+
+
+def _update(signal):
+    # Caller holds _lock.
+    if signal in _wrappers or signal in _compiled:
+        if '_live_receivers' not in signal.__dict__:
+            signal._live_receivers = _live_receivers_for(signal)
+    else:
+        signal.__dict__.pop('_live_receivers', None)
+
+
+def receiver_label(receiver):
+    """
+    Dotted name for a receiver, seeing through dispatch wrappers and
+    ``functools.wraps`` proxies.
+    """
+    func = unwrap(receiver)
+    func = getattr(func, '__func__', func)
+    module = getattr(func, '__module__', None)
+    name = getattr(func, '__qualname__', None) or getattr(func, '__name__', None)
+    if name is None:
+        name = type(receiver).__name__
+    return '%s.%s' % (module, name) if module else name
+
+
+def unwrap(receiver):
+    """The receiver behind the dispatch wrappers built around ``receiver``."""
+    wrapped = getattr(receiver, WRAPPED_ATTR, None)
+    while wrapped is not None:
+        receiver = wrapped
+        wrapped = getattr(receiver, WRAPPED_ATTR, None)
+    return receiver
+
+
+def sender_label(sender):
+    if sender is None:
+        return None
+    meta = getattr(sender, '_meta', None)
+    if meta is not None:
+        return '%s.%s' % (meta.app_label, meta.object_name)
+    return getattr(sender, '__name__', None) or repr(sender)
+
+
+def add_wrapper(signal, factory, innermost=False):
+    """Pass every receiver ``signal`` calls through ``factory(signal, sender, receiver)``."""
+    with _lock:
+        factories = _wrappers.get(signal, ())
+        if factory in factories:
+            return
+        if innermost:
+            _wrappers[signal] = (factory,) + factories
+        else:
+            _wrappers[signal] = factories + (factory,)
+        _update(signal)
+
+
+def remove_wrapper(signal, factory):
+    with _lock:
+        factories = tuple(f for f in _wrappers.get(signal, ()) if f != factory)
+        if factories:
+            _wrappers[signal] = factories
+        else:
+            _wrappers.pop(signal, None)
+        _update(signal)
+
+
+def is_wrapped(signal):
+    return signal in _wrappers
+
+
+def compile_signal(signal, senders=()):
+    """
+    Look ``signal``'s receivers up in a compiled table from now on,
+    prebuilding the entries for ``senders``.
+    """
+    with _lock:
+        compiled = _compiled.get(signal)
+        if compiled is None:
+            compiled = _compiled[signal] = CompiledReceivers(signal)
+            compiled.invalidate()
+            _update(signal)
+    for sender in senders:
+        compiled.lookup(sender)
+    return compiled
+
+
+def invalidate(signal):
+    """Drop compiled lookups after changing ``signal.receivers`` directly."""
+    compiled = _compiled.get(signal)
+    if compiled is not None:
+        compiled.invalidate()
+
+
+def decompile_signal(signal):
+    with _lock:
+        compiled = _compiled.pop(signal, None)
+        if compiled is not None:
+            compiled.invalidate()
+            _update(signal)
+
+
+def is_compiled(signal):
+    return signal in _compiled
@@ -0,0 +1,180 @@
+"""
+Compact, reusable event objects for receivers on hot signals.
+
+    @event_receiver(pre_save, sender=Customer)
+    def customer_saving(event):
+        event.instance, event.pk, event.name    # ..., 42, 'pre_save'
+
+An ``event_receiver`` is called with one ``SignalEvent`` instead of
+``sender, **kwargs``.  Events have ``__slots__`` and work out the signal's
+name, the sender's label and the instance's pk only when first asked.  They
+also answer ``event['using']``, ``event.get('raw')`` and ``in`` like the
+kwargs dict, so helpers written for kwargs, such as
+``SignalLog.record_signal``, accept them.
+
+Once the receiver returns, an event nothing else refers to is cleared and
+handed to the next send; one the receiver kept (or that is part of a
+traceback) is left alone.  Reuse relies on ``sys.getrefcount`` and is off
+where that doesn't exist.
+"""
+import functools
+import sys
+
+from .dispatch import sender_label
+from .recording import signal_name
+
+
+POOL_SIZE = 32
+
+_UNSET = object()
+
+
+def _refs(obj):
+    return sys.getrefcount(obj)
+
+
+def _unshared_refs():
+    # The count _refs() sees for an object held by one local variable.
+    obj = object()
+    return _refs(obj)
+
+
+_UNSHARED = _unshared_refs() if hasattr(sys, 'getrefcount') else None
+
+
+class SignalEvent(object):
+    """One send of a signal to an ``event_receiver``."""
+
+    __slots__ = ('sender', 'kwargs', '_pk', '_name', '_label')
+
+    def __init__(self, sender, kwargs):
+        self.reset(sender, kwargs)
+
+    def reset(self, sender, kwargs):
+        self.sender = sender
+        self.kwargs = kwargs
+        self._pk = self._name = self._label = _UNSET
+
+    @property
+    def signal(self):
+        return self.kwargs.get('signal')
+
+    @property
+    def instance(self):
+        return self.kwargs.get('instance')
+
+    @property
+    def created(self):
+        return self.kwargs.get('created', False)
+
+    @property
+    def raw(self):
+        return self.kwargs.get('raw', False)
+
+    @property
+    def using(self):
+        return self.kwargs.get('using')
+
+    @property
+    def update_fields(self):
+        return self.kwargs.get('update_fields')
+
+    @property
+    def pk(self):
+        if self._pk is _UNSET:
+            instance = self.instance
+            self._pk = None if instance is None else instance.pk
+        return self._pk
+
+    @property
+    def name(self):
+        """The signal's name, eg. 'pre_save'."""
+        if self._name is _UNSET:
+            self._name = signal_name(self.signal)
+        return self._name
+
+    @property
+    def label(self):
+        """The sender's label, eg. 'exapp.Customer'."""
+        if self._label is _UNSET:
+            self._label = sender_label(self.sender)
+        return self._label
+
+    # The kwargs dict's read-only interface.
+
+    def __getitem__(self, key):
+        if key == 'sender':
+            return self.sender
+        return self.kwargs[key]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key == 'sender' or key in self.kwargs
+
+    def keys(self):
+        return ['sender'] + list(self.kwargs)
+
+    def __repr__(self):
+        return '<SignalEvent %s %s pk=%r>' % (self.name, self.label, self.pk)
+
+
+class EventPool(object):
+    """Free ``SignalEvent``s, at most ``size`` of them."""
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self._free = []
+
+    def acquire(self, sender, kwargs):
+        try:
+            event = self._free.pop()
+        except IndexError:
+            return SignalEvent(sender, kwargs)
+        event.reset(sender, kwargs)
+        return event
+
+    def release(self, event):
+        """Take back ``event``, which the caller must know to be unshared."""
+        event.reset(None, None)
+        if len(self._free) < self.size:
+            self._free.append(event)
+
+    def __len__(self):
+        return len(self._free)
+
+
+pool = EventPool()
+
+
+def _adapter(func):
+    @functools.wraps(func)
+    def adapter(sender, **kwargs):
+        event = pool.acquire(sender, kwargs)
+        try:
+            return func(event)
+        finally:
+            if _UNSHARED is not None and _refs(event) <= _UNSHARED:
+                pool.release(event)
+    # Django checks receivers accept **kwargs, following __wrapped__ to func.
+    adapter.__dict__.pop('__wrapped__', None)
+    return adapter
+
+
+def event_receiver(signal, **kwargs):
+    """
+    Like ``django.dispatch.receiver``, for receivers taking one
+    ``SignalEvent``.  The function is returned unchanged; what is connected
+    is an adapter, kept alive as ``func.event_adapter``.
+    """
+    def _decorator(func):
+        signals = signal if isinstance(signal, (list, tuple)) else [signal]
+        adapter = func.event_adapter = _adapter(func)
+        for s in signals:
+            s.connect(adapter, **kwargs)
+        return func
+    return _decorator
@@ -0,0 +1,180 @@
+"""
+Running slow receivers off the request thread.
+
+    @async_receiver(post_save, sender=Customer)
+    def notify_crm(sender, instance, **kwargs):
+        ...
+
+The decorated receiver is submitted to a bounded ``ReceiverPool`` instead of
+being called inline.  Calls for the same (sender, pk) always go to the same
+single-worker stripe, so they run in the order the signals were sent.  When
+``max_pending`` calls are queued, the sending thread blocks until one
+finishes.  Exceptions are captured rather than lost, and ``drain()`` waits
+for everything queued so far, which lets tests assert on receiver side
+effects deterministically.
+
+Process pools need the receiver to be importable at module level and its
+arguments picklable; the ``signal`` kwarg is not passed to them.  The
+default pool is configured by the ``SIGNAL_EXECUTOR`` setting, eg.
+``{'kind': 'thread', 'max_workers': 4, 'max_pending': 1000}``.
+"""
+import collections
+import functools
+import threading
+import traceback
+
+from concurrent import futures
+from django.conf import settings
+from django.db import close_old_connections
+
+DEFAULT_OPTIONS = {'kind': 'thread', 'max_workers': 4, 'max_pending': 1000}
+
+ReceiverError = collections.namedtuple(
+    'ReceiverError', ['receiver', 'sender', 'pk', 'exception', 'traceback'])
+
+
+def _run_in_thread(receiver, sender, kwargs):
+    try:
+        return receiver(sender=sender, **kwargs)
+    except Exception as e:
+        e.formatted_traceback = traceback.format_exc()
+        raise
+    finally:
+        close_old_connections()
+
+
+def _run_in_process(receiver, sender, kwargs):
+    try:
+        return receiver(sender=sender, **kwargs)
+    except Exception:
+        # Tracebacks don't survive pickling; send the formatted one back.
+        raise RuntimeError(traceback.format_exc())
+
+
+class ReceiverPool(object):
+    """
+    ``max_workers`` single-worker executors ("stripes") of the given kind,
+    with at most ``max_pending`` submitted but unfinished calls.
+    """
+
+    def __init__(self, kind='thread', max_workers=4, max_pending=1000):
+        if kind == 'thread':
+            executor_class, self._runner = futures.ThreadPoolExecutor, _run_in_thread
+        elif kind == 'process':
+            executor_class, self._runner = futures.ProcessPoolExecutor, _run_in_process
+        else:
+            raise ValueError("kind must be 'thread' or 'process', got %r" % kind)
+        self.kind = kind
+        self._stripes = [executor_class(max_workers=1) for _ in range(max_workers)]
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.errors = []
+
+    def submit(self, receiver, sender, kwargs, key=None):
+        """Queue ``receiver(sender=sender, **kwargs)``; blocks while full."""
+        stripe = self._stripes[hash(key) % len(self._stripes)]
+        self._slots.acquire()
+        try:
+            future = stripe.submit(self._runner, receiver, sender, kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        pk = key[1] if isinstance(key, tuple) else key
+        future.add_done_callback(functools.partial(self._done, receiver, sender, pk))
+        return future
+
+    def _done(self, receiver, sender, pk, future):
+        # Record the error before the future leaves _pending, so drain()
+        # never sees a finished call without its error.
+        with self._lock:
+            if not future.cancelled():
+                exc = future.exception()
+                if exc is not None:
+                    if self.kind == 'thread':
+                        tb = getattr(exc, 'formatted_traceback', None)
+                    else:
+                        tb = exc.args[0] if exc.args else None
+                    self.errors.append(ReceiverError(receiver, sender, pk, exc, tb))
+            self._pending.discard(future)
+        self._slots.release()
+
+    def drain(self, timeout=None, raise_errors=False):
+        """
+        Wait until every call submitted so far has finished, then return and
+        clear the captured errors.  With ``raise_errors``, re-raise the first
+        captured exception instead.
+        """
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            done, not_done = futures.wait(pending, timeout=timeout)
+            if not_done:
+                raise futures.TimeoutError(
+                    "%d receiver calls still pending" % len(not_done))
+        with self._lock:
+            errors, self.errors = self.errors, []
+        if raise_errors and errors:
+            raise errors[0].exception
+        return errors
+
+    def shutdown(self, wait=True):
+        for stripe in self._stripes:
+            stripe.shutdown(wait=wait)
+        if self in _pools:
+            _pools.remove(self)
+
+
+_pools = []
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_default_pool():
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            options = dict(DEFAULT_OPTIONS, **getattr(settings, 'SIGNAL_EXECUTOR', {}))
+            _default_pool = ReceiverPool(**options)
+            _pools.append(_default_pool)
+        return _default_pool
+
+
+def drain_all(timeout=None, raise_errors=False):
+    """Drain every pool used by ``async_receiver`` so far."""
+    errors = []
+    for pool in list(_pools):
+        errors.extend(pool.drain(timeout=timeout, raise_errors=raise_errors))
+    return errors
+
+
+def async_receiver(signal, pool=None, **kwargs):
+    """
+    Like ``django.dispatch.receiver``, but the receiver runs on ``pool``
+    (default: ``get_default_pool()``).
+    """
+    if pool is not None and pool not in _pools:
+        _pools.append(pool)
+
+    def _decorator(func):
+        def proxy(sender, **signal_kwargs):
+            target = pool or get_default_pool()
+            if target.kind == 'process':
+                signal_kwargs.pop('signal', None)
+            instance = signal_kwargs.get('instance')
+            key = (sender, getattr(instance, 'pk', None))
+            target.submit(func, sender, signal_kwargs, key=key)
+        functools.update_wrapper(proxy, func)
+
+        signals = signal if isinstance(signal, (list, tuple)) else [signal]
+        proxies = func.__dict__.setdefault('async_proxies', [])
+        for s in signals:
+            # Keep the proxy alive; signals only hold weak references.
+            proxies.append(proxy)
+            s.connect(proxy, **kwargs)
+        return func
+    return _decorator
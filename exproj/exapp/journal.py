@@ -0,0 +1,381 @@
+"""
+Append-only on-disk journal of signal events, for offline analysis.
+
+    journal = Journal('/var/log/exapp/journal')
+    journal.record_signal(None, sender, kwargs)    # in a receiver, like SignalLog
+
+    reader = JournalReader('/var/log/exapp/journal')
+    reader.count(model='exapp.Customer', signal='related_changed',
+                 since=start_of_day)
+
+Each event is one fixed-width little-endian record (see ``RECORD``):
+signal id, model id, flags (created, no pk), timestamp, pk and a bitmask
+of the changed fields.  Ids and field bits refer to a JSON sidecar next to each
+segment, so a segment is self-describing and several processes can write
+to one directory, each to its own segments.  Records are buffered and
+written in groups of ``flush_records``, or when ``flush_interval`` seconds
+have passed since the last flush; segments are closed once they reach
+``segment_bytes``.
+
+``JournalReader`` maps segments with ``mmap`` and filters on the raw
+records, building Python objects only for matches; ``count()`` and
+``count_by()`` build none.  Records of a segment are in time order, so
+``since``/``until`` are found by binary search.
+
+Set ``SIGNAL_JOURNAL = {'directory': ...}`` (plus any ``Journal`` options)
+to journal post_save, post_delete, the batched save/delete signals and
+``related_changed`` for the exapp models.
+"""
+import atexit
+import collections
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.utils import six
+
+from .recording import signal_name
+
+
+# signal id, model id, flags, padding, timestamp, pk, changed-field bits
+RECORD = struct.Struct('<HHB3xdqQ')
+_HEADER = struct.Struct('<HHB')
+_TIMESTAMP = struct.Struct('<d')
+
+FLAG_CREATED = 1
+FLAG_NO_PK = 2
+MAX_FIELDS = 64
+
+SEGMENT_SUFFIX = '.journal'
+META_SUFFIX = '.json'
+
+JournalEvent = collections.namedtuple(
+    'JournalEvent', ['timestamp', 'signal', 'model', 'pk', 'created', 'fields'])
+
+
+def _write_json(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.journal')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f, sort_keys=True)
+    os.rename(tmp, path)
+
+
+class _SegmentMeta(object):
+    """Name <-> id tables for one segment."""
+
+    def __init__(self, signals=(), models=(), fields=None):
+        self.signals = list(signals)
+        self.models = list(models)
+        self.fields = dict((label, list(names)) for label, names in (fields or {}).items())
+        self._signal_ids = dict((name, i) for i, name in enumerate(self.signals))
+        self._model_ids = dict((label, i) for i, label in enumerate(self.models))
+
+    def signal_id(self, name):
+        try:
+            return self._signal_ids[name], False
+        except KeyError:
+            self.signals.append(name)
+            self._signal_ids[name] = len(self.signals) - 1
+            return len(self.signals) - 1, True
+
+    def model_id(self, label):
+        try:
+            return self._model_ids[label], False
+        except KeyError:
+            self.models.append(label)
+            self._model_ids[label] = len(self.models) - 1
+            self.fields[label] = []
+            return len(self.models) - 1, True
+
+    def field_bits(self, label, names):
+        known = self.fields[label]
+        bits, changed = 0, False
+        for name in names:
+            try:
+                index = known.index(name)
+            except ValueError:
+                if len(known) >= MAX_FIELDS:
+                    continue
+                known.append(name)
+                index, changed = len(known) - 1, True
+            bits |= 1 << index
+        return bits, changed
+
+    def as_dict(self):
+        return {'signals': self.signals, 'models': self.models, 'fields': self.fields}
+
+
+class Journal(object):
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, flush_records=256,
+                 flush_interval=1.0):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.segment_bytes = segment_bytes - segment_bytes % RECORD.size
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._pending = 0
+        self._last_flush = time.time()
+        self._sequence = 0
+        self._file = None
+        self._written = 0
+        self._meta = None
+        self._meta_dirty = False
+
+    def _open_segment(self):
+        self._sequence += 1
+        name = '%s-%d-%06d' % (time.strftime('%Y%m%d%H%M%S'), os.getpid(), self._sequence)
+        self._path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+        self._file = open(self._path, 'ab')
+        self._written = 0
+        self._meta = _SegmentMeta()
+        self._meta_dirty = True
+
+    def append(self, signal, model, pk, created=False, fields=(), timestamp=None):
+        """
+        Buffer one event; ``signal`` is a signal name, ``model`` a model
+        label such as 'exapp.Customer'.
+        """
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            meta = self._meta
+            signal_id, new_signal = meta.signal_id(signal)
+            model_id, new_model = meta.model_id(model)
+            bits, new_fields = meta.field_bits(model, fields)
+            self._meta_dirty |= new_signal or new_model or new_fields
+            flags = FLAG_CREATED if created else 0
+            if not isinstance(pk, six.integer_types):
+                pk, flags = 0, flags | FLAG_NO_PK
+            self._buffer += RECORD.pack(
+                signal_id, model_id, flags,
+                time.time() if timestamp is None else timestamp, pk, bits)
+            self._pending += 1
+            if (self._pending >= self.flush_records or
+                    time.time() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+    def _flush(self):
+        # Caller holds the lock.
+        if self._file is None:
+            return
+        if self._meta_dirty:
+            # Written first, so every record on disk can be decoded.
+            _write_json(self._path[:-len(SEGMENT_SUFFIX)] + META_SUFFIX, self._meta.as_dict())
+            self._meta_dirty = False
+        if self._buffer:
+            self._file.write(bytes(self._buffer))
+            self._file.flush()
+            self._written += len(self._buffer)
+            self._buffer = bytearray()
+        self._pending = 0
+        self._last_flush = time.time()
+        if self._written >= self.segment_bytes:
+            self._file.close()
+            self._file = None
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def record_signal(self, key, sender, kwargs):
+        """
+        Journal one model signal, straight from a receiver's
+        ``sender, **kwargs``; ``key`` is ignored, for ``SignalLog`` parity.
+        """
+        signal = signal_name(kwargs.get('signal'))
+        instance = kwargs.get('instance')
+        model = sender
+        if 'relation' in kwargs:
+            # related_changed's sender is the relation field's model, which
+            # for a reverse relation isn't the model of ``instance``.
+            model = instance._meta.concrete_model
+        label = '%s.%s' % (model._meta.app_label, model._meta.object_name)
+        created = bool(kwargs.get('created'))
+        if 'pks' in kwargs:
+            pks = kwargs['pks']
+            if pks is None:
+                # bulk_create on backends that don't return new pks.
+                pks = [getattr(obj, 'pk', None) for obj in kwargs.get('instances') or ()]
+                if not pks or None in pks:
+                    pks = [None]
+            for pk in pks:
+                self.append(signal, label, pk, created=created,
+                            fields=kwargs.get('update_fields') or ())
+            return
+        if 'relation' in kwargs:
+            fields = (kwargs['relation'],)
+        elif kwargs.get('update_fields') is not None:
+            fields = kwargs['update_fields']
+        else:
+            fields = getattr(instance, 'saved_changes', None) or ()
+        self.append(signal, label, getattr(instance, 'pk', None), created=created,
+                    fields=fields)
+
+
+class _Segment(object):
+
+    def __init__(self, path):
+        self.path = path
+        with open(path[:-len(SEGMENT_SUFFIX)] + META_SUFFIX) as f:
+            self.meta = _SegmentMeta(**json.load(f))
+
+    def _bounds(self, mm, count, since, until):
+        def first_at_or_after(ts):
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if _TIMESTAMP.unpack_from(mm, mid * RECORD.size + 8)[0] < ts:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+        start = 0 if since is None else first_at_or_after(since)
+        stop = count if until is None else first_at_or_after(until)
+        return start, stop
+
+    def matches(self, signal=None, model=None, since=None, until=None, created=None,
+                field=None):
+        """
+        Yield (mmap, offset) for each matching record.  Returns early if a
+        filter names something this segment never recorded.
+        """
+        meta = self.meta
+        signal_id = model_id = None
+        if signal is not None:
+            if signal not in meta.signals:
+                return
+            signal_id = meta.signals.index(signal)
+        if model is not None:
+            if model not in meta.models:
+                return
+            model_id = meta.models.index(model)
+        field_mask = None
+        if field is not None:
+            if model is None:
+                raise ValueError("Filtering on a field requires a model.")
+            if field not in meta.fields.get(model, ()):
+                return
+            field_mask = 1 << meta.fields[model].index(field)
+
+        size = os.path.getsize(self.path)
+        count = size // RECORD.size
+        if not count:
+            return
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), count * RECORD.size, access=mmap.ACCESS_READ)
+        try:
+            start, stop = self._bounds(mm, count, since, until)
+            unpack_header = _HEADER.unpack_from
+            for offset in range(start * RECORD.size, stop * RECORD.size, RECORD.size):
+                sig, mod, flags = unpack_header(mm, offset)
+                if signal_id is not None and sig != signal_id:
+                    continue
+                if model_id is not None and mod != model_id:
+                    continue
+                if created is not None and bool(flags & FLAG_CREATED) != created:
+                    continue
+                if field_mask is not None and not RECORD.unpack_from(mm, offset)[5] & field_mask:
+                    continue
+                yield mm, offset
+        finally:
+            mm.close()
+
+    def decode(self, mm, offset):
+        sig, mod, flags, ts, pk, bits = RECORD.unpack_from(mm, offset)
+        label = self.meta.models[mod]
+        names = self.meta.fields.get(label, ())
+        fields = frozenset(name for i, name in enumerate(names) if bits & (1 << i))
+        return JournalEvent(ts, self.meta.signals[sig], label,
+                            None if flags & FLAG_NO_PK else pk,
+                            bool(flags & FLAG_CREATED), fields)
+
+
+class JournalReader(object):
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX))
+        segments = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path[:-len(SEGMENT_SUFFIX)] + META_SUFFIX):
+                segments.append(_Segment(path))
+        return segments
+
+    def scan(self, **filters):
+        """
+        Yield a ``JournalEvent`` for every record matching ``filters``:
+        ``signal``, ``model`` (label), ``since``/``until`` (timestamps),
+        ``created`` and ``field`` (with ``model``).
+        """
+        for segment in self.segments():
+            for mm, offset in segment.matches(**filters):
+                yield segment.decode(mm, offset)
+
+    def count(self, **filters):
+        return sum(1 for segment in self.segments() for _ in segment.matches(**filters))
+
+    def count_by(self, key, **filters):
+        """Matching record counts per 'signal' or 'model'."""
+        if key not in ('signal', 'model'):
+            raise ValueError("count_by() key must be 'signal' or 'model', got %r" % key)
+        index = 0 if key == 'signal' else 1
+        counts = collections.Counter()
+        for segment in self.segments():
+            names = segment.meta.signals if key == 'signal' else segment.meta.models
+            ids = collections.Counter(
+                _HEADER.unpack_from(mm, offset)[index]
+                for mm, offset in segment.matches(**filters))
+            for id_, n in ids.items():
+                counts[names[id_]] += n
+        return dict(counts)
+
+
+_journal = None
+
+
+def configure():
+    """Apply the ``SIGNAL_JOURNAL`` setting; called from ``AppConfig.ready``."""
+    global _journal
+    options = getattr(settings, 'SIGNAL_JOURNAL', None)
+    if not options or _journal is not None:
+        return _journal
+    from django.apps import apps
+    from django.db.models import signals as model_signals
+    from . import signals as exapp_signals
+    from .models import INTERNAL_MODELS
+
+    options = dict(options)
+    _journal = Journal(options.pop('directory'), **options)
+    atexit.register(_journal.close)
+
+    def journal_receiver(sender, **kwargs):
+        _journal.record_signal(None, sender, kwargs)
+
+    for model in apps.get_app_config('exapp').get_models():
+        if model in INTERNAL_MODELS:
+            continue
+        for signal in (model_signals.post_save, model_signals.post_delete,
+                       exapp_signals.post_bulk_save, exapp_signals.post_bulk_delete,
+                       exapp_signals.related_changed):
+            signal.connect(journal_receiver, sender=model, weak=False,
+                           dispatch_uid='exapp.journal')
+    return _journal
@@ -0,0 +1,495 @@
+"""
+Load testing signal overhead through the WSGI app, with concurrent clients
+writing through the JSON endpoints in ``exapp.views``.
+
+    clock.enable()
+    with LocalServer() as server:
+        report = run(server.url, workload='mixed', threads=8, processes=2,
+                     requests=500)
+    report.throughput, report.percentile(99), report.receiver_share
+
+A workload is a mix of operations weighted by how often each is picked:
+one of ``WORKLOADS`` by name, a dict, or a spec such as
+``create_customer=4,relate=2``.  Every client thread keeps the pks of the
+rows it created and only touches those, so clients never contend for rows,
+only for the database.  An operation whose rows don't exist yet (``relate``
+before any customer) creates them instead and is counted as that.
+
+``LocalServer`` serves the project on a thread per request against the
+configured ``default`` database: SQLite, as long as it is a file, or any
+other backend, eg. a local PostgreSQL, configured in ``DATABASES``.  While
+``clock`` is enabled (in the server's process) responses report the time
+spent handling the request and, of that, inside receivers; ``run()``
+totals them into ``receiver_share``.  Set ``SIGNAL_LOAD_TIMING = True``
+to enable it in a server started some other way.
+
+See the ``load_test`` management command.
+"""
+import collections
+import contextlib
+import json
+import multiprocessing
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils.six.moves import http_client, socketserver
+from django.utils.six.moves.urllib.parse import urlsplit
+
+from . import dispatch
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+WORKLOADS = {
+    'mixed': {'create_customer': 4, 'relate': 3, 'reassign': 2, 'delete_customer': 1,
+              'create_company': 1, 'create_category': 1},
+    'create': {'create_customer': 4, 'create_company': 1, 'create_category': 1},
+    'relate': {'relate': 6, 'create_customer': 1},
+    'churn': {'create_customer': 3, 'delete_customer': 2, 'create_company': 1,
+              'delete_company': 1},
+}
+
+REQUESTS = 200
+
+TIMEOUT = 30
+
+
+class Measurement(object):
+
+    __slots__ = ('request', 'receivers')
+
+    def __init__(self):
+        self.request = None
+        self.receivers = None
+
+
+class _Clocked(object):
+    """Stands in for one receiver during one send."""
+
+    __slots__ = ('clock', 'receiver')
+
+    def __init__(self, clock, receiver):
+        self.clock = clock
+        self.receiver = receiver
+
+    @property
+    def wrapped_receiver(self):
+        return self.receiver
+
+    def __call__(self, **kwargs):
+        local = self.clock._local
+        depth = getattr(local, 'depth', 0)
+        if depth:
+            # Nested in a receiver already being timed.
+            return self.receiver(**kwargs)
+        local.depth = 1
+        start = timer()
+        try:
+            return self.receiver(**kwargs)
+        finally:
+            local.depth = 0
+            local.total = getattr(local, 'total', 0.0) + timer() - start
+
+
+class ReceiverClock(object):
+    """
+    Time spent inside receivers, per thread.  Like ``profiling.Profiler``
+    it is a receiver wrapper, so it costs nothing while disabled.
+    """
+
+    def __init__(self, signals=dispatch.MODEL_SIGNALS):
+        self.signals = list(signals)
+        self.enabled = False
+        self._local = threading.local()
+
+    def _wrap(self, signal, sender, receiver):
+        return _Clocked(self, receiver)
+
+    def enable(self):
+        if not self.enabled:
+            for signal in self.signals:
+                dispatch.add_wrapper(signal, self._wrap)
+            self.enabled = True
+        return self
+
+    def disable(self):
+        if self.enabled:
+            for signal in self.signals:
+                dispatch.remove_wrapper(signal, self._wrap)
+            self.enabled = False
+
+    @contextlib.contextmanager
+    def measure(self):
+        """Time the block, and receivers within it, into the ``Measurement`` yielded."""
+        measured = Measurement()
+        if not self.enabled:
+            yield measured
+            return
+        local = self._local
+        local.total = 0.0
+        start = timer()
+        try:
+            yield measured
+        finally:
+            measured.request = timer() - start
+            measured.receivers = local.total
+
+
+clock = ReceiverClock()
+
+
+def configure():
+    """Apply the ``SIGNAL_LOAD_TIMING`` setting; called from ``AppConfig.ready``."""
+    if getattr(settings, 'SIGNAL_LOAD_TIMING', None):
+        clock.enable()
+    return clock
+
+
+def parse_workload(workload):
+    """``workload`` (a name, a dict or a ``op=weight,...`` spec) as a dict of weights."""
+    if isinstance(workload, dict):
+        mix = dict(workload)
+    elif workload in WORKLOADS:
+        mix = dict(WORKLOADS[workload])
+    else:
+        mix = {}
+        for item in workload.split(','):
+            op, sep, weight = item.partition('=')
+            try:
+                mix[op.strip()] = int(weight) if sep else 1
+            except ValueError:
+                raise ValueError("Invalid weight in %r" % item)
+    unknown = sorted(op for op in mix if op not in Worker.OPERATIONS)
+    if unknown:
+        raise ValueError("Unknown operation(s): %s. Choose from: %s" % (
+            ', '.join(unknown), ', '.join(sorted(Worker.OPERATIONS))))
+    if any(weight < 0 for weight in mix.values()) or not any(mix.values()):
+        raise ValueError("Weights must not be negative, and some must be positive")
+    return mix
+
+
+class Client(object):
+    """Requests to the endpoints under ``url``; a new connection for each."""
+
+    def __init__(self, url, timeout=TIMEOUT):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path.rstrip('/') + '/'
+        self.timeout = timeout
+
+    def request(self, method, path, data=None):
+        """``(status, data, headers)``; status is 0 if the request failed."""
+        body = None if data is None else json.dumps(data)
+        connection = http_client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            connection.request(method, self.path + path, body,
+                               {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            content = response.read()
+            headers = dict((k.lower(), v) for k, v in response.getheaders())
+        except (IOError, http_client.HTTPException):
+            return 0, None, {}
+        finally:
+            connection.close()
+        try:
+            data = json.loads(content.decode('utf-8'))
+        except ValueError:
+            data = None
+        return response.status, data, headers
+
+
+# op, status, seconds, seconds handling the request, seconds in receivers
+Sample = collections.namedtuple('Sample', 'op status latency request receivers')
+
+
+class Worker(object):
+    """One client's rows and the operations on them."""
+
+    OPERATIONS = ('create_company', 'create_category', 'create_customer', 'relate',
+                  'reassign', 'delete_customer', 'delete_company')
+
+    def __init__(self, client, mix, seed=None):
+        self.client = client
+        self.ops = sorted(op for op, weight in mix.items() if weight)
+        self.weights = [mix[op] for op in self.ops]
+        self.random = random.Random(seed)
+        self.companies = []
+        self.categories = []
+        self.customers = {}
+        self.samples = []
+        self._names = 0
+
+    def _name(self, kind):
+        self._names += 1
+        return '%s-%d' % (kind, self._names)
+
+    def _call(self, op, method, path, data=None):
+        start = timer()
+        status, body, headers = self.client.request(method, path, data)
+        latency = timer() - start
+        request = headers.get('x-request-time')
+        receivers = headers.get('x-receiver-time')
+        self.samples.append(Sample(
+            op, status, latency,
+            float(request) if request is not None else None,
+            float(receivers) if receivers is not None else None))
+        return body if status and status < 400 else None
+
+    def create_company(self):
+        body = self._call('create_company', 'POST', 'companies/', {'name': self._name('company')})
+        if body:
+            self.companies.append(body['id'])
+
+    def create_category(self):
+        body = self._call('create_category', 'POST', 'categories/',
+                          {'name': self._name('category')})
+        if body:
+            self.categories.append(body['id'])
+
+    def create_customer(self):
+        company = self.random.choice(self.companies) if self.companies else None
+        body = self._call('create_customer', 'POST', 'customers/',
+                          {'name': self._name('customer'), 'company': company})
+        if body:
+            self.customers[body['id']] = company
+
+    def relate(self):
+        if not self.customers:
+            return self.create_customer()
+        if not self.categories:
+            return self.create_category()
+        pk = self.random.choice(list(self.customers))
+        add = self.random.sample(self.categories, min(len(self.categories), 3))
+        self._call('relate', 'POST', 'customers/%d/categories/' % pk,
+                   {'add': add, 'through': self.random.random() < 0.5})
+
+    def reassign(self):
+        if not self.customers:
+            return self.create_customer()
+        if not self.companies:
+            return self.create_company()
+        pk = self.random.choice(list(self.customers))
+        company = self.random.choice(self.companies)
+        if self._call('reassign', 'POST', 'customers/%d/' % pk, {'company': company}):
+            self.customers[pk] = company
+
+    def delete_customer(self):
+        if not self.customers:
+            return self.create_customer()
+        pk = self.random.choice(list(self.customers))
+        del self.customers[pk]
+        self._call('delete_customer', 'DELETE', 'customers/%d/' % pk)
+
+    def delete_company(self):
+        if not self.companies:
+            return self.create_company()
+        pk = self.companies.pop(self.random.randrange(len(self.companies)))
+        # Its customers are deleted with it.
+        self.customers = dict((c, company) for c, company in self.customers.items()
+                              if company != pk)
+        self._call('delete_company', 'DELETE', 'companies/%d/' % pk)
+
+    def step(self):
+        getattr(self, self._choose())()
+
+    def _choose(self):
+        point = self.random.uniform(0, sum(self.weights))
+        for op, weight in zip(self.ops, self.weights):
+            point -= weight
+            if point < 0:
+                return op
+        return self.ops[-1]
+
+    def run(self, requests=REQUESTS, deadline=None):
+        """Make ``requests`` requests, or as many as fit before ``deadline``."""
+        while (requests is None or len(self.samples) < requests) and (
+                deadline is None or timer() < deadline):
+            self.step()
+        return self.samples
+
+
+def run_threads(task):
+    """
+    Run ``(url, mix, threads, requests, duration, seed)``'s worker threads
+    in this process; returns their samples.
+    """
+    url, mix, threads, requests, duration, seed = task
+    deadline = timer() + duration if duration else None
+    workers = [Worker(Client(url), mix, seed='%s-%d' % (seed, n)) for n in range(threads)]
+    running = [threading.Thread(target=worker.run, args=(requests, deadline))
+               for worker in workers]
+    for thread in running:
+        thread.daemon = True
+        thread.start()
+    for thread in running:
+        thread.join()
+    return [sample for worker in workers for sample in worker.samples]
+
+
+class LoadReport(object):
+
+    def __init__(self, samples, seconds, threads=1, processes=1):
+        self.samples = samples
+        self.seconds = seconds
+        self.threads = threads
+        self.processes = processes
+        self._latencies = sorted(s.latency for s in samples)
+
+    @property
+    def requests(self):
+        return len(self.samples)
+
+    @property
+    def errors(self):
+        return sum(1 for s in self.samples if not s.status or s.status >= 400)
+
+    @property
+    def throughput(self):
+        """Requests per second."""
+        return self.requests / self.seconds if self.seconds else 0.0
+
+    def percentile(self, p, latencies=None):
+        """The ``p``th percentile latency, in seconds."""
+        latencies = self._latencies if latencies is None else latencies
+        if not latencies:
+            return None
+        rank = max(1, int(-(-len(latencies) * p // 100)))
+        return latencies[rank - 1]
+
+    @property
+    def receiver_share(self):
+        """Of the time the server spent on requests, the share inside receivers."""
+        timed = [s for s in self.samples if s.request is not None]
+        handling = sum(s.request for s in timed)
+        if not handling:
+            return None
+        return sum(s.receivers for s in timed) / handling
+
+    def operations(self):
+        by_op = collections.defaultdict(list)
+        for sample in self.samples:
+            by_op[sample.op].append(sample)
+        rows = {}
+        for op, samples in by_op.items():
+            latencies = sorted(s.latency for s in samples)
+            rows[op] = {
+                'requests': len(samples),
+                'errors': sum(1 for s in samples if not s.status or s.status >= 400),
+                'mean_ms': sum(latencies) / len(latencies) * 1000,
+                'p99_ms': self.percentile(99, latencies) * 1000,
+            }
+        return rows
+
+    def as_dict(self):
+        def ms(seconds):
+            return None if seconds is None else seconds * 1000
+
+        return {
+            'threads': self.threads,
+            'processes': self.processes,
+            'requests': self.requests,
+            'errors': self.errors,
+            'seconds': self.seconds,
+            'throughput': self.throughput,
+            'p50_ms': ms(self.percentile(50)),
+            'p95_ms': ms(self.percentile(95)),
+            'p99_ms': ms(self.percentile(99)),
+            'max_ms': ms(self._latencies[-1] if self._latencies else None),
+            'receiver_share': self.receiver_share,
+            'operations': self.operations(),
+        }
+
+
+def _close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+def run(url, workload='mixed', threads=4, processes=1, requests=REQUESTS, duration=None,
+        seed=0):
+    """
+    Drive ``workload`` against the endpoints at ``url`` from ``threads``
+    threads in each of ``processes`` processes, each thread making
+    ``requests`` requests or, with ``duration``, as many as it can in that
+    many seconds.  Returns a ``LoadReport``.
+    """
+    mix = parse_workload(workload)
+    if duration:
+        requests = None
+    tasks = [(url, mix, threads, requests, duration, '%s-%d' % (seed, n))
+             for n in range(processes)]
+    started = timer()
+    if processes > 1:
+        # Children only make requests; keep them off our connections.
+        _close_connections()
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(run_threads, tasks)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        results = [run_threads(tasks[0])]
+    seconds = timer() - started
+    return LoadReport([sample for result in results for sample in result], seconds,
+                      threads, processes)
+
+
+class LocalServer(object):
+    """
+    The project's WSGI app served from a background thread, a thread per
+    request; ``port=0`` picks a free port.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self._thread = None
+
+    def start(self):
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+
+        class Server(socketserver.ThreadingMixIn, WSGIServer):
+            daemon_threads = True
+            request_queue_size = 128
+
+        class Handler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        self.httpd = Server((self.host, self.port), Handler)
+        self.httpd.set_app(WSGIHandler())
+        self._thread = threading.Thread(target=self.httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self._thread.join()
+            self.httpd = self._thread = None
+
+    @property
+    def url(self):
+        """The endpoints' base URL."""
+        from django.core.urlresolvers import reverse
+        path = reverse('exapp:stats')
+        return 'http://%s:%d%s' % (self.host, self.httpd.server_port,
+                                   path[:-len('stats/')])
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
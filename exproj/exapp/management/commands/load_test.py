@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from exapp import loadtest
+
+
+class Command(BaseCommand):
+    help = ("Drive concurrent writes through the JSON endpoints and report throughput, "
+            "latency percentiles and the share of request time spent in receivers.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workload', default='mixed',
+            help="One of %s, or weights such as create_customer=4,relate=2 "
+                 "(default: %%(default)s)." % ', '.join(sorted(loadtest.WORKLOADS)))
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help="Client threads per process (default: %(default)s).")
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help="Client processes (default: %(default)s).")
+        parser.add_argument(
+            '--requests', type=int, default=loadtest.REQUESTS,
+            help="Requests per thread (default: %(default)s).")
+        parser.add_argument(
+            '--duration', type=float,
+            help="Run each thread for this many seconds instead of --requests.")
+        parser.add_argument(
+            '--seed', type=int, default=0)
+        parser.add_argument(
+            '--url', help="Load an already running server's endpoints, eg. "
+                          "http://127.0.0.1:8000/load/, instead of serving them here.")
+        parser.add_argument(
+            '--addr', default='127.0.0.1:0',
+            help="Address to serve on (default: %(default)s, any free port).")
+        parser.add_argument(
+            '--use-existing-db', action='store_true',
+            help="Serve from the configured database instead of a throwaway test "
+                 "database.  Rows written are kept.")
+        parser.add_argument(
+            '--output', help="Write the JSON report to this file.")
+
+    def handle(self, **options):
+        if options['threads'] < 1 or options['processes'] < 1 or options['requests'] < 1:
+            raise CommandError("--threads, --processes and --requests must be positive")
+        try:
+            loadtest.parse_workload(options['workload'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['url']:
+            report = self._run(options['url'], options)
+        else:
+            host, sep, port = options['addr'].rpartition(':')
+            if not sep or not port.isdigit():
+                raise CommandError("--addr must be host:port")
+            report = self._serve(host, int(port), options)
+
+        data = report.as_dict()
+        self.stdout.write("%d requests (%d errors) in %.2fs: %.0f requests/s" % (
+            data['requests'], data['errors'], data['seconds'], data['throughput']))
+        if data['requests']:
+            self.stdout.write("latency p50 %.1fms  p95 %.1fms  p99 %.1fms  max %.1fms" % (
+                data['p50_ms'], data['p95_ms'], data['p99_ms'], data['max_ms']))
+        if data['receiver_share'] is not None:
+            self.stdout.write("receivers: %.1f%% of request time" % (
+                data['receiver_share'] * 100))
+        if options['verbosity'] > 1:
+            for op, row in sorted(data['operations'].items()):
+                self.stdout.write("%-16s %6d requests %4d errors  mean %6.1fms  p99 %6.1fms" % (
+                    op, row['requests'], row['errors'], row['mean_ms'], row['p99_ms']))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            self.stdout.write("Wrote the report to %s" % options['output'])
+
+    def _run(self, url, options):
+        return loadtest.run(
+            url, workload=options['workload'], threads=options['threads'],
+            processes=options['processes'], requests=options['requests'],
+            duration=options['duration'], seed=options['seed'])
+
+    def _serve(self, host, port, options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        old_name = directory = None
+        if not options['use_existing_db']:
+            old_name = connection.settings_dict['NAME']
+            if connection.vendor == 'sqlite':
+                # Server threads each open a connection, so they need a file
+                # rather than an in-memory database.
+                directory = tempfile.mkdtemp(prefix='load_test')
+                connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'db.sqlite3')
+            connection.creation.create_test_db(verbosity=0)
+        enabled = loadtest.clock.enabled
+        loadtest.clock.enable()
+        try:
+            with loadtest.LocalServer(host, port) as server:
+                return self._run(server.url, options)
+        finally:
+            if not enabled:
+                loadtest.clock.disable()
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
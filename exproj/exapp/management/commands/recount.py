@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from exapp import counters
+
+
+class Command(BaseCommand):
+    help = ("Recompute the maintained relation counts and repair any that drifted, "
+            "eg. after writes that sent no signals.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'relations', nargs='*', metavar='relation',
+            help="Relations to recount, eg. exapp.Company.customers (default: all "
+                 "counted relations).")
+        parser.add_argument(
+            '--batch-size', type=int, default=counters.CHUNK_SIZE,
+            help="Owners per batch (default: %(default)s).")
+        parser.add_argument(
+            '--dry-run', action='store_true', help="Report drift without fixing it.")
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, **options):
+        counts = counters.relation_counts
+        if counts is None:
+            try:
+                counts = counters.RelationCounts()
+            except (LookupError, ValueError) as e:
+                raise CommandError(str(e))
+        by_label = dict((r.label, r) for r in counts.relations.values())
+        labels = options['relations'] or sorted(by_label)
+        unknown = set(labels) - set(by_label)
+        if unknown:
+            raise CommandError("Unknown relation(s): %s. Choose from: %s" % (
+                ', '.join(sorted(unknown)), ', '.join(sorted(by_label))))
+
+        for label in labels:
+            checked, fixed, created, removed = counts.recount(
+                by_label[label], using=options['database'],
+                batch_size=options['batch_size'], dry_run=options['dry_run'])
+            if options['verbosity']:
+                self.stdout.write("%s: %d checked, %d %s, %d missing, %d orphaned" % (
+                    label, checked, fixed, 'wrong' if options['dry_run'] else 'fixed',
+                    created, removed))
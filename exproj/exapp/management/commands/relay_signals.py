@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from exapp import outbox
+
+
+class Command(BaseCommand):
+    help = ("Send the events queued in the signal outbox to a sink, in batches, "
+            "deleting them once sent.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sink', help="Dotted path of the sink class (default: the SIGNAL_OUTBOX "
+                           "'sink' setting, or exapp.outbox.FileSink).")
+        parser.add_argument(
+            '--file', help="Append events to this file as JSON lines (FileSink).")
+        parser.add_argument(
+            '--batch-size', type=int, default=outbox.DEFAULT_BATCH_SIZE,
+            help="Events per batch (default: %(default)s).")
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once the outbox is empty instead of polling for more.")
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help="Seconds to wait when the outbox is empty (default: %(default)s).")
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+        sink_options = {}
+        if options['file']:
+            sink_options['path'] = options['file']
+        sink_path = options['sink'] or ('exapp.outbox.FileSink' if options['file'] else None)
+        try:
+            sink = outbox.get_sink(sink_path, **sink_options)
+        except (ImportError, TypeError) as e:
+            raise CommandError("Can't create sink: %s" % e)
+
+        total = 0
+        try:
+            while True:
+                sent = outbox.relay(sink, batch_size=options['batch_size'],
+                                    using=options['database'])
+                total += sent
+                if sent and options['verbosity'] > 1:
+                    self.stdout.write("Relayed %d events." % sent)
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.close()
+        if options['verbosity']:
+            self.stdout.write("Relayed %d events in total." % total)
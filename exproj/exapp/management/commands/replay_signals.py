@@ -0,0 +1,71 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from exapp import replay
+
+
+class Command(BaseCommand):
+    help = ("Send post_save for existing rows to the named receivers only, eg. to "
+            "backfill a new index or counter.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'receivers', nargs='*', metavar='receiver',
+            help="Receivers to replay to, by dotted or bare name (see --list).")
+        parser.add_argument(
+            '--model', action='append', dest='models',
+            help="Model to replay, eg. exapp.Customer; may be repeated (default: %s)."
+                 % ', '.join(replay.DEFAULT_MODELS))
+        parser.add_argument(
+            '--list', action='store_true', help="List the models' post_save receivers.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=replay.CHUNK_SIZE,
+            help="Rows read and delivered at a time (default: %(default)s).")
+        parser.add_argument(
+            '--segment-size', type=int, default=replay.SEGMENT_SIZE,
+            help="Pks per unit of work and checkpoint (default: %(default)s).")
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help="Processes replaying segments in parallel (default: %(default)s).")
+        parser.add_argument(
+            '--checkpoint', help="Record finished segments in this file and skip those "
+                                 "already recorded there.")
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, **options):
+        labels = options['models'] or replay.DEFAULT_MODELS
+        try:
+            models = [(label, apps.get_model(label)) for label in labels]
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+        if options['list']:
+            for label, model in models:
+                self.stdout.write("%s:" % label)
+                for name in replay.receivers_for(model):
+                    self.stdout.write("    %s" % name)
+            return
+        if not options['receivers']:
+            raise CommandError("Name at least one receiver to replay to (see --list).")
+        if options['chunk_size'] < 1 or options['segment_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--chunk-size, --segment-size and --workers must be positive")
+
+        def progress(label, rows):
+            if options['verbosity'] > 1:
+                self.stdout.write("%s: segment done, %d rows." % (label, rows))
+
+        try:
+            report = replay.replay(
+                options['receivers'], models=labels, using=options['database'],
+                chunk_size=options['chunk_size'], segment_size=options['segment_size'],
+                workers=options['workers'], checkpoint=options['checkpoint'],
+                progress=progress)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['verbosity']:
+            for label in sorted(set(report.segments) | set(report.skipped)):
+                self.stdout.write("%s: %d rows in %d segments, %d segments already done" % (
+                    label, report.rows[label], report.segments[label], report.skipped[label]))
+            self.stdout.write("Replayed %d rows in %.2fs (%.0f rows/s)." % (
+                report.total, report.seconds, report.rate))
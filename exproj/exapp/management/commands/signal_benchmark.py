@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from exapp import benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Benchmark signal dispatch overhead for each relation operation, "
+            "with and without the exapp receivers connected.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default=','.join(str(n) for n in benchmarks.DEFAULT_SIZES),
+            help="Comma-separated row counts (default: %(default)s).")
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios', default=[],
+            help="Only run this scenario; may be repeated.")
+        parser.add_argument(
+            '--output', help="Write JSON results to this file.")
+        parser.add_argument(
+            '--no-allocations', action='store_false', dest='allocations',
+            help="Skip allocation tracking, which slows down the timed run.")
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--use-existing-db', action='store_true',
+            help="Run against the configured database instead of a throwaway "
+                 "test database.  Changes are rolled back either way.")
+
+    def handle(self, **options):
+        try:
+            sizes = [int(n) for n in options['sizes'].split(',') if n]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+
+        scenarios = benchmarks.SCENARIOS
+        if options['scenarios']:
+            by_name = dict((s.name, s) for s in scenarios)
+            unknown = set(options['scenarios']) - set(by_name)
+            if unknown:
+                raise CommandError("Unknown scenario(s): %s. Choose from: %s" % (
+                    ', '.join(sorted(unknown)), ', '.join(sorted(by_name))))
+            scenarios = [by_name[name] for name in options['scenarios']]
+
+        using = options['database']
+        connection = connections[using]
+        old_name = None
+        if not options['use_existing_db']:
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0)
+        try:
+            report = benchmarks.run_all(
+                sizes=sizes, scenarios=scenarios, using=using,
+                allocations=options['allocations'], progress=self._progress)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write("Wrote %d results to %s" % (
+                len(report['results']), options['output']))
+
+    def _progress(self, result):
+        self.stdout.write("%-22s rows=%-7d receivers=%-5s %12.1f ops/s %8d queries" % (
+            result['scenario'], result['rows'], result['receivers'],
+            result['ops_per_sec'] or 0, result['queries']))
@@ -0,0 +1,88 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from exapp import benchmarks, profiling
+
+COLUMNS = ('calls', 'total_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'errors')
+
+
+class Command(BaseCommand):
+    help = ("Show per-receiver signal timings, either from a dump written by a "
+            "profiled process or by profiling the benchmark scenarios.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', help="Report on this dump instead of running the scenarios "
+                           "(see the SIGNAL_PROFILE dump_path setting).")
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios', default=[],
+            help="Only run this scenario; may be repeated.")
+        parser.add_argument(
+            '--size', type=int, default=100,
+            help="Rows per scenario (default: %(default)s).")
+        parser.add_argument(
+            '--sort', default='total_ms', choices=COLUMNS,
+            help="Column to sort by, descending (default: %(default)s).")
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help="Show this many receivers; 0 for all (default: %(default)s).")
+        parser.add_argument(
+            '--json', action='store_true', help="Print the rows as JSON.")
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, **options):
+        if options['file']:
+            try:
+                with open(options['file']) as f:
+                    rows = json.load(f)['receivers']
+            except (IOError, ValueError, KeyError) as e:
+                raise CommandError("Can't read profile %s: %s" % (options['file'], e))
+        else:
+            rows = self._profile_scenarios(options)
+
+        rows.sort(key=lambda row: row[options['sort']] or 0, reverse=True)
+        if options['limit']:
+            rows = rows[:options['limit']]
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2, sort_keys=True))
+            return
+        self.stdout.write("%-12s %-28s %-44s %s" % (
+            'signal', 'sender', 'receiver', ' '.join('%10s' % c for c in COLUMNS)))
+        for row in rows:
+            self.stdout.write("%-12s %-28s %-44s %s" % (
+                row['signal'], row['sender'], row['receiver'],
+                ' '.join(self._format(row[c]) for c in COLUMNS)))
+
+    def _format(self, value):
+        if value is None:
+            return '%10s' % '-'
+        if isinstance(value, float):
+            return '%10.3f' % value
+        return '%10d' % value
+
+    def _profile_scenarios(self, options):
+        scenarios = benchmarks.SCENARIOS
+        if options['scenarios']:
+            by_name = dict((s.name, s) for s in scenarios)
+            unknown = set(options['scenarios']) - set(by_name)
+            if unknown:
+                raise CommandError("Unknown scenario(s): %s. Choose from: %s" % (
+                    ', '.join(sorted(unknown)), ', '.join(sorted(by_name))))
+            scenarios = [by_name[name] for name in options['scenarios']]
+
+        using = options['database']
+        connection = connections[using]
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0)
+        profiler = profiling.Profiler().enable()
+        try:
+            for scenario in scenarios:
+                benchmarks.run_scenario(scenario, options['size'], using=using,
+                                        allocations=False)
+        finally:
+            profiler.disable()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        return profiler.report()
@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from exapp import topology
+
+
+class Command(BaseCommand):
+    help = ("Print the relations between installed models, with their reverse accessors, "
+            "through models, on_delete behaviour and related_changed receivers, as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', action='append', dest='models',
+            help="Only relations of this model, eg. exapp.Customer; may be repeated.")
+        parser.add_argument(
+            '--indent', type=int, default=2, help="JSON indent (default: %(default)s).")
+
+    def handle(self, **options):
+        data = topology.get_topology().as_dict()
+        if options['models']:
+            data['relations'] = [r for r in data['relations']
+                                 if r['model'] in options['models']]
+        self.stdout.write(json.dumps(data, indent=options['indent'] or None, sort_keys=True))
@@ -0,0 +1,91 @@
+"""
+Bulk writes that still notify receivers, one signal per batch.
+
+    Customer.objects.bulk_create_with_signals(customers)
+    Customer.objects.filter(company=old).update_with_signals(company=new)
+
+Each batch of ``batch_size`` rows is written with a single INSERT or UPDATE
+bracketed by ``pre_bulk_save``/``post_bulk_save`` (see ``exapp.signals``),
+so imports keep near-``bulk_create`` throughput while receivers still see
+every affected row.  Per-row pre_save/post_save and ``related_changed`` are
+not sent; receivers that need them should listen to the bulk signals too.
+"""
+from django.db import models, router, transaction
+
+from .deletion import planned_delete
+from .signals import post_bulk_save, pre_bulk_save
+
+
+BATCH_SIZE = 500
+
+
+def _batches(seq, size):
+    for start in range(0, len(seq), size):
+        yield seq[start:start + size]
+
+
+class SignalQuerySet(models.QuerySet):
+
+    def bulk_create_with_signals(self, objs, batch_size=BATCH_SIZE):
+        """
+        ``bulk_create`` in batches of ``batch_size``, sending
+        ``pre_bulk_save``/``post_bulk_save`` with ``created=True`` around
+        each INSERT.  Returns the created objects.
+        """
+        objs = list(objs)
+        model = self.model
+        using = self._db or router.db_for_write(model)
+        with transaction.atomic(using=using, savepoint=False):
+            for batch in _batches(objs, batch_size):
+                pre_bulk_save.send(sender=model, instances=batch, pks=None, created=True,
+                                   update_fields=None, using=using)
+                self._bulk_create_batch(batch, using)
+                pks = [obj.pk for obj in batch]
+                if None in pks:
+                    pks = None
+                post_bulk_save.send(sender=model, instances=batch, pks=pks, created=True,
+                                    update_fields=None, using=using)
+        return objs
+    bulk_create_with_signals.alters_data = True
+
+    def _bulk_create_batch(self, batch, using):
+        self.model._base_manager.using(using).bulk_create(batch, batch_size=len(batch))
+        for obj in batch:
+            obj._state.adding = False
+            obj._state.db = using
+            take_snapshot = getattr(obj, '_take_dirty_snapshot', None)
+            if take_snapshot is not None:
+                take_snapshot()
+
+    def update_with_signals(self, batch_size=BATCH_SIZE, **kwargs):
+        """
+        ``update(**kwargs)`` one batch of ``batch_size`` pks at a time,
+        sending ``pre_bulk_save``/``post_bulk_save`` with the batch's pks
+        around each UPDATE.  Returns the number of rows updated.
+        """
+        model = self.model
+        using = self._db or router.db_for_write(model)
+        update_fields = frozenset(kwargs)
+        updated = 0
+        with transaction.atomic(using=using, savepoint=False):
+            pks = list(self.order_by('pk').values_list('pk', flat=True))
+            manager = model._base_manager.using(using)
+            for batch in _batches(pks, batch_size):
+                pre_bulk_save.send(sender=model, instances=None, pks=batch, created=False,
+                                   update_fields=update_fields, using=using)
+                updated += manager.filter(pk__in=batch).update(**kwargs)
+                post_bulk_save.send(sender=model, instances=None, pks=batch, created=False,
+                                    update_fields=update_fields, using=using)
+        return updated
+    update_with_signals.alters_data = True
+
+    def planned_delete(self):
+        """
+        Delete these rows and their cascade with one ``pre_bulk_delete`` and
+        ``post_bulk_delete`` per model; see ``exapp.deletion``.
+        """
+        return planned_delete(self)
+    planned_delete.alters_data = True
+
+
+SignalManager = models.Manager.from_queryset(SignalQuerySet)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignalOutbox',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('signal', models.CharField(max_length=32)),
+                ('model', models.CharField(max_length=100)),
+                ('object_pk', models.CharField(max_length=64, null=True)),
+                ('created', models.BooleanField(default=False)),
+                ('fields', models.TextField(blank=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exapp', '0002_signaloutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelationCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('model', models.CharField(max_length=100)),
+                ('relation', models.CharField(max_length=100)),
+                ('object_pk', models.CharField(max_length=64)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='relationcount',
+            unique_together=set([('model', 'relation', 'object_pk')]),
+        ),
+    ]
@@ -5,22 +5,40 @@ from django.db.models.signals import (
     pre_delete,
     post_delete,
 )
+from django.conf import settings
 from django.dispatch import receiver
-
-import collections
+from django.utils import timezone
+
+from .deferred import deferred_receiver
+from .dirty import DirtyFieldsMixin
+from .events import event_receiver
+from .managers import SignalManager
+from .recording import SignalLog, DEFAULT_CAPACITY
+from .signals import (
+    pre_bulk_related_save,
+    post_bulk_related_save,
+    pre_bulk_save,
+    post_bulk_save,
+    pre_bulk_delete,
+    post_bulk_delete,
+)
 
 
-class Company(models.Model):
+class Company(DirtyFieldsMixin, models.Model):
 
     name = models.CharField(max_length=100)
 
+    objects = SignalManager()
 
-class CustomerCategory(models.Model):
+
+class CustomerCategory(DirtyFieldsMixin, models.Model):
 
     name = models.CharField(max_length=100)
 
+    objects = SignalManager()
+
 
-class Customer(models.Model):
+class Customer(DirtyFieldsMixin, models.Model):
 
     name = models.CharField(max_length=100)
     company = models.ForeignKey(Company, null=True, related_name='customers')
@@ -36,12 +54,16 @@ class Customer(models.Model):
         CustomerCategory,
         related_name='customers_direct')
 
+    objects = SignalManager()
 
-class CustomerExtraJunk(models.Model):
+
+class CustomerExtraJunk(DirtyFieldsMixin, models.Model):
 
     customer = models.OneToOneField(
         Customer, related_name='extrajunk', null=True)
 
+    objects = SignalManager()
+
 
 class CustomerCategoryRel(models.Model):
 
@@ -51,95 +73,258 @@ class CustomerCategoryRel(models.Model):
     customer = models.ForeignKey(Customer)
     category = models.ForeignKey(CustomerCategory)
 
+    objects = SignalManager()
+
+
+class SignalOutbox(models.Model):
+    """An event waiting for ``relay_signals``; see ``exapp.outbox``."""
+
+    timestamp = models.DateTimeField(default=timezone.now)
+    signal = models.CharField(max_length=32)
+    model = models.CharField(max_length=100)
+    object_pk = models.CharField(max_length=64, null=True)
+    created = models.BooleanField(default=False)
+    fields = models.TextField(blank=True)
+
+
+class RelationCount(models.Model):
+    """A maintained count of one object's relation; see ``exapp.counters``."""
+
+    class Meta:
+        unique_together = ('model', 'relation', 'object_pk')
+
+    model = models.CharField(max_length=100)
+    relation = models.CharField(max_length=100)
+    object_pk = models.CharField(max_length=64)
+    count = models.IntegerField(default=0)
+
+
+# Tables exapp keeps about signals, which are not journaled or broadcast.
+INTERNAL_MODELS = (SignalOutbox, RelationCount)
 
-signal_log = collections.defaultdict(list)
 
+signal_log = SignalLog(
+    capacity=getattr(settings, 'SIGNAL_LOG_CAPACITY', DEFAULT_CAPACITY),
+    weak=getattr(settings, 'SIGNAL_LOG_WEAK_INSTANCES', False))
 
-@receiver(pre_save, sender=Company)
-def pre_company_save(sender, **kwargs):
-    signal_log['company presave'].append((sender, kwargs))
 
+@event_receiver(pre_save, sender=Company)
+def pre_company_save(event):
+    signal_log.record_event('company presave', event)
 
-@receiver(pre_save, sender=Customer)
-def pre_customer_save(sender, **kwargs):
-    signal_log['customer presave'].append((sender, kwargs))
 
+@event_receiver(pre_save, sender=Customer)
+def pre_customer_save(event):
+    signal_log.record_event('customer presave', event)
 
-@receiver(pre_save, sender=CustomerCategory)
-def pre_category_save(sender, **kwargs):
-    signal_log['category presave'].append((sender, kwargs))
 
+@event_receiver(pre_save, sender=CustomerCategory)
+def pre_category_save(event):
+    signal_log.record_event('category presave', event)
 
-@receiver(pre_save, sender=CustomerExtraJunk)
-def pre_extrajunk_save(sender, **kwargs):
-    signal_log['extra junk presave'].append((sender, kwargs))
 
+@event_receiver(pre_save, sender=CustomerExtraJunk)
+def pre_extrajunk_save(event):
+    signal_log.record_event('extra junk presave', event)
 
-@receiver(post_save, sender=Company)
+
+@deferred_receiver(post_save, sender=Company)
 def post_company_save(sender, **kwargs):
-    signal_log['company postsave'].append((sender, kwargs))
+    signal_log.record_signal('company postsave', sender, kwargs)
 
 
-@receiver(post_save, sender=Customer)
+@deferred_receiver(post_save, sender=Customer)
 def post_customer_save(sender, **kwargs):
-    signal_log['customer postsave'].append((sender, kwargs))
+    signal_log.record_signal('customer postsave', sender, kwargs)
 
 
-@receiver(post_save, sender=CustomerCategory)
+@deferred_receiver(post_save, sender=CustomerCategory)
 def post_category_save(sender, **kwargs):
-    signal_log['category postsave'].append((sender, kwargs))
+    signal_log.record_signal('category postsave', sender, kwargs)
 
 
-@receiver(post_save, sender=CustomerExtraJunk)
+@deferred_receiver(post_save, sender=CustomerExtraJunk)
 def post_extrajunk_save(sender, **kwargs):
-    signal_log['extra junk postsave'].append((sender, kwargs))
+    signal_log.record_signal('extra junk postsave', sender, kwargs)
 
 
-@receiver(pre_save, sender=CustomerCategoryRel)
-def customer_category_rel_presave(sender, **kwargs):
-    signal_log['rel presave'].append((sender, kwargs))
+@event_receiver(pre_save, sender=CustomerCategoryRel)
+def customer_category_rel_presave(event):
+    signal_log.record_event('rel presave', event)
 
 
-@receiver(post_save, sender=CustomerCategoryRel)
+@deferred_receiver(post_save, sender=CustomerCategoryRel)
 def customer_category_rel_postsave(sender, **kwargs):
-    signal_log['rel postsave'].append((sender, kwargs))
+    signal_log.record_signal('rel postsave', sender, kwargs)
 
 
 @receiver(pre_delete, sender=CustomerExtraJunk)
 def predelete_extra(sender, **kwargs):
-    signal_log['extra predelete'].append((sender, kwargs))
+    signal_log.record_signal('extra predelete', sender, kwargs)
 
 
-@receiver(post_delete, sender=CustomerExtraJunk)
+@deferred_receiver(post_delete, sender=CustomerExtraJunk)
 def postdelete_extra(sender, **kwargs):
-    signal_log['extra postdelete'].append((sender, kwargs))
+    signal_log.record_signal('extra postdelete', sender, kwargs)
 
 
 @receiver(pre_delete, sender=Customer)
 def predelete_customer(sender, **kwargs):
-    signal_log['customer predelete'].append((sender, kwargs))
+    signal_log.record_signal('customer predelete', sender, kwargs)
 
 
-@receiver(post_delete, sender=Customer)
+@deferred_receiver(post_delete, sender=Customer)
 def postdelete_customer(sender, **kwargs):
-    signal_log['customer postdelete'].append((sender, kwargs))
+    signal_log.record_signal('customer postdelete', sender, kwargs)
 
 
 @receiver(pre_delete, sender=CustomerCategory)
 def predelete_category(sender, **kwargs):
-    signal_log['category predelete'].append((sender, kwargs))
+    signal_log.record_signal('category predelete', sender, kwargs)
 
 
-@receiver(post_delete, sender=CustomerCategory)
+@deferred_receiver(post_delete, sender=CustomerCategory)
 def postdelete_category(sender, **kwargs):
-    signal_log['category postdelete'].append((sender, kwargs))
+    signal_log.record_signal('category postdelete', sender, kwargs)
 
 
 @receiver(pre_delete, sender=CustomerCategoryRel)
 def customer_category_rel_predelete(sender, **kwargs):
-    signal_log['rel predelete'].append((sender, kwargs))
+    signal_log.record_signal('rel predelete', sender, kwargs)
 
 
-@receiver(post_delete, sender=CustomerCategoryRel)
+@deferred_receiver(post_delete, sender=CustomerCategoryRel)
 def customer_category_rel_postdelete(sender, **kwargs):
-    signal_log['rel postdelete'].append((sender, kwargs))
+    signal_log.record_signal('rel postdelete', sender, kwargs)
+
+
+@receiver(pre_bulk_related_save, sender=Customer)
+def pre_customer_bulk_related_save(sender, **kwargs):
+    signal_log.record('customer bulk presave', sender, signal=kwargs['signal'],
+                      instance=kwargs['instance'], pk=tuple(kwargs['pks']))
+
+
+@receiver(post_bulk_related_save, sender=Customer)
+def post_customer_bulk_related_save(sender, **kwargs):
+    signal_log.record('customer bulk postsave', sender, signal=kwargs['signal'],
+                      instance=kwargs['instance'], pk=tuple(kwargs['pks']))
+
+
+@receiver(pre_bulk_related_save, sender=CustomerCategory)
+def pre_category_bulk_related_save(sender, **kwargs):
+    signal_log.record('category bulk presave', sender, signal=kwargs['signal'],
+                      instance=kwargs['instance'], pk=tuple(kwargs['pks']))
+
+
+@receiver(post_bulk_related_save, sender=CustomerCategory)
+def post_category_bulk_related_save(sender, **kwargs):
+    signal_log.record('category bulk postsave', sender, signal=kwargs['signal'],
+                      instance=kwargs['instance'], pk=tuple(kwargs['pks']))
+
+
+@receiver(pre_bulk_save, sender=Company)
+def pre_company_bulk_save(sender, **kwargs):
+    signal_log.record('company batch presave', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks'] or ()))
+
+
+@receiver(post_bulk_save, sender=Company)
+def post_company_bulk_save(sender, **kwargs):
+    signal_log.record('company batch postsave', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks'] or ()))
+
+
+@receiver(pre_bulk_save, sender=Customer)
+def pre_customer_bulk_save(sender, **kwargs):
+    signal_log.record('customer batch presave', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks'] or ()))
+
+
+@receiver(post_bulk_save, sender=Customer)
+def post_customer_bulk_save(sender, **kwargs):
+    signal_log.record('customer batch postsave', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks'] or ()))
+
+
+@receiver(pre_bulk_save, sender=CustomerCategory)
+def pre_category_bulk_save(sender, **kwargs):
+    signal_log.record('category batch presave', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks'] or ()))
+
+
+@receiver(post_bulk_save, sender=CustomerCategory)
+def post_category_bulk_save(sender, **kwargs):
+    signal_log.record('category batch postsave', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks'] or ()))
+
+
+@receiver(pre_bulk_save, sender=CustomerExtraJunk)
+def pre_extrajunk_bulk_save(sender, **kwargs):
+    signal_log.record('extra junk batch presave', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks'] or ()))
+
+
+@receiver(post_bulk_save, sender=CustomerExtraJunk)
+def post_extrajunk_bulk_save(sender, **kwargs):
+    signal_log.record('extra junk batch postsave', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks'] or ()))
+
+
+@receiver(pre_bulk_delete, sender=Customer)
+def pre_customer_bulk_delete(sender, **kwargs):
+    signal_log.record('customer batch predelete', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks']))
+
+
+@receiver(post_bulk_delete, sender=Customer)
+def post_customer_bulk_delete(sender, **kwargs):
+    signal_log.record('customer batch postdelete', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks']))
+
+
+@receiver(pre_bulk_delete, sender=CustomerCategory)
+def pre_category_bulk_delete(sender, **kwargs):
+    signal_log.record('category batch predelete', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks']))
+
+
+@receiver(post_bulk_delete, sender=CustomerCategory)
+def post_category_bulk_delete(sender, **kwargs):
+    signal_log.record('category batch postdelete', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks']))
+
+
+@receiver(pre_bulk_delete, sender=CustomerExtraJunk)
+def pre_extra_bulk_delete(sender, **kwargs):
+    signal_log.record('extra batch predelete', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks']))
+
+
+@receiver(post_bulk_delete, sender=CustomerExtraJunk)
+def post_extra_bulk_delete(sender, **kwargs):
+    signal_log.record('extra batch postdelete', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks']))
+
+
+@receiver(pre_bulk_save, sender=CustomerCategoryRel)
+def pre_customer_category_rel_bulk_save(sender, **kwargs):
+    signal_log.record('rel batch presave', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks'] or ()))
+
+
+@receiver(post_bulk_save, sender=CustomerCategoryRel)
+def post_customer_category_rel_bulk_save(sender, **kwargs):
+    signal_log.record('rel batch postsave', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks'] or ()))
+
+
+@receiver(pre_bulk_delete, sender=CustomerCategoryRel)
+def pre_customer_category_rel_bulk_delete(sender, **kwargs):
+    signal_log.record('rel batch predelete', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks']))
+
+
+@receiver(post_bulk_delete, sender=CustomerCategoryRel)
+def post_customer_category_rel_bulk_delete(sender, **kwargs):
+    signal_log.record('rel batch postdelete', sender, signal=kwargs['signal'],
+                      pk=tuple(kwargs['pks']))
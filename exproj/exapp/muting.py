@@ -0,0 +1,165 @@
+"""
+Muting chosen receivers in the current thread only, eg. during an import.
+
+    log = MutedLog()
+    with muted(post_save, sender=Customer, receivers=['post_customer_save'], log=log):
+        import_customers()                  # post_customer_save doesn't run
+    log.replay()                            # now it does, once per row
+
+Receivers are named by ``receiver_label`` (``exapp.models.post_customer_save``)
+or bare name, or given as the functions themselves; ``receivers=None``
+mutes every receiver of ``signal`` for ``sender`` (None: any sender).  Other
+threads keep calling them, and so, where ``contextvars`` exists (Python
+3.7+), do other asyncio tasks.
+
+A signal nobody is muting dispatches exactly as before: the first active
+``muted()`` block for it installs a receiver wrapper (see
+``exapp.dispatch``) and the last one to exit removes it.
+
+With ``log``, muted calls are kept in a ``MutedLog`` with one entry per
+(signal, sender, pk) holding the latest kwargs, the way
+``deferred_signals()`` queues them, and ``log.replay()`` delivers them as
+one batch, loading declared prefetches once.
+"""
+import collections
+import functools
+import threading
+
+from django.utils import six
+
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
+from . import dispatch
+from .deferred import DeferredQueue
+from .dispatch import receiver_label
+
+
+if contextvars is not None:
+    _active = contextvars.ContextVar('exapp_muted', default=())
+
+    def _current():
+        return _active.get()
+
+    def _push(mute):
+        return _active.set(_active.get() + (mute,))
+
+    def _pop(token):
+        _active.reset(token)
+else:
+    _state = threading.local()
+
+    def _current():
+        return getattr(_state, 'active', ())
+
+    def _push(mute):
+        previous = _current()
+        _state.active = previous + (mute,)
+        return previous
+
+    def _pop(previous):
+        _state.active = previous
+
+_lock = threading.Lock()
+_users = collections.Counter()
+
+
+def _names(receiver):
+    # On Python 3 the label is built from __qualname__, which functools.wraps
+    # and renaming leave different from __name__; accept either spelling.
+    label = receiver_label(receiver)
+    names = set([label, label.rsplit('.', 1)[-1]])
+    func = getattr(receiver, '__func__', receiver)
+    name = getattr(func, '__name__', None)
+    if name is not None:
+        names.add(name)
+        module = getattr(func, '__module__', None)
+        if module:
+            names.add('%s.%s' % (module, name))
+    return names
+
+
+def _wrap(signal, sender, receiver):
+    for mute in _current():
+        if mute.matches(signal, sender, receiver):
+            return mute.stub(signal, receiver)
+    return receiver
+
+
+class MutedLog(DeferredQueue):
+    """Muted receiver calls, merged per row, waiting for ``replay()``."""
+
+    def __init__(self):
+        super(MutedLog, self).__init__()
+        self._lock = threading.Lock()
+
+    def add(self, receiver, signal, sender, kwargs):
+        with self._lock:
+            super(MutedLog, self).add(receiver, signal, sender, kwargs)
+
+    def replay(self):
+        queue = DeferredQueue()
+        with self._lock:
+            queue.events, self.events = self.events, queue.events
+        queue.flush()
+
+
+class muted(object):
+    """
+    Context manager (and decorator) skipping ``receivers`` of ``signal``
+    for ``sender`` in the current thread; ``count`` is the number of calls
+    skipped.
+    """
+
+    def __init__(self, signal, sender=None, receivers=None, log=None):
+        self.signal = signal
+        self.sender = sender
+        self.receivers = receivers
+        if receivers is None:
+            self.names = None
+        else:
+            self.names = frozenset(r if isinstance(r, six.string_types) else receiver_label(r)
+                                   for r in receivers)
+        self.log = log
+        self.count = 0
+        self._tokens = []
+
+    def matches(self, signal, sender, receiver):
+        if signal is not self.signal or (self.sender is not None and sender is not self.sender):
+            return False
+        if self.names is None:
+            return True
+        return not self.names.isdisjoint(_names(receiver))
+
+    def stub(self, signal, receiver):
+        def muted_receiver(sender, **kwargs):
+            self.count += 1
+            if self.log is not None:
+                self.log.add(receiver, signal, sender, kwargs)
+        muted_receiver.wrapped_receiver = receiver
+        return muted_receiver
+
+    def __enter__(self):
+        with _lock:
+            if not _users[self.signal]:
+                dispatch.add_wrapper(self.signal, _wrap, innermost=True)
+            _users[self.signal] += 1
+        self._tokens.append(_push(self))
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        _pop(self._tokens.pop())
+        with _lock:
+            _users[self.signal] -= 1
+            if not _users[self.signal]:
+                del _users[self.signal]
+                dispatch.remove_wrapper(self.signal, _wrap)
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            with self.__class__(self.signal, self.sender, self.receivers, self.log):
+                return func(*args, **kwargs)
+        return inner
@@ -0,0 +1,222 @@
+"""
+Transactional outbox for model events consumed outside this process.
+
+Receivers connected here add one compact ``SignalOutbox`` row per
+post_save/post_delete (and per pk of the batched save/delete signals)
+on the same database connection.  That means inside the writer's
+transaction: the event is durable exactly when the write commits, and
+the write pays for one INSERT, however slow the consumer is.
+``relay_signals`` drains the table in large batches, oldest first,
+sending each batch to a sink before deleting its rows:
+
+    ./manage.py relay_signals --file /var/spool/exapp/events.jsonl
+
+Delivery is at least once: a batch whose rows could not be deleted after
+a successful send is sent again, and a batch the sink fails to take is
+retried after a growing pause.  Run one relay per database.
+
+Set ``SIGNAL_OUTBOX = {}`` to enable it for ``DEFAULT_MODELS``, or give
+``models`` (labels), ``sink`` (dotted path, default ``FileSink``) and
+``sink_options`` (constructor arguments for the configured sink, also used
+when ``--sink`` names the same class).
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import signals as model_signals
+from django.db.models.sql import DeleteQuery
+from django.utils.module_loading import import_string
+
+from . import signals as exapp_signals
+from .recording import signal_name
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODELS = ('exapp.Customer', 'exapp.Company', 'exapp.CustomerCategoryRel')
+DEFAULT_BATCH_SIZE = 1000
+DISPATCH_UID = 'exapp.outbox'
+# Seconds to wait before retrying a failed batch, doubled per failure.
+RETRY_BACKOFF = 1.0
+MAX_RETRY_BACKOFF = 60.0
+
+SIGNALS = (
+    model_signals.post_save,
+    model_signals.post_delete,
+    exapp_signals.post_bulk_save,
+    exapp_signals.post_bulk_delete,
+)
+
+
+def _outbox_model():
+    from .models import SignalOutbox
+    return SignalOutbox
+
+
+def _changed_fields(kwargs):
+    if kwargs.get('update_fields') is not None:
+        return kwargs['update_fields']
+    if kwargs['signal'] is not model_signals.post_save:
+        return ()
+    return getattr(kwargs['instance'], 'saved_changes', None) or ()
+
+
+def outbox_receiver(sender, **kwargs):
+    """Add ``sender``'s event to the outbox, on the connection that sent it."""
+    SignalOutbox = _outbox_model()
+    common = {
+        'signal': signal_name(kwargs['signal']),
+        'model': '%s.%s' % (sender._meta.app_label, sender._meta.object_name),
+        'created': bool(kwargs.get('created')),
+        'fields': ','.join(sorted(_changed_fields(kwargs))),
+    }
+    if 'pks' in kwargs:
+        pks = kwargs['pks']
+        rows = [SignalOutbox(object_pk=None, **common)] if pks is None else [
+            SignalOutbox(object_pk=str(pk), **common) for pk in pks]
+    else:
+        rows = [SignalOutbox(object_pk=str(kwargs['instance'].pk), **common)]
+    # bulk_create sends no signals of its own.
+    SignalOutbox.objects.using(kwargs.get('using') or DEFAULT_DB_ALIAS).bulk_create(rows)
+
+
+def connect(models):
+    """Send the events of ``models`` (classes) to the outbox."""
+    for model in models:
+        for signal in SIGNALS:
+            signal.connect(outbox_receiver, sender=model, weak=False,
+                           dispatch_uid=DISPATCH_UID)
+
+
+def disconnect(models):
+    for model in models:
+        for signal in SIGNALS:
+            signal.disconnect(sender=model, dispatch_uid=DISPATCH_UID)
+
+
+class Sink(object):
+    """Where ``relay()`` sends events; ``send()`` raises if a batch wasn't taken."""
+
+    def send(self, events):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileSink(Sink):
+    """Appends events to ``path`` as JSON lines, synced to disk per batch."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, events):
+        with open(self.path, 'a') as f:
+            for event in events:
+                f.write(json.dumps(event, sort_keys=True))
+                f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class MemorySink(Sink):
+    """Keeps sent batches in ``batches``; a stand-in queue for tests."""
+
+    def __init__(self):
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def send(self, events):
+        with self._lock:
+            self.batches.append(list(events))
+
+    @property
+    def events(self):
+        return [event for batch in self.batches for event in batch]
+
+
+def get_sink(sink_class=None, **options):
+    """
+    Instantiate the sink at dotted ``sink_class``, default from the setting.
+    ``options`` override the configured ``sink_options`` when the class is
+    the configured one.
+    """
+    config = getattr(settings, 'SIGNAL_OUTBOX', None) or {}
+    configured = config.get('sink', 'exapp.outbox.FileSink')
+    if sink_class is None:
+        sink_class = configured
+    if sink_class == configured:
+        options = dict(config.get('sink_options', {}), **options)
+    return import_string(sink_class)(**options)
+
+
+def _event(row):
+    id_, timestamp, signal, model, pk, created, fields = row
+    return {
+        'id': id_,
+        'timestamp': timestamp.isoformat(),
+        'signal': signal,
+        'model': model,
+        'pk': pk,
+        'created': created,
+        'fields': fields.split(',') if fields else [],
+    }
+
+
+def relay_batch(sink, batch_size=DEFAULT_BATCH_SIZE, using=DEFAULT_DB_ALIAS):
+    """
+    Send the oldest ``batch_size`` pending events to ``sink``, then delete
+    them; returns how many were sent.  If the sink raises, nothing is
+    deleted.
+    """
+    SignalOutbox = _outbox_model()
+    rows = list(SignalOutbox.objects.using(using).order_by('pk').values_list(
+        'pk', 'timestamp', 'signal', 'model', 'object_pk', 'created', 'fields')[:batch_size])
+    if not rows:
+        return 0
+    sink.send([_event(row) for row in rows])
+    # By pk rather than by range: a transaction that commits late can leave a
+    # lower id behind the ones just read.
+    DeleteQuery(SignalOutbox).delete_batch([row[0] for row in rows], using)
+    return len(rows)
+
+
+def relay(sink, batch_size=DEFAULT_BATCH_SIZE, using=DEFAULT_DB_ALIAS,
+          backoff=RETRY_BACKOFF, max_attempts=None):
+    """
+    Relay batches until the outbox is empty; returns how many events were
+    sent.  A batch that fails is logged and retried after ``backoff``
+    seconds, doubling up to ``MAX_RETRY_BACKOFF``; after ``max_attempts``
+    failures in a row (None: never) the last error is raised.
+    """
+    total = 0
+    failures = 0
+    while True:
+        try:
+            sent = relay_batch(sink, batch_size=batch_size, using=using)
+        except Exception:
+            failures += 1
+            if max_attempts is not None and failures >= max_attempts:
+                raise
+            delay = min(backoff * 2 ** (failures - 1), MAX_RETRY_BACKOFF)
+            logger.exception("Relaying outbox events failed; retrying in %.1fs", delay)
+            time.sleep(delay)
+            continue
+        failures = 0
+        total += sent
+        if sent < batch_size:
+            return total
+
+
+def configure():
+    """Apply the ``SIGNAL_OUTBOX`` setting; called from ``AppConfig.ready``."""
+    config = getattr(settings, 'SIGNAL_OUTBOX', None)
+    if config is None:
+        return
+    from django.apps import apps
+    connect([apps.get_model(label) for label in config.get('models', DEFAULT_MODELS)])
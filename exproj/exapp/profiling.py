@@ -0,0 +1,263 @@
+"""
+Per-receiver timing for signal dispatch.
+
+    profiler = profiling.enable()
+    ...
+    for row in profiler.report():
+        print(row['receiver'], row['calls'], row['p99_ms'])
+
+While enabled, every receiver called through an instrumented signal (all of
+Django's model signals and ``exapp.signals`` by default) is timed, and call
+counts, total time, a latency histogram and exceptions are kept per
+(signal, sender, receiver).  Timing is added with ``exapp.dispatch``
+receiver wrappers, which ``disable()`` removes again, so a disabled profiler
+costs nothing at dispatch time.
+
+Reports are available from ``Profiler.report()``, the ``signal_profile``
+management command, and a JSON file rewritten every ``interval`` seconds
+when ``SIGNAL_PROFILE = {'enabled': True, 'dump_path': ..., 'interval': 60}``
+is set.
+"""
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from . import dispatch
+from .dispatch import receiver_label, sender_label
+from .recording import known_signals, signal_name
+
+
+logger = logging.getLogger(__name__)
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+DEFAULT_OPTIONS = {'enabled': False, 'dump_path': None, 'interval': 60}
+
+# Histogram buckets grow by 2 ** (1 / BUCKETS_PER_OCTAVE), ie. about 19%,
+# which bounds the error of the reported percentiles.
+BUCKETS_PER_OCTAVE = 4
+
+
+class Histogram(object):
+    """Log-bucketed latency histogram over seconds."""
+
+    __slots__ = ('buckets', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        micros = seconds * 1e6
+        index = int(math.floor(math.log(micros, 2) * BUCKETS_PER_OCTAVE)) if micros >= 1 else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the ``p``th percentile, in seconds."""
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(self.count * p / 100.0)))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                upper = 2 ** ((index + 1) / float(BUCKETS_PER_OCTAVE)) / 1e6
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+
+class ReceiverStats(object):
+
+    __slots__ = ('signal', 'sender', 'receiver', 'histogram', 'errors', 'last_error')
+
+    def __init__(self, signal, sender, receiver):
+        self.signal = signal
+        self.sender = sender
+        self.receiver = receiver
+        self.histogram = Histogram()
+        self.errors = 0
+        self.last_error = None
+
+    def as_dict(self):
+        hist = self.histogram
+
+        def ms(seconds):
+            return None if seconds is None else seconds * 1000
+
+        return {
+            'signal': self.signal,
+            'sender': self.sender,
+            'receiver': self.receiver,
+            'calls': hist.count,
+            'total_ms': ms(hist.total),
+            'mean_ms': ms(hist.total / hist.count) if hist.count else None,
+            'p50_ms': ms(hist.percentile(50)),
+            'p95_ms': ms(hist.percentile(95)),
+            'p99_ms': ms(hist.percentile(99)),
+            'max_ms': ms(hist.max),
+            'errors': self.errors,
+            'last_error': self.last_error,
+        }
+
+
+class _Timed(object):
+    """Stands in for one receiver during one send."""
+
+    __slots__ = ('profiler', 'receiver', 'key')
+
+    def __init__(self, profiler, receiver, key):
+        self.profiler = profiler
+        self.receiver = receiver
+        self.key = key
+
+    @property
+    def wrapped_receiver(self):
+        return self.receiver
+
+    def __call__(self, **kwargs):
+        start = timer()
+        try:
+            result = self.receiver(**kwargs)
+        except Exception as e:
+            self.profiler._observe(self.key, timer() - start, e)
+            raise
+        self.profiler._observe(self.key, timer() - start)
+        return result
+
+
+class Profiler(object):
+
+    def __init__(self, signals=None):
+        self.signals = list(signals) if signals is not None else known_signals()
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.enabled = False
+        self._timer = None
+
+    def _observe(self, key, elapsed, error=None):
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                signal, sender, label = key
+                stats = self._stats[key] = ReceiverStats(
+                    signal_name(signal), sender_label(sender), label)
+            stats.histogram.add(elapsed)
+            if error is not None:
+                stats.errors += 1
+                stats.last_error = '%s: %s' % (type(error).__name__, error)
+
+    def _wrap(self, signal, sender, receiver):
+        return _Timed(self, receiver, (signal, sender, receiver_label(receiver)))
+
+    def enable(self):
+        if not self.enabled:
+            for signal in self.signals:
+                dispatch.add_wrapper(signal, self._wrap)
+            self.enabled = True
+        return self
+
+    def disable(self):
+        if self.enabled:
+            for signal in self.signals:
+                dispatch.remove_wrapper(signal, self._wrap)
+            self.enabled = False
+        self.stop_dumping()
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def report(self, sort='total_ms'):
+        """One dict per (signal, sender, receiver), slowest first."""
+        with self._lock:
+            rows = [stats.as_dict() for stats in self._stats.values()]
+        rows.sort(key=lambda row: row[sort] or 0, reverse=True)
+        return rows
+
+    def dump(self, path):
+        """Atomically write the current report to ``path`` as JSON."""
+        data = {'generated': time.time(), 'pid': os.getpid(), 'receivers': self.report()}
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.signal_profile')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.rename(tmp, path)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def start_dumping(self, path, interval=60):
+        """
+        Rewrite ``path`` every ``interval`` seconds from a daemon timer.  A
+        failed dump is logged and tried again at the next tick.
+        """
+        self.stop_dumping()
+
+        def _tick():
+            try:
+                self.dump(path)
+            except Exception:
+                logger.exception("Writing the signal profile to %s failed", path)
+            if self._timer is timer:
+                self.start_dumping(path, interval)
+
+        timer = self._timer = threading.Timer(interval, _tick)
+        timer.daemon = True
+        timer.start()
+
+    def stop_dumping(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+_profiler = None
+
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def enable(signals=None):
+    """Enable the process-wide profiler (optionally for ``signals`` only)."""
+    global _profiler
+    if signals is not None:
+        disable()
+        _profiler = Profiler(signals)
+    return get_profiler().enable()
+
+
+def disable():
+    if _profiler is not None:
+        _profiler.disable()
+
+
+def configure():
+    """Apply the ``SIGNAL_PROFILE`` setting; called from ``AppConfig.ready``."""
+    options = dict(DEFAULT_OPTIONS, **getattr(settings, 'SIGNAL_PROFILE', {}))
+    if not options['enabled']:
+        return None
+    profiler = enable()
+    if options['dump_path']:
+        profiler.start_dumping(options['dump_path'], options['interval'])
+    return profiler
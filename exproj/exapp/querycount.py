@@ -0,0 +1,216 @@
+"""
+Counting of SQL queries without relying on ``connection.queries_log``.
+
+``queries_log`` is a bounded deque, so it stops growing after 9000 queries;
+``QueryCounter`` instead wraps the connection's cursors, debug or not, and
+counts every ``execute``/``executemany`` call.  Debug cursors keep logging
+underneath, so ``connection.queries`` and ``assertNumQueries`` still work.
+``ReceiverQueryTracker`` additionally attributes each query to the signal
+receiver that issued it.
+"""
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.utils import CursorWrapper
+from django.utils import six
+
+from . import dispatch
+from .dispatch import receiver_label, sender_label
+from .recording import known_signals, signal_name
+
+
+class CountingCursorWrapper(CursorWrapper):
+
+    def __init__(self, cursor, db, counter):
+        super(CountingCursorWrapper, self).__init__(cursor, db)
+        self.counter = counter
+
+    def execute(self, sql, params=None):
+        self.counter.count_query(sql)
+        return super(CountingCursorWrapper, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.counter.count_query(sql)
+        return super(CountingCursorWrapper, self).executemany(sql, param_list)
+
+
+class QueryCounter(object):
+    """
+    Context manager counting queries issued on one connection.
+
+        with QueryCounter() as counter:
+            customer.save()
+        counter.count  # -> 1
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+        self.count = 0
+
+    def count_query(self, sql):
+        self.count += 1
+
+    def __enter__(self):
+        # Wrap whichever cursors the connection would make, so a debug
+        # cursor still logs to ``connection.queries`` (and assertNumQueries).
+        conn = self.connection
+        self._saved = {}
+        for name in ('make_cursor', 'make_debug_cursor'):
+            self._saved[name] = conn.__dict__.get(name)
+            setattr(conn, name, self._counting(getattr(conn, name)))
+        return self
+
+    def _counting(self, make_cursor):
+        def _make_cursor(cursor):
+            return CountingCursorWrapper(make_cursor(cursor), self.connection, self)
+        return _make_cursor
+
+    def __exit__(self, exc_type, exc_value, tb):
+        conn = self.connection
+        for name, saved in self._saved.items():
+            if saved is None:
+                del conn.__dict__[name]
+            else:
+                setattr(conn, name, saved)
+
+
+class ReceiverQueryStats(object):
+
+    __slots__ = ('signal', 'sender', 'receiver', 'calls', 'queries', 'max_queries',
+                 'sample_sql')
+
+    def __init__(self, signal, sender, receiver):
+        self.signal = signal
+        self.sender = sender
+        self.receiver = receiver
+        self.calls = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.sample_sql = []
+
+    def as_dict(self):
+        return {
+            'signal': self.signal,
+            'sender': self.sender,
+            'receiver': self.receiver,
+            'calls': self.calls,
+            'queries': self.queries,
+            'max_queries': self.max_queries,
+            'sample_sql': list(self.sample_sql),
+        }
+
+
+class _Attributed(object):
+    """Stands in for one receiver during one send, attributing its queries."""
+
+    __slots__ = ('tracker', 'receiver', 'key')
+
+    def __init__(self, tracker, receiver, key):
+        self.tracker = tracker
+        self.receiver = receiver
+        self.key = key
+
+    @property
+    def wrapped_receiver(self):
+        return self.receiver
+
+    def __call__(self, **kwargs):
+        frame = [self.key, 0]
+        stack = self.tracker._stack()
+        stack.append(frame)
+        try:
+            return self.receiver(**kwargs)
+        finally:
+            stack.pop()
+            self.tracker._finish_call(frame)
+
+
+class ReceiverQueryTracker(QueryCounter):
+    """
+    Context manager attributing each query to the receiver that issued it
+    and the signal that called the receiver.
+
+        with ReceiverQueryTracker() as tracker:
+            customer.save()
+        tracker.report()  # -> [{'signal': 'post_save', 'receiver': ..., 'queries': 1, ...}]
+
+    Counts are exclusive: a query made by a receiver of a signal sent from
+    inside another receiver is attributed to the inner receiver only.
+    Queries made outside any receiver are only included in ``count``.
+    Receivers that run later (``deferred_receiver`` after commit,
+    ``async_receiver`` on a pool) are attributed when called through a
+    signal, not when their queued call runs.
+    """
+
+    SAMPLE_SIZE = 5
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, signals=None):
+        super(ReceiverQueryTracker, self).__init__(using)
+        self.signals = list(signals) if signals is not None else known_signals()
+        self.stats = {}
+        self._local = threading.local()
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    def _wrap(self, signal, sender, receiver):
+        return _Attributed(self, receiver, (signal, sender, receiver_label(receiver)))
+
+    def count_query(self, sql):
+        super(ReceiverQueryTracker, self).count_query(sql)
+        stack = self._stack()
+        if stack:
+            frame = stack[-1]
+            frame[1] += 1
+            stats = self._stats_for(frame[0])
+            if len(stats.sample_sql) < self.SAMPLE_SIZE:
+                stats.sample_sql.append(sql)
+
+    def _stats_for(self, key):
+        stats = self.stats.get(key)
+        if stats is None:
+            signal, sender, label = key
+            stats = self.stats[key] = ReceiverQueryStats(
+                signal_name(signal), sender_label(sender), label)
+        return stats
+
+    def _finish_call(self, frame):
+        key, queries = frame
+        stats = self._stats_for(key)
+        stats.calls += 1
+        stats.queries += queries
+        stats.max_queries = max(stats.max_queries, queries)
+
+    def report(self, signal=None, sender=None):
+        """
+        One dict per (signal, sender, receiver), most queries first,
+        optionally only for ``signal``/``sender`` (names or objects).
+        """
+        if signal is not None and not isinstance(signal, six.string_types):
+            signal = signal_name(signal)
+        if sender is not None and not isinstance(sender, six.string_types):
+            sender = sender_label(sender)
+        rows = [stats.as_dict() for stats in self.stats.values()
+                if (signal is None or stats.signal == signal) and
+                (sender is None or stats.sender == sender)]
+        rows.sort(key=lambda row: row['queries'], reverse=True)
+        return rows
+
+    def reset(self):
+        self.count = 0
+        self.stats.clear()
+
+    def __enter__(self):
+        super(ReceiverQueryTracker, self).__enter__()
+        for signal in self.signals:
+            dispatch.add_wrapper(signal, self._wrap)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        for signal in self.signals:
+            dispatch.remove_wrapper(signal, self._wrap)
+        super(ReceiverQueryTracker, self).__exit__(exc_type, exc_value, tb)
@@ -0,0 +1,171 @@
+"""
+Bounded, low-memory storage for signals observed by the receivers in
+``exapp.models``.
+
+A ``SignalLog`` keeps one ring buffer per key (eg. 'customer presave'), so
+long-running processes only ever hold the most recent ``capacity`` records
+per key.  Records store the sender, signal name, pk and a monotonic
+timestamp rather than the full kwargs dict.
+"""
+import collections
+import time
+import weakref
+
+from django.db.models import signals as model_signals
+
+from . import signals as exapp_signals
+
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+DEFAULT_CAPACITY = 1000
+
+_SIGNAL_NAMES = dict(
+    (signal, name)
+    for module in (model_signals, exapp_signals)
+    for name, signal in vars(module).items()
+    if isinstance(signal, model_signals.Signal)
+)
+
+
+def known_signals():
+    """Django's model signals and ``exapp.signals``, the ones ``signal_name`` knows."""
+    return list(_SIGNAL_NAMES)
+
+
+def signal_name(signal):
+    """Human readable name for a signal instance, eg. 'post_save'."""
+    if signal is None:
+        return None
+    try:
+        return _SIGNAL_NAMES[signal]
+    except (KeyError, TypeError):
+        return getattr(signal, 'name', None) or repr(signal)
+
+
+class SignalRecord(object):
+    """
+    One observed signal.
+
+    For backward compatibility with the old ``(sender, kwargs)`` tuples,
+    ``record[0]`` is the sender and ``record[1]`` is a small dict holding the
+    instance (if it is still retained).
+    """
+
+    __slots__ = ('sender', 'signal', 'pk', 'timestamp', '_instance', '_weak')
+
+    def __init__(self, sender, signal, pk, timestamp, instance=None, weak=False):
+        self.sender = sender
+        self.signal = signal
+        self.pk = pk
+        self.timestamp = timestamp
+        self._weak = weak
+        if instance is not None and weak:
+            instance = weakref.ref(instance)
+        self._instance = instance
+
+    @property
+    def instance(self):
+        """The instance, or None if not retained or already collected."""
+        if self._weak and self._instance is not None:
+            return self._instance()
+        return self._instance
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, index):
+        if index in (0, -2):
+            return self.sender
+        if index in (1, -1):
+            return {'instance': self.instance}
+        raise IndexError(index)
+
+    def __repr__(self):
+        return '<SignalRecord %s %s pk=%r>' % (
+            getattr(self.sender, '__name__', self.sender), self.signal, self.pk)
+
+
+class SignalLog(object):
+    """
+    Dict-like mapping of key -> recent ``SignalRecord`` objects.
+
+    ``capacity`` bounds each key's buffer; ``capacities`` overrides it for
+    individual keys.  Pass ``keep_instances=False`` to never retain
+    instances, or ``weak=True`` to retain them only by weak reference.
+
+    Unlike ``defaultdict``, reading a missing key does not create it.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, capacities=None,
+                 keep_instances=True, weak=False):
+        if capacity is not None and capacity < 1:
+            raise ValueError("capacity must be at least 1, got %r" % capacity)
+        self.capacity = capacity
+        self.capacities = dict(capacities or {})
+        self.keep_instances = keep_instances
+        self.weak = weak
+        self._buffers = collections.OrderedDict()
+
+    def _buffer(self, key):
+        try:
+            return self._buffers[key]
+        except KeyError:
+            maxlen = self.capacities.get(key, self.capacity)
+            buf = self._buffers[key] = collections.deque(maxlen=maxlen)
+            return buf
+
+    def record(self, key, sender, signal=None, instance=None, pk=None):
+        """Append a record for ``key``, evicting the oldest if full."""
+        if pk is None and instance is not None:
+            pk = instance.pk
+        if not self.keep_instances:
+            instance = None
+        rec = SignalRecord(sender, signal_name(signal), pk, monotonic(),
+                           instance=instance, weak=self.weak)
+        self._buffer(key).append(rec)
+        return rec
+
+    def record_signal(self, key, sender, kwargs):
+        """Record straight from a receiver's ``sender, **kwargs``."""
+        return self.record(key, sender, signal=kwargs.get('signal'),
+                           instance=kwargs.get('instance'))
+
+    def record_event(self, key, event):
+        """Record from an ``exapp.events.SignalEvent``."""
+        return self.record(key, event.sender, signal=event.signal,
+                           instance=event.instance, pk=event.pk)
+
+    def __getitem__(self, key):
+        buf = self._buffers.get(key)
+        return list(buf) if buf is not None else []
+
+    def get(self, key, default=None):
+        if key in self._buffers:
+            return self[key]
+        return default
+
+    def __contains__(self, key):
+        return key in self._buffers
+
+    def __iter__(self):
+        return iter(list(self._buffers))
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def keys(self):
+        return list(self._buffers)
+
+    def values(self):
+        return [list(buf) for buf in self._buffers.values()]
+
+    def items(self):
+        return [(key, list(buf)) for key, buf in self._buffers.items()]
+
+    def clear(self):
+        self._buffers.clear()
+
+    def __repr__(self):
+        return '<SignalLog %r>' % dict(
+            (key, len(buf)) for key, buf in self._buffers.items())
@@ -0,0 +1,255 @@
+"""
+Bulk relation changes that send one batched signal instead of one per object.
+
+Depending on the Django version, ``company.customers.add(...)`` either saves
+every customer (1.8, firing a pre_save/post_save pair for each) or issues a
+single UPDATE and fires nothing (1.9+).  The helpers here always issue
+batched queries and always send exactly one ``pre_bulk_related_save`` and one
+``post_bulk_related_save`` per action, carrying every affected pk:
+
+    bulk_add(company, 'customers', customers)
+    bulk_set(customer, 'categories_direct', [cat1, cat2])
+
+Supported relations are reverse foreign keys and many-to-many fields in
+either direction, with or without a ``through`` model.  Rows of a custom
+``through`` model are written with ``bulk_create_with_signals()`` and
+``planned_delete()`` (see ``exapp.managers`` and ``exapp.deletion``), so its
+receivers get ``pre_bulk_save``/``post_bulk_save`` and
+``pre_bulk_delete``/``post_bulk_delete`` rather than per-row signals.
+"""
+import contextlib
+
+from django.db import router, transaction
+
+from . import relation_signals, topology
+from .deletion import planned_delete
+from .managers import SignalQuerySet
+from .signals import pre_bulk_related_save, post_bulk_related_save
+
+
+# Keeps ``pk__in`` lookups under SQLite's bound-parameter limit.
+BATCH_SIZE = 500
+
+REVERSE_FK = 'reverse_fk'
+M2M = 'm2m'
+
+
+class RelationInfo(object):
+    """How to change a to-many relation, as seen from ``model.accessor``."""
+
+    __slots__ = ('model', 'accessor', 'kind', 'related_model', 'field',
+                 'through', 'source_field_name', 'target_field_name', 'target_attname')
+
+    def __init__(self, model, accessor):
+        self.model = model
+        self.accessor = accessor
+        relation = topology.get_topology().get(model, accessor)
+        if relation is None or not relation.to_many:
+            raise ValueError("%s.%s is not a to-many relation" % (
+                model._meta.object_name, accessor))
+        self.related_model = relation.related_model
+        self.field = relation.field
+        self.through = relation.through
+        self.source_field_name = self.target_field_name = self.target_attname = None
+        if relation.kind == topology.M2M:
+            self.kind = M2M
+            self.source_field_name = relation.source_field.name
+            self.target_field_name = relation.target_field.name
+            self.target_attname = relation.target_field.attname
+        else:
+            self.kind = REVERSE_FK
+
+    @property
+    def has_custom_through(self):
+        return self.through is not None and not self.through._meta.auto_created
+
+
+_relation_cache = {}
+
+
+def relation_info(model, accessor):
+    key = (model, accessor)
+    try:
+        return _relation_cache[key]
+    except KeyError:
+        info = _relation_cache[key] = RelationInfo(model, accessor)
+        return info
+
+
+def _batches(seq, size=BATCH_SIZE):
+    for start in range(0, len(seq), size):
+        yield seq[start:start + size]
+
+
+def _pks(info, objs):
+    pks = []
+    seen = set()
+    for obj in objs:
+        if not isinstance(obj, info.related_model):
+            raise TypeError("'%s' instance expected, got %r" % (
+                info.related_model._meta.object_name, obj))
+        if obj.pk is None:
+            raise ValueError("%r instance isn't saved. Save it before relating it." % obj)
+        if obj.pk not in seen:
+            seen.add(obj.pk)
+            pks.append(obj.pk)
+    return pks
+
+
+def _current_pks(info, instance, using):
+    if info.kind == REVERSE_FK:
+        qs = info.related_model._base_manager.using(using).filter(
+            **{info.field.name: instance})
+        return list(qs.values_list('pk', flat=True))
+    qs = info.through._base_manager.using(using).filter(
+        **{info.source_field_name: instance})
+    return list(qs.values_list(info.target_attname, flat=True))
+
+
+def _report(info, instance, using, **kwargs):
+    # Queryset updates and bulk creates fire no model signals; tell
+    # relation_signals what changed.  Direct M2M changes are reported
+    # through m2m_changed already.
+    spec = relation_signals.spec_for(info.model, info.accessor)
+    if spec is not None:
+        relation_signals.emit(spec, instance, using=using, **kwargs)
+
+
+def _add(info, instance, objs, pks, using):
+    if info.kind == REVERSE_FK:
+        manager = info.related_model._base_manager.using(using)
+        for batch in _batches(pks):
+            manager.filter(pk__in=batch).update(**{info.field.name: instance})
+        previous = {}
+        for obj in objs:
+            previous[obj.pk] = relation_signals.snapshot_value(obj, info.field)
+            setattr(obj, info.field.name, instance)
+            relation_signals.set_snapshot_value(obj, info.field, instance.pk)
+        _report(info, instance, using, added=pks, previous=previous)
+    elif not info.has_custom_through:
+        manager = getattr(instance, info.accessor)
+        for batch in _batches(pks):
+            manager.add(*batch)
+    else:
+        existing = set(_current_pks(info, instance, using))
+        new = [pk for pk in pks if pk not in existing]
+        SignalQuerySet(info.through, using=using).bulk_create_with_signals([
+            info.through(**{info.source_field_name: instance, info.target_attname: pk})
+            for pk in new
+        ], batch_size=BATCH_SIZE)
+        _report(info, instance, using, added=new)
+
+
+def _remove(info, instance, objs, pks, using):
+    if info.kind == REVERSE_FK:
+        if not info.field.null:
+            raise ValueError("Cannot remove from %s.%s: %s.%s is not nullable" % (
+                info.model._meta.object_name, info.accessor,
+                info.related_model._meta.object_name, info.field.name))
+        manager = info.related_model._base_manager.using(using)
+        for batch in _batches(pks):
+            manager.filter(pk__in=batch, **{info.field.name: instance}).update(
+                **{info.field.name: None})
+        for obj in objs:
+            if getattr(obj, info.field.attname) == instance.pk:
+                setattr(obj, info.field.name, None)
+            relation_signals.set_snapshot_value(obj, info.field, None)
+        _report(info, instance, using, removed=pks)
+    elif not info.has_custom_through:
+        manager = getattr(instance, info.accessor)
+        for batch in _batches(pks):
+            manager.remove(*batch)
+    else:
+        manager = info.through._base_manager.using(using)
+        related = dict((obj.pk, obj) for obj in objs)
+        removed = []
+        for batch in _batches(pks):
+            rows = list(manager.filter(**{
+                info.source_field_name: instance,
+                info.target_field_name + '__in': batch,
+            }))
+            for row in rows:
+                # Spares per-row delete receivers queries for both ends.
+                setattr(row, info.source_field_name, instance)
+                target = related.get(getattr(row, info.target_attname))
+                if target is not None:
+                    setattr(row, info.target_field_name, target)
+                removed.append(getattr(row, info.target_attname))
+            if rows:
+                planned_delete(rows, using=using)
+        _report(info, instance, using, removed=removed)
+
+
+def _send_bulk(info, instance, action, objs, pks, using):
+    if not pks:
+        return
+    kwargs = dict(instance=instance, relation=info.accessor, action=action,
+                  pks=pks, using=using)
+    pre_bulk_related_save.send(sender=info.related_model, **kwargs)
+    if action == 'add':
+        _add(info, instance, objs, pks, using)
+    else:
+        _remove(info, instance, objs, pks, using)
+    post_bulk_related_save.send(sender=info.related_model, **kwargs)
+
+
+def _operation(info, instance, using):
+    """Report the whole helper call as one ``related_changed``."""
+    spec = relation_signals.spec_for(info.model, info.accessor)
+    if spec is None:
+        return _null_context()
+    return relation_signals.operation(instance, spec, using=using)
+
+
+@contextlib.contextmanager
+def _null_context():
+    yield
+
+
+def _check_instance(instance):
+    if instance.pk is None:
+        raise ValueError("%r instance needs a primary key before its relations "
+                         "can be changed." % instance)
+
+
+def bulk_add(instance, accessor, objs):
+    """Relate ``objs`` to ``instance`` via ``accessor`` in batched queries."""
+    info = relation_info(type(instance), accessor)
+    _check_instance(instance)
+    objs = list(objs)
+    pks = _pks(info, objs)
+    using = router.db_for_write(info.related_model, instance=instance)
+    with transaction.atomic(using=using, savepoint=False), _operation(info, instance, using):
+        _send_bulk(info, instance, 'add', objs, pks, using)
+
+
+def bulk_remove(instance, accessor, objs):
+    """Unrelate ``objs`` from ``instance`` in batched queries."""
+    info = relation_info(type(instance), accessor)
+    _check_instance(instance)
+    objs = list(objs)
+    pks = _pks(info, objs)
+    using = router.db_for_write(info.related_model, instance=instance)
+    with transaction.atomic(using=using, savepoint=False), _operation(info, instance, using):
+        _send_bulk(info, instance, 'remove', objs, pks, using)
+
+
+def bulk_set(instance, accessor, objs):
+    """
+    Make ``objs`` the complete set related to ``instance``, sending at most
+    one 'remove' and one 'add' batch.
+    """
+    info = relation_info(type(instance), accessor)
+    _check_instance(instance)
+    objs = list(objs)
+    pks = _pks(info, objs)
+    using = router.db_for_write(info.related_model, instance=instance)
+    with transaction.atomic(using=using, savepoint=False), _operation(info, instance, using):
+        current = _current_pks(info, instance, using)
+        wanted = set(pks)
+        removed = [pk for pk in current if pk not in wanted]
+        _send_bulk(info, instance, 'remove', [], removed, using)
+        current = set(current)
+        added = [pk for pk in pks if pk not in current]
+        _send_bulk(info, instance, 'add',
+                   [obj for obj in objs if obj.pk not in current], added, using)
@@ -0,0 +1,538 @@
+"""
+One ``related_changed`` signal for every way relation membership can change.
+
+Which model signals a relation change fires depends on how it was made and
+on the Django version (see ``exproj/tests.py``): ``company.customers.add()``
+saves each customer on 1.8 but issues a bare UPDATE on 1.9+, and M2M
+changes never save the related side.  ``install()`` hooks into all of the
+paths below so that ``exapp.signals.related_changed`` is sent the same way
+on 1.8-1.11, without extra saves:
+
+* forward FK / one-to-one changes, detected on save against a snapshot of
+  the values loaded from the database;
+* reverse FK manager operations (``add``/``remove``/``clear``/``set`` and
+  assignment), via a subclass of the descriptor's related manager;
+* direct M2M changes, translated from ``m2m_changed``;
+* ``through`` M2M rows being saved or deleted;
+* deletes, which remove the deleted row from its relations;
+* ``exapp.related`` bulk helpers.
+
+A compound manager operation (eg. assignment, which is ``clear()`` followed
+by ``add()`` on 1.8 and ``set()`` on 1.9+) sends a single signal with the
+net change.  Nothing is computed or queried for a relation unless
+``related_changed`` has receivers for its sender, apart from recording
+foreign key values on save: loaded instances are only snapshotted once the
+first receiver for the relation's sender connects, and changes to instances
+loaded before that are not reported.
+"""
+import contextlib
+import threading
+
+from django.db import router
+from django.db.models import signals as model_signals
+
+from . import dispatch, topology
+from .deletion import per_instance_delete
+from .signals import related_changed
+
+
+SNAPSHOT_ATTR = '_related_snapshot'
+_CLEAR_ATTR = '_related_clear_pks'
+_DELETE_ATTR = '_related_delete_pks'
+
+FK = 'fk'
+M2M = 'm2m'
+
+_local = threading.local()
+
+
+def _active_operations():
+    try:
+        return _local.operations
+    except AttributeError:
+        operations = _local.operations = {}
+        return operations
+
+
+def _suppressed_fields():
+    try:
+        return _local.suppressed
+    except AttributeError:
+        suppressed = _local.suppressed = {}
+        return suppressed
+
+
+class RelationSpec(object):
+    """One side of a relation, as seen through ``accessor`` on ``owner``."""
+
+    __slots__ = ('sender', 'owner', 'accessor', 'field', 'reverse', 'kind',
+                 'model', 'through')
+
+    def __init__(self, owner, accessor, field, reverse, kind, model, through=None):
+        self.sender = field.model
+        self.owner = owner
+        self.accessor = accessor
+        self.field = field
+        self.reverse = reverse
+        self.kind = kind
+        self.model = model
+        self.through = through
+
+    def __repr__(self):
+        return '<RelationSpec %s.%s>' % (self.owner._meta.object_name, self.accessor)
+
+
+_specs = {}
+
+
+def spec_for(model, accessor):
+    """The ``RelationSpec`` for ``model.accessor``, or None if not tracked."""
+    return _specs.get((model, accessor))
+
+
+def _listening(spec):
+    return dispatch.has_receivers(related_changed, spec.sender)
+
+
+class RelatedChange(object):
+    """Accumulated net change to one instance's relation."""
+
+    __slots__ = ('spec', 'instance', 'added', 'removed', 'previous', 'using')
+
+    def __init__(self, spec, instance, using=None):
+        self.spec = spec
+        self.instance = instance
+        self.added = set()
+        self.removed = set()
+        self.previous = {}
+        self.using = using
+
+    def merge(self, added=(), removed=(), previous=None):
+        for pk in removed:
+            if pk in self.added:
+                self.added.discard(pk)
+            else:
+                self.removed.add(pk)
+        for pk in added:
+            if pk in self.removed:
+                self.removed.discard(pk)
+            else:
+                self.added.add(pk)
+        if previous:
+            for pk, old in previous.items():
+                self.previous.setdefault(pk, old)
+
+    def send(self):
+        if not (self.added or self.removed):
+            return
+        spec = self.spec
+        previous = None
+        if spec.kind == FK and spec.reverse:
+            previous = dict((pk, self.previous.get(pk)) for pk in self.added)
+        related_changed.send(
+            sender=spec.sender, instance=self.instance, relation=spec.accessor,
+            reverse=spec.reverse, model=spec.model, added=frozenset(self.added),
+            removed=frozenset(self.removed), previous=previous,
+            using=self.using or router.db_for_write(spec.sender, instance=self.instance))
+
+
+def emit(spec, instance, added=(), removed=(), previous=None, using=None):
+    """
+    Report a change to ``instance``'s ``spec`` relation: folded into the
+    enclosing ``operation()`` if there is one, otherwise sent immediately.
+    """
+    if not _listening(spec):
+        return
+    change = _active_operations().get((spec, instance.pk))
+    if change is None:
+        change = RelatedChange(spec, instance, using)
+        change.merge(added, removed, previous)
+        change.send()
+    else:
+        change.merge(added, removed, previous)
+
+
+@contextlib.contextmanager
+def operation(instance, spec, using=None):
+    """
+    Collect every change to ``instance``'s ``spec`` relation made inside the
+    block and send one ``related_changed`` with the net result on success.
+    Yields the ``RelatedChange``, or None if nobody is listening.
+    """
+    key = (spec, instance.pk)
+    operations = _active_operations()
+    if key in operations:
+        yield operations[key]
+        return
+    change = RelatedChange(spec, instance, using) if _listening(spec) else None
+    operations[key] = change
+    suppressed = _suppressed_fields()
+    suppressed[spec.field] = suppressed.get(spec.field, 0) + 1
+    try:
+        yield change
+    finally:
+        del operations[key]
+        suppressed[spec.field] -= 1
+        if not suppressed[spec.field]:
+            del suppressed[spec.field]
+    if change is not None:
+        change.send()
+
+
+# Snapshots of foreign key values as last loaded from or saved to the db.
+
+def _snapshot_fields(model):
+    return _tracked_fk_fields.get(model, ())
+
+
+def take_snapshot(instance, fields=None):
+    values = instance.__dict__
+    snapshot = instance.__dict__.get(SNAPSHOT_ATTR)
+    if snapshot is None:
+        snapshot = instance.__dict__[SNAPSHOT_ATTR] = {}
+    if fields is None:
+        fields = _snapshot_fields(type(instance))
+    for field in fields:
+        if field.attname in values:
+            snapshot[field.attname] = values[field.attname]
+    return snapshot
+
+
+def snapshot_value(instance, field, default=None):
+    return instance.__dict__.get(SNAPSHOT_ATTR, {}).get(field.attname, default)
+
+
+def set_snapshot_value(instance, field, value):
+    instance.__dict__.setdefault(SNAPSHOT_ATTR, {})[field.attname] = value
+
+
+def _post_init(sender, instance, **kwargs):
+    if instance.pk is not None:
+        take_snapshot(instance)
+
+
+_tracked_fk_fields = {}
+
+# related_changed sender -> models whose post_init snapshots wait for its
+# first receiver.
+_pending_snapshots = {}
+
+
+def _defer_snapshots(sender, model):
+    if dispatch.has_receivers(related_changed, sender):
+        _connect(model_signals.post_init, _post_init, model)
+    else:
+        _pending_snapshots.setdefault(sender, set()).add(model)
+
+
+def _start_snapshots(sender):
+    if sender is None:
+        models = set()
+        for pending in _pending_snapshots.values():
+            models.update(pending)
+        _pending_snapshots.clear()
+    else:
+        models = _pending_snapshots.pop(sender, ())
+    for model in models:
+        _connect(model_signals.post_init, _post_init, model)
+
+
+# Forward foreign keys and one-to-ones.
+
+def _fk_post_save(sender, instance, created, raw=False, update_fields=None, using=None,
+                  **kwargs):
+    fields = _tracked_fk_fields.get(sender, ())
+    if update_fields is not None:
+        fields = [f for f in fields if f.name in update_fields or f.attname in update_fields]
+    old = dict(instance.__dict__.get(SNAPSHOT_ATTR) or {})
+    take_snapshot(instance, fields)
+    if raw:
+        return
+    suppressed = _suppressed_fields()
+    for field in fields:
+        if field in suppressed or not (created or field.attname in old):
+            # Nothing known about the value it was loaded with.
+            continue
+        spec = _specs[(sender, field.name)]
+        if not _listening(spec):
+            continue
+        before = None if created else old.get(field.attname)
+        after = getattr(instance, field.attname)
+        if before != after:
+            emit(spec, instance,
+                 added=() if after is None else (after,),
+                 removed=() if before is None else (before,),
+                 using=using)
+
+
+@per_instance_delete
+def _fk_post_delete(sender, instance, using=None, **kwargs):
+    for field in _tracked_fk_fields.get(sender, ()):
+        spec = _specs[(sender, field.name)]
+        value = getattr(instance, field.attname)
+        if value is not None:
+            emit(spec, instance, removed=(value,), using=using)
+
+
+# Reverse foreign key managers.
+
+def _reverse_fk_manager_class(base, spec):
+    field = spec.field
+
+    class RelatedChangeManager(base):
+
+        def add(self, *objs, **kwargs):
+            with operation(self.instance, spec) as change:
+                before = [snapshot_value(obj, field) for obj in objs]
+                result = super(RelatedChangeManager, self).add(*objs, **kwargs)
+                pk = self.instance.pk
+                added, previous = [], {}
+                for obj, old in zip(objs, before):
+                    set_snapshot_value(obj, field, pk)
+                    if change is not None and (old != pk or obj.pk in change.removed):
+                        added.append(obj.pk)
+                        previous[obj.pk] = old
+                if change is not None:
+                    change.merge(added=added, previous=previous)
+            return result
+
+        if hasattr(base, 'remove'):
+            def remove(self, *objs, **kwargs):
+                with operation(self.instance, spec) as change:
+                    result = super(RelatedChangeManager, self).remove(*objs, **kwargs)
+                    for obj in objs:
+                        set_snapshot_value(obj, field, None)
+                    if change is not None:
+                        change.merge(removed=[obj.pk for obj in objs])
+                return result
+
+        if hasattr(base, 'clear'):
+            def clear(self, **kwargs):
+                with operation(self.instance, spec) as change:
+                    if change is not None:
+                        current = list(self.values_list('pk', flat=True))
+                    result = super(RelatedChangeManager, self).clear(**kwargs)
+                    if change is not None:
+                        change.merge(removed=current)
+                return result
+
+        if hasattr(base, 'set'):
+            def set(self, *args, **kwargs):
+                with operation(self.instance, spec):
+                    return super(RelatedChangeManager, self).set(*args, **kwargs)
+
+    return RelatedChangeManager
+
+
+# Many-to-many managers; the contents of the change come from m2m_changed
+# or from the through model's own signals.
+
+def _m2m_manager_class(base, spec):
+
+    class RelatedChangeManager(base):
+        pass
+
+    def wrap(name):
+        method = getattr(base, name)
+
+        def wrapper(self, *args, **kwargs):
+            with operation(self.instance, spec):
+                return method(self, *args, **kwargs)
+        wrapper.__name__ = name
+        wrapper.alters_data = True
+        setattr(RelatedChangeManager, name, wrapper)
+
+    for name in ('add', 'remove', 'clear', 'set'):
+        if hasattr(base, name):
+            wrap(name)
+    return RelatedChangeManager
+
+
+def _install_manager(owner, accessor, factory, spec):
+    descriptor = owner.__dict__[accessor]
+    base = descriptor.related_manager_cls
+    if getattr(base, 'related_change_spec', None) is spec:
+        return
+    manager_class = factory(base, spec)
+    manager_class.related_change_spec = spec
+    # Shadows the descriptor's related_manager_cls cached_property and swaps
+    # in a subclass overriding __set__.  Known to work on Django 1.8-1.11,
+    # where every reverse FK and M2M descriptor builds its manager class in
+    # that cached_property; check both again on upgrades.
+    descriptor.__dict__['related_manager_cls'] = manager_class
+    descriptor.__class__ = _assignment_descriptor_class(type(descriptor))
+
+
+_descriptor_classes = {}
+
+
+def _assignment_descriptor_class(base):
+    """
+    Run assignment (``clear()`` + ``add()`` on 1.8, ``set()`` on 1.9+) as a
+    single operation.
+    """
+    if base not in _descriptor_classes:
+        def __set__(self, instance, value):
+            spec = self.__dict__['related_manager_cls'].related_change_spec
+            with operation(instance, spec):
+                return base.__set__(self, instance, value)
+        _descriptor_classes[base] = type(base.__name__, (base,), {'__set__': __set__})
+    return _descriptor_classes[base]
+
+
+def _m2m_changed(sender, instance, action, reverse, model, pk_set, using=None, **kwargs):
+    spec = _specs.get((type(instance), _through_accessors[sender][reverse]))
+    if spec is None or not _listening(spec):
+        return
+    if action == 'post_add':
+        emit(spec, instance, added=pk_set, using=using)
+    elif action == 'post_remove':
+        emit(spec, instance, removed=pk_set, using=using)
+    elif action == 'pre_clear':
+        instance.__dict__[_CLEAR_ATTR] = _current_m2m_pks(spec, instance, using)
+    elif action == 'post_clear':
+        emit(spec, instance, removed=instance.__dict__.pop(_CLEAR_ATTR, ()), using=using)
+
+
+_through_accessors = {}
+
+
+def _current_m2m_pks(spec, instance, using=None):
+    relation = topology.get_topology().get(spec.owner, spec.accessor)
+    manager = spec.through._base_manager
+    if using:
+        manager = manager.using(using)
+    return list(manager.filter(**{relation.source_field.name: instance}).values_list(
+        relation.target_field.attname, flat=True))
+
+
+# Custom ``through`` models.
+
+_through_fields = {}
+
+
+def _through_post_save(sender, instance, created, raw=False, using=None, **kwargs):
+    spec, source, target = _through_fields[sender]
+    old = dict(instance.__dict__.get(SNAPSHOT_ATTR) or {})
+    take_snapshot(instance)
+    if raw or not _listening(spec) or not (created or target.attname in old):
+        return
+    source_id = getattr(instance, source.attname)
+    target_id = getattr(instance, target.attname)
+    old_source = None if created else old.get(source.attname)
+    old_target = None if created else old.get(target.attname)
+    if old_source is not None and old_source != source_id:
+        emit(spec, spec.owner._base_manager.get(pk=old_source), removed=(old_target,),
+             using=using)
+        old_target = None
+    if old_target != target_id:
+        emit(spec, getattr(instance, source.name),
+             added=(target_id,),
+             removed=() if old_target is None else (old_target,),
+             using=using)
+
+
+@per_instance_delete
+def _through_post_delete(sender, instance, using=None, **kwargs):
+    spec, source, target = _through_fields[sender]
+    if not _listening(spec):
+        return
+    try:
+        owner = getattr(instance, source.name)
+    except spec.owner.DoesNotExist:
+        return
+    emit(spec, owner, removed=(getattr(instance, target.attname),), using=using)
+
+
+# Deleting a row removes it from its direct M2M relations without any
+# m2m_changed; record what it was related to beforehand.
+
+_delete_m2m_specs = {}
+
+
+@per_instance_delete
+def _m2m_pre_delete(sender, instance, using=None, **kwargs):
+    pending = {}
+    for spec in _delete_m2m_specs.get(sender, ()):
+        if _listening(spec):
+            pending[spec] = _current_m2m_pks(spec, instance, using)
+    if pending:
+        instance.__dict__[_DELETE_ATTR] = pending
+
+
+@per_instance_delete
+def _m2m_post_delete(sender, instance, using=None, **kwargs):
+    for spec, pks in instance.__dict__.pop(_DELETE_ATTR, {}).items():
+        if pks:
+            emit(spec, instance, removed=pks, using=using)
+
+
+def _connect(signal, handler, sender):
+    opts = sender._meta
+    signal.connect(handler, sender=sender, weak=False, dispatch_uid='related_changed.%s.%s.%s' % (
+        handler.__name__, opts.app_label, opts.model_name))
+
+
+def install(models):
+    """Hook ``related_changed`` into every relation on ``models``."""
+    models = list(models)
+    if _start_snapshots not in related_changed.connect_hooks:
+        related_changed.connect_hooks.append(_start_snapshots)
+    index = topology.get_topology()
+    custom_throughs = set()
+    for model in models:
+        for relation in index.relations(model):
+            if relation.kind == topology.M2M and not relation.through._meta.auto_created:
+                custom_throughs.add(relation.through)
+
+    for model in models:
+        if model in custom_throughs:
+            continue
+        fk_fields = []
+        for relation in index.relations(model):
+            field, accessor = relation.field, relation.name
+            if relation.reverse:
+                # Reverse side of a relation declared on another model.
+                if relation.related_model in custom_throughs:
+                    continue
+                if relation.kind == topology.FK:
+                    spec = RelationSpec(model, accessor, field, True, FK, relation.related_model)
+                    _specs[(model, accessor)] = spec
+                    _install_manager(model, accessor, _reverse_fk_manager_class, spec)
+                elif relation.kind == topology.M2M:
+                    spec = RelationSpec(model, accessor, field, True, M2M,
+                                        relation.related_model, relation.through)
+                    _specs[(model, accessor)] = spec
+                    _install_manager(model, accessor, _m2m_manager_class, spec)
+                    if relation.through._meta.auto_created:
+                        _delete_m2m_specs.setdefault(model, []).append(spec)
+            elif relation.kind == topology.M2M:
+                through = relation.through
+                spec = RelationSpec(model, accessor, field, False, M2M,
+                                    relation.related_model, through)
+                _specs[(model, accessor)] = spec
+                _install_manager(model, accessor, _m2m_manager_class, spec)
+                if through._meta.auto_created:
+                    _through_accessors[through] = {False: accessor, True: relation.reverse_name}
+                    _connect(model_signals.m2m_changed, _m2m_changed, through)
+                    _delete_m2m_specs.setdefault(model, []).append(spec)
+                else:
+                    source, target = relation.source_field, relation.target_field
+                    _through_fields[through] = (spec, source, target)
+                    _tracked_fk_fields[through] = (source, target)
+                    _defer_snapshots(spec.sender, through)
+                    _connect(model_signals.post_save, _through_post_save, through)
+                    _connect(model_signals.post_delete, _through_post_delete, through)
+            else:
+                spec = RelationSpec(model, accessor, field, False, FK, relation.related_model)
+                _specs[(model, accessor)] = spec
+                fk_fields.append(field)
+        if fk_fields:
+            _tracked_fk_fields[model] = tuple(fk_fields)
+            for field in fk_fields:
+                _defer_snapshots(field.model, model)
+            _connect(model_signals.post_save, _fk_post_save, model)
+            _connect(model_signals.post_delete, _fk_post_delete, model)
+        if model in _delete_m2m_specs:
+            _connect(model_signals.pre_delete, _m2m_pre_delete, model)
+            _connect(model_signals.post_delete, _m2m_post_delete, model)
@@ -0,0 +1,416 @@
+"""
+LRU cache of related sets, kept correct by signals.
+
+    cache = RelatedCache(maxsize=10000)
+    cache.connect(apps.get_app_config('exapp').get_models())
+
+    cache.get(company, 'customers')      # fresh Customer instances
+    cache.get_pks(customer, 'categories_direct')
+
+Any reverse foreign key, reverse one-to-one or many-to-many accessor that
+``exapp.relation_signals`` tracks can be cached.  Entries hold the related
+rows' column values, keyed by (model, accessor, pk), and are dropped:
+
+* by ``related_changed``, for the instance whose relation changed, its
+  other side (the added/removed objects' reverse accessor) and, for
+  reverse foreign keys, the objects' previous owners;
+* when a cached row is saved or deleted, including through the batched
+  save/delete signals;
+* when the owning instance is deleted;
+* by ``remote_signal``, for changes broadcast by other processes (see
+  ``exapp.bus``), more coarsely.
+
+Changes that send no signals (``QuerySet.update()``, raw SQL) are not seen.
+
+Inside a transaction, a dropped entry is not cached again until the
+transaction ends, so uncommitted or rolled-back rows are never cached, and
+it is dropped once more on commit in case another thread cached the old
+rows meanwhile.  Django 1.8 has no commit hook; there the second drop
+happens when the writing thread next uses the cache.  A load that overlaps
+any invalidation is returned but not cached.
+
+Set ``SIGNAL_RELATED_CACHE = {'maxsize': ...}`` to create ``related_cache``
+for the exapp models at app-ready time.
+"""
+import collections
+import threading
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import signals as model_signals
+
+from . import relation_signals, signals as exapp_signals, topology
+
+
+DEFAULT_MAXSIZE = 10000
+
+
+def _concrete(model):
+    return model._meta.concrete_model
+
+
+class _Relation(object):
+    """A cacheable accessor: ``target`` rows where ``lookup`` is the owner's pk."""
+
+    __slots__ = ('owner', 'accessor', 'target', 'lookup', 'attnames', 'fk', 'sender')
+
+    def __init__(self, owner, accessor, target, lookup, fk, sender):
+        self.owner = owner
+        self.accessor = accessor
+        self.target = target
+        self.lookup = lookup
+        self.attnames = [f.attname for f in target._meta.concrete_fields]
+        self.fk = fk
+        self.sender = sender
+
+    def load(self, pk, db):
+        return tuple(self.target._base_manager.using(db).filter(**{self.lookup: pk})
+                     .order_by('pk').values_list(*self.attnames))
+
+
+class _Entry(object):
+
+    __slots__ = ('db', 'target', 'rows', 'pks')
+
+    def __init__(self, db, target, rows, pks):
+        self.db = db
+        self.target = target
+        self.rows = rows
+        self.pks = pks
+
+
+class _Marks(object):
+    """What one thread invalidated inside its current transaction."""
+
+    __slots__ = ('keys', 'members', 'relations')
+
+    def __init__(self):
+        self.keys = set()
+        self.members = set()
+        self.relations = set()
+
+
+class RelatedCache(object):
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._entries = collections.OrderedDict()
+        self._members = {}
+        self._version = 0
+        self._relations = {}
+        self._mirrors = {}
+        self._by_target = {}
+        self._remote_ends = {}
+        self._connected = []
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    # Setup
+
+    def _add_relation(self, relation):
+        self._relations[(relation.owner, relation.accessor)] = relation
+        self._by_target.setdefault(relation.target, []).append(relation)
+
+    def connect(self, models):
+        """Cache the tracked relations of ``models`` and listen for their changes."""
+        models = [_concrete(model) for model in models]
+        index = topology.get_topology()
+        for model in models:
+            for relation in index.relations(model):
+                accessor, forward = relation.name, relation.field
+                many = relation.kind == topology.M2M
+                if relation.reverse:
+                    if many:
+                        spec = relation_signals.spec_for(model, accessor)
+                    else:
+                        spec = relation_signals.spec_for(forward.model, forward.name)
+                    if spec is None:
+                        continue
+                    self._add_relation(_Relation(
+                        model, accessor, relation.related_model, forward.name,
+                        None if many else forward, spec.sender))
+                    self._mirrors[(relation.related_model, forward.name)] = (model, accessor)
+                    if many:
+                        self._mirrors[(model, accessor)] = (relation.related_model, forward.name)
+                elif many:
+                    spec = relation_signals.spec_for(model, accessor)
+                    if spec is None:
+                        continue
+                    self._add_relation(_Relation(
+                        model, accessor, relation.related_model, forward.related_query_name(),
+                        None, spec.sender))
+                    if relation.reverse_name is not None:
+                        self._mirrors[(model, accessor)] = (
+                            relation.related_model, relation.reverse_name)
+
+        uid = 'exapp.relcache.%x' % id(self)
+        senders = set(r.sender for r in self._relations.values())
+        models = set(r.owner for r in self._relations.values()) | set(self._by_target)
+        connections_ = [(exapp_signals.related_changed, self._related_changed, sender)
+                        for sender in senders]
+        connections_.append((exapp_signals.remote_signal, self._remote, None))
+        for model in models:
+            connections_.extend([
+                (model_signals.post_save, self._post_save, model),
+                (model_signals.post_delete, self._post_delete, model),
+                (exapp_signals.post_bulk_save, self._post_bulk_save, model),
+                (exapp_signals.post_bulk_delete, self._post_bulk_delete, model),
+            ])
+        for signal, receiver, sender in connections_:
+            signal.connect(receiver, sender=sender, weak=False, dispatch_uid=uid)
+            self._connected.append((signal, sender))
+        return self
+
+    def disconnect(self):
+        uid = 'exapp.relcache.%x' % id(self)
+        for signal, sender in self._connected:
+            signal.disconnect(sender=sender, dispatch_uid=uid)
+        self._connected = []
+
+    def _relation(self, instance, accessor):
+        try:
+            return self._relations[(_concrete(type(instance)), accessor)]
+        except KeyError:
+            raise ValueError("%s.%s is not a cached relation." % (
+                type(instance).__name__, accessor))
+
+    # Reads
+
+    def get(self, instance, accessor):
+        """The objects related to ``instance`` through ``accessor``, in pk order."""
+        relation = self._relation(instance, accessor)
+        db, entry = self._lookup(relation, instance)
+        return [relation.target.from_db(db, relation.attnames, row) for row in entry.rows]
+
+    def get_pks(self, instance, accessor):
+        return self._lookup(self._relation(instance, accessor), instance)[1].pks
+
+    def _lookup(self, relation, instance):
+        if instance.pk is None:
+            raise ValueError("%r must be saved before its relations can be cached." % instance)
+        db = router.db_for_read(relation.target, instance=instance)
+        self._settle(db)
+        key = (relation.owner, relation.accessor, instance.pk)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                if entry.db == db:
+                    self.hits += 1
+                    return db, entry
+            self.misses += 1
+            version = self._version
+        rows = relation.load(instance.pk, db)
+        pk_index = relation.attnames.index(relation.target._meta.pk.attname)
+        entry = _Entry(db, relation.target, rows, frozenset(row[pk_index] for row in rows))
+        self._store(key, entry, version)
+        return db, entry
+
+    def _store(self, key, entry, version):
+        with self._lock:
+            if version != self._version or self._marked(key, entry):
+                return
+            self._discard(key)
+            self._entries[key] = entry
+            target = entry.target
+            for pk in entry.pks:
+                self._members.setdefault((target, pk), set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _discard(self, key):
+        # Caller holds the lock.
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for pk in entry.pks:
+            keys = self._members.get((entry.target, pk))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._members[(entry.target, pk)]
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._members.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'invalidations': self.invalidations}
+
+    # Invalidation
+
+    def invalidate(self, keys=(), members=(), relations=(), using=None):
+        """
+        Drop the entries at ``keys`` ((model, accessor, pk) tuples), those
+        containing any of ``members`` ((model, pk)) and every entry of
+        ``relations`` ((model, accessor)).  With ``using``, changes made in
+        an open transaction on that database are also held back until it ends.
+        """
+        keys, members, relations = set(keys), set(members), set(relations)
+        with self._lock:
+            self._version += 1
+            self.invalidations += 1
+            doomed = set(keys)
+            for member in members:
+                doomed.update(self._members.get(member, ()))
+            if relations:
+                doomed.update(key for key in self._entries if key[:2] in relations)
+            for key in doomed:
+                self._discard(key)
+        if using is not None and connections[using].in_atomic_block:
+            marks = self._marks().setdefault(using, _Marks())
+            marks.keys |= keys
+            marks.members |= members
+            marks.relations |= relations
+            if hasattr(transaction, 'on_commit'):
+                transaction.on_commit(
+                    lambda: self._committed(using, keys, members, relations), using=using)
+
+    def _marks(self):
+        try:
+            return self._local.marks
+        except AttributeError:
+            marks = self._local.marks = {}
+            return marks
+
+    def _committed(self, using, keys, members, relations):
+        self._marks().pop(using, None)
+        self.invalidate(keys, members, relations)
+
+    def _settle(self, db):
+        marks = self._marks().get(db)
+        if marks is not None and not connections[db].in_atomic_block:
+            self._committed(db, marks.keys, marks.members, marks.relations)
+
+    def _marked(self, key, entry):
+        marks = self._marks().get(entry.db)
+        if marks is None:
+            return False
+        return (key in marks.keys or key[:2] in marks.relations or
+                any((entry.target, pk) in marks.members for pk in entry.pks))
+
+    def _owner_keys(self, model, pks):
+        accessors = [r.accessor for r in self._relations.values() if r.owner is model]
+        return [(model, accessor, pk) for accessor in accessors for pk in pks]
+
+    def _related_changed(self, sender, instance, relation, model, added, removed,
+                         previous=None, using=None, **kwargs):
+        owner = _concrete(type(instance))
+        changed = added | removed
+        keys = [(owner, relation, instance.pk)]
+        if previous:
+            keys.extend((owner, relation, pk) for pk in previous.values() if pk is not None)
+        mirror = self._mirrors.get((owner, relation))
+        if mirror is not None:
+            keys.extend(mirror + (pk,) for pk in changed)
+        members = ()
+        spec = relation_signals.spec_for(owner, relation)
+        if spec is not None and spec.kind == relation_signals.FK and spec.reverse:
+            # The related rows' own foreign key column changed.
+            members = [(_concrete(model), pk) for pk in changed]
+        self.invalidate(keys, members, using=using)
+
+    def _post_save(self, sender, instance, created, raw=False, using=None, **kwargs):
+        model = _concrete(sender)
+        if raw:
+            relations = [(r.owner, r.accessor) for r in self._by_target.get(model, ())]
+            self.invalidate(relations=relations, using=using)
+        elif not created:
+            self.invalidate(members=[(model, instance.pk)], using=using)
+
+    def _post_delete(self, sender, instance, using=None, **kwargs):
+        model = _concrete(sender)
+        self.invalidate(self._owner_keys(model, [instance.pk]), [(model, instance.pk)],
+                        using=using)
+
+    def _post_bulk_save(self, sender, instances=None, pks=None, created=False,
+                        update_fields=None, using=None, **kwargs):
+        model = _concrete(sender)
+        relations = self._by_target.get(model, ())
+        if created:
+            keys = []
+            for relation in relations:
+                if relation.fk is None:
+                    continue
+                for obj in instances or ():
+                    value = getattr(obj, relation.fk.attname)
+                    if value is not None:
+                        keys.append((relation.owner, relation.accessor, value))
+            self.invalidate(keys, using=using)
+        elif pks is None:
+            self.invalidate(relations=[(r.owner, r.accessor) for r in relations], using=using)
+        else:
+            fields = update_fields or ()
+            moved = [(r.owner, r.accessor) for r in relations if r.fk is not None and (
+                r.fk.name in fields or r.fk.attname in fields)]
+            self.invalidate(members=[(model, pk) for pk in pks], relations=moved, using=using)
+
+    def _post_bulk_delete(self, sender, pks, using=None, **kwargs):
+        model = _concrete(sender)
+        self.invalidate(self._owner_keys(model, pks), [(model, pk) for pk in pks],
+                        using=using)
+
+    def _remote_relations(self, model, name):
+        # Both ends of the relation a remote related_changed names, whether
+        # it is labelled with the changed instance's model or (as older
+        # publishers did) with the relation field's.
+        try:
+            return self._remote_ends[(model, name)]
+        except KeyError:
+            pass
+        index = topology.get_topology()
+        found = [r for r in index if r.name == name and r.sender is model]
+        if index.get(model, name) is not None:
+            found.append(index.get(model, name))
+        ends = set()
+        for relation in found:
+            ends.add((_concrete(relation.model), relation.name))
+            if relation.reverse_name is not None:
+                ends.add((_concrete(relation.related_model), relation.reverse_name))
+        self._remote_ends[(model, name)] = ends = frozenset(ends)
+        return ends
+
+    def _remote(self, sender, event, pk, fields=(), **kwargs):
+        # Another process's change (see exapp.bus): only labels and pks are
+        # known, so whole relations are dropped where a local event would
+        # name the affected entries.
+        if sender is None:
+            self.clear()
+            return
+        model = _concrete(sender)
+        if pk is None:
+            self.invalidate(relations=[
+                (r.owner, r.accessor) for r in self._relations.values()
+                if model in (r.owner, r.target, r.sender)])
+        elif event == 'related_changed':
+            relations = set()
+            for name in fields:
+                relations.update(self._remote_relations(model, name))
+            self.invalidate(relations=relations)
+        elif event in ('post_delete', 'post_bulk_delete'):
+            self.invalidate(self._owner_keys(model, [pk]), [(model, pk)])
+        else:
+            self.invalidate(members=[(model, pk)])
+
+
+related_cache = None
+
+
+def configure():
+    """Apply the ``SIGNAL_RELATED_CACHE`` setting; called from ``AppConfig.ready``."""
+    global related_cache
+    options = getattr(settings, 'SIGNAL_RELATED_CACHE', None)
+    if options is None or related_cache is not None:
+        return related_cache
+    from django.apps import apps
+    related_cache = RelatedCache(**options).connect(apps.get_app_config('exapp').get_models())
+    return related_cache
@@ -0,0 +1,264 @@
+"""
+Replaying post_save to chosen receivers, to build derived state (an index,
+a counter, a cache) for rows that already exist.
+
+    report = replay(['exapp.search.index_customer'], models=['exapp.Customer'],
+                    workers=4, checkpoint='replay.json')
+    report.rate                             # rows per second
+
+Each model's pk space is cut into segments of ``segment_size`` pks.  A
+segment's rows are read in pk order, ``chunk_size`` at a time with
+``QuerySet.iterator()``, and each chunk is delivered as one batch: only the
+selected receivers are called, with ``created=False`` and ``replay=True``,
+any ``prefetch`` lookups they declare are loaded once per chunk (see
+``exapp.prefetch``), and their writes share one transaction.  Nothing else
+connected to post_save runs.
+
+With ``workers`` > 1 segments are spread over a process pool.  Finished
+segments are recorded in the ``checkpoint`` file, so an interrupted replay
+run again with the same options skips them; a segment cut short is replayed
+whole, so receivers must tolerate seeing a row twice.  Models whose pk is
+not an integer are replayed as a single segment.
+
+See the ``replay_signals`` management command.
+"""
+import collections
+import json
+import multiprocessing
+import os
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max, Min
+from django.db.models.signals import post_save
+from django.utils import six
+
+from . import dispatch
+from .deferred import DeferredQueue
+from .dispatch import receiver_label
+
+
+DEFAULT_MODELS = (
+    'exapp.Customer',
+    'exapp.Company',
+    'exapp.CustomerCategory',
+    'exapp.CustomerCategoryRel',
+)
+
+CHUNK_SIZE = 500
+
+SEGMENT_SIZE = 20 * CHUNK_SIZE
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def _get_model(label):
+    from django.apps import apps
+    return apps.get_model(label)
+
+
+def receivers_for(model):
+    """post_save's receivers for ``model``, by label, in calling order."""
+    return collections.OrderedDict(
+        (receiver_label(receiver), receiver)
+        for receiver in dispatch.receivers_for(post_save, model))
+
+
+def _matches(label, names):
+    return label in names or label.rsplit('.', 1)[-1] in names
+
+
+def select_receivers(model, names):
+    """The receivers of ``model`` named (by label or bare name) in ``names``."""
+    return [receiver for label, receiver in receivers_for(model).items()
+            if _matches(label, names)]
+
+
+class Checkpoint(object):
+    """
+    Finished segments per model label, saved to ``path`` as JSON after each
+    one.  Segment indexes below ``upto`` are all done; ``done`` holds those
+    finished out of order above it.
+    """
+
+    def __init__(self, path, options):
+        self.path = path
+        self.options = options
+        self.models = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state['options'] != options:
+                raise ValueError("Checkpoint %s was written with other options (%s); "
+                                 "remove it to start again." % (path, state['options']))
+            for label, model in state['models'].items():
+                self.models[label] = (model['upto'], set(model['done']))
+
+    def start(self, label, first):
+        upto, done = self.models.get(label, (None, set()))
+        if upto is None or upto < first:
+            upto = first
+        self.models[label] = self._compact(upto, done)
+
+    def _compact(self, upto, done):
+        while upto in done:
+            done.remove(upto)
+            upto += 1
+        return upto, done
+
+    def __contains__(self, segment):
+        label, index = segment
+        upto, done = self.models.get(label, (None, set()))
+        if index is None:
+            return None in done
+        return (upto is not None and index < upto) or index in done
+
+    def add(self, segment):
+        label, index = segment
+        upto, done = self.models.get(label, (None, set()))
+        done.add(index)
+        if upto is not None:
+            upto, done = self._compact(upto, done)
+        self.models[label] = (upto, done)
+        self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+        state = {'options': self.options, 'models': dict(
+            (label, {'upto': upto, 'done': sorted(done)})
+            for label, (upto, done) in self.models.items())}
+        tmp = '%s.tmp' % self.path
+        with open(tmp, 'w') as f:
+            json.dump(state, f, sort_keys=True)
+        os.rename(tmp, self.path)
+
+
+def segments(model, using=DEFAULT_DB_ALIAS, segment_size=SEGMENT_SIZE):
+    """Indexes of the pk segments covering ``model``'s rows; None for all of them."""
+    bounds = model._base_manager.using(using).aggregate(lo=Min('pk'), hi=Max('pk'))
+    if bounds['lo'] is None:
+        return []
+    if not isinstance(bounds['lo'], six.integer_types):
+        return [None]
+    return list(range(bounds['lo'] // segment_size, bounds['hi'] // segment_size + 1))
+
+
+def replay_segment(task):
+    """
+    Replay one segment, ``(label, index, names, chunk_size, segment_size,
+    using)``, in this process; returns ``(label, index, rows)``.
+    """
+    label, index, names, chunk_size, segment_size, using = task
+    model = _get_model(label)
+    receivers = select_receivers(model, names)
+    rows = 0
+    if not receivers:
+        return label, index, rows
+    qs = model._base_manager.using(using).order_by('pk')
+    if index is not None:
+        qs = qs.filter(pk__gte=index * segment_size, pk__lt=(index + 1) * segment_size)
+    last = None
+    while True:
+        page = qs if last is None else qs.filter(pk__gt=last)
+        queue = DeferredQueue()
+        count = 0
+        for instance in page[:chunk_size].iterator():
+            kwargs = {'instance': instance, 'created': False, 'update_fields': None,
+                      'raw': False, 'using': using, 'replay': True}
+            for receiver in receivers:
+                queue.add(receiver, post_save, model, kwargs)
+            last = instance.pk
+            count += 1
+        if count:
+            with transaction.atomic(using=using):
+                queue.flush()
+            rows += count
+        if count < chunk_size:
+            return label, index, rows
+
+
+class ReplayReport(object):
+
+    def __init__(self):
+        self.rows = collections.Counter()
+        self.segments = collections.Counter()
+        self.skipped = collections.Counter()
+        self.seconds = 0.0
+
+    @property
+    def total(self):
+        return sum(self.rows.values())
+
+    @property
+    def rate(self):
+        return self.total / self.seconds if self.seconds else 0.0
+
+
+def _close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+def replay(names, models=DEFAULT_MODELS, using=DEFAULT_DB_ALIAS, chunk_size=CHUNK_SIZE,
+           segment_size=SEGMENT_SIZE, workers=1, checkpoint=None, progress=None):
+    """
+    Send post_save for every row of ``models`` (labels) to the receivers
+    in ``names``; returns a ``ReplayReport``.  ``progress`` is called with
+    ``(label, rows)`` as each segment finishes.
+    """
+    names = sorted(set(names))
+    models = [_get_model(label) for label in models]
+    labels = dict((model, '%s.%s' % (model._meta.app_label, model._meta.object_name))
+                  for model in models)
+    found = set(label for model in models for label in receivers_for(model))
+    unknown = [name for name in names if not any(_matches(label, [name]) for label in found)]
+    if unknown:
+        raise ValueError("No post_save receiver of %s is called %s." % (
+            ', '.join(sorted(labels.values())), ', '.join(unknown)))
+
+    checkpoint = Checkpoint(checkpoint, {'receivers': names, 'segment_size': segment_size})
+    report = ReplayReport()
+    tasks = []
+    for model in models:
+        if not select_receivers(model, names):
+            continue
+        label = labels[model]
+        indexes = segments(model, using, segment_size)
+        if indexes and indexes[0] is not None:
+            checkpoint.start(label, indexes[0])
+        for index in indexes:
+            if (label, index) in checkpoint:
+                report.skipped[label] += 1
+            else:
+                tasks.append((label, index, names, chunk_size, segment_size, using))
+
+    started = timer()
+    if workers > 1 and len(tasks) > 1:
+        # Children must open their own connections rather than share ours.
+        _close_connections()
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.imap_unordered(replay_segment, tasks)
+            for result in results:
+                _finished(result, report, checkpoint, progress)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        for task in tasks:
+            _finished(replay_segment(task), report, checkpoint, progress)
+    report.seconds = timer() - started
+    return report
+
+
+def _finished(result, report, checkpoint, progress):
+    label, index, rows = result
+    report.rows[label] += rows
+    report.segments[label] += 1
+    checkpoint.add((label, index))
+    if progress is not None:
+        progress(label, rows)
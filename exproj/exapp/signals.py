@@ -0,0 +1,61 @@
+"""
+Signals sent by exapp in addition to Django's model signals.
+"""
+from django.dispatch import Signal
+
+
+class ObservedSignal(Signal):
+    """
+    A Signal that calls each of ``connect_hooks`` with the sender of every
+    receiver connected to it, so costly sender-side bookkeeping can start
+    only once somebody listens.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ObservedSignal, self).__init__(*args, **kwargs)
+        self.connect_hooks = []
+
+    def connect(self, receiver, sender=None, weak=True, dispatch_uid=None):
+        super(ObservedSignal, self).connect(receiver, sender, weak, dispatch_uid)
+        for hook in list(self.connect_hooks):
+            hook(sender)
+
+
+# Sent once per bulk relation change made through ``exapp.related``
+# (``bulk_add``, ``bulk_remove``, ``bulk_set``) instead of once per related
+# object.  ``sender`` is the model whose pks are in ``pks``; ``instance`` is
+# the object owning ``relation``; ``action`` is 'add' or 'remove'.
+pre_bulk_related_save = Signal(providing_args=['instance', 'relation', 'action', 'pks', 'using'])
+post_bulk_related_save = Signal(providing_args=['instance', 'relation', 'action', 'pks', 'using'])
+
+# Sent by ``exapp.relation_signals`` whenever relation membership changes,
+# however the change was made and on every supported Django version.
+# ``sender`` is the model declaring the relation field; ``instance`` is the
+# object whose ``relation`` accessor changed (``reverse`` is True when that
+# is the side without the field); ``added``/``removed`` are sets of pks of
+# ``model``.  For reverse foreign key adds, ``previous`` maps each added pk
+# to the pk it was related to before (or None).
+related_changed = ObservedSignal(providing_args=[
+    'instance', 'relation', 'reverse', 'model', 'added', 'removed', 'previous', 'using'])
+
+# Sent once per batch by ``SignalQuerySet.bulk_create_with_signals()`` and
+# ``update_with_signals()`` instead of pre_save/post_save per row.
+# ``instances`` are the objects being created (None for updates); ``pks``
+# are the affected rows (None for creates before the INSERT, or after it on
+# backends that don't return new pks); ``update_fields`` names the updated
+# columns (None for creates).
+pre_bulk_save = Signal(providing_args=['instances', 'pks', 'created', 'update_fields', 'using'])
+post_bulk_save = Signal(providing_args=['instances', 'pks', 'created', 'update_fields', 'using'])
+
+# Sent once per model by ``exapp.deletion`` instead of pre_delete/post_delete
+# per row; ``pks`` lists every row of ``sender`` the delete removes,
+# including rows removed by cascades.
+pre_bulk_delete = Signal(providing_args=['pks', 'using'])
+post_bulk_delete = Signal(providing_args=['pks', 'using'])
+
+# Sent by ``exapp.bus`` subscribers for model events broadcast by other
+# processes.  ``sender`` is the model; ``event`` names the original signal
+# and ``fields`` the changed fields (the relation, for related_changed).
+# ``pk`` None means any row of ``sender`` may have changed, and ``sender``
+# None that anything may have (eg. after lost messages).
+remote_signal = Signal(providing_args=['event', 'pk', 'fields', 'origin'])
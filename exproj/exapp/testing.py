@@ -0,0 +1,60 @@
+"""
+Test case helpers for asserting on the signals a test sends.
+
+    class Tests(SignalAssertionsMixin, TestCase):
+
+        def test_save(self):
+            customer.save()
+            self.assert_sent_exact('customer presave', 'customer postsave')
+            self.assert_max_queries_per_signal(0)
+
+Every query made inside a signal receiver during the test is attributed to
+that receiver by a ``ReceiverQueryTracker``, so N+1 patterns hidden in
+receivers fail the test instead of only showing up as slow saves.
+"""
+from django.db import DEFAULT_DB_ALIAS
+
+from . import executors, models
+from .querycount import ReceiverQueryTracker
+
+
+class SignalAssertionsMixin(object):
+
+    signal_query_database = DEFAULT_DB_ALIAS
+
+    def setUp(self):
+        super(SignalAssertionsMixin, self).setUp()
+        models.signal_log.clear()
+        self.signal_queries = ReceiverQueryTracker(using=self.signal_query_database)
+        self.signal_queries.__enter__()
+        self.addCleanup(self.signal_queries.__exit__, None, None, None)
+
+    def assert_sent_exact(self, *keys, **kwargs):
+        """
+        Assert that exactly ``keys`` were recorded in ``models.signal_log``;
+        with ``max_queries_per_signal``, also ``assert_max_queries_per_signal``.
+        """
+        max_queries = kwargs.pop('max_queries_per_signal', None)
+        if kwargs:
+            raise TypeError("Unexpected arguments: %s" % ', '.join(sorted(kwargs)))
+        executors.drain_all(raise_errors=True)
+        self.assertEqual(sorted(models.signal_log.keys()), sorted(keys))
+        if max_queries is not None:
+            self.assert_max_queries_per_signal(max_queries)
+
+    def assert_max_queries_per_signal(self, limit, signal=None, sender=None):
+        """
+        Assert that no single receiver call made more than ``limit`` queries
+        so far in this test, optionally only for ``signal``/``sender``.
+        ``limit`` may be a dict mapping signal names to limits.
+        """
+        executors.drain_all(raise_errors=True)
+        failures = []
+        for row in self.signal_queries.report(signal=signal, sender=sender):
+            row_limit = limit.get(row['signal']) if isinstance(limit, dict) else limit
+            if row_limit is not None and row['max_queries'] > row_limit:
+                failures.append("%s (%s from %s): %d queries in one call, limit %d\n    %s" % (
+                    row['receiver'], row['signal'], row['sender'], row['max_queries'],
+                    row_limit, '\n    '.join(row['sample_sql'])))
+        if failures:
+            self.fail("Signal receivers exceeded their query budget:\n" + '\n'.join(failures))
@@ -1,3 +1,2402 @@
-from django.test import TestCase
+import errno
+import gc
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import Signal
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import six
+
+from exapp import (aio, benchmarks, bus, dispatch, executors, loadtest, models, outbox,
+                   profiling, related, relation_signals, replay)
+from exapp.coalesce import coalesce_saves
+from exapp.counters import RelationCounts
+from exapp.deferred import deferred_receiver, deferred_signals
+from exapp.deletion import DeletePlan, per_instance_delete, planned_delete
+from exapp.events import EventPool, event_receiver
+from exapp.journal import RECORD, Journal, JournalEvent, JournalReader
+from exapp.muting import MutedLog, muted
+from exapp.prefetch import receiver as prefetching_receiver
+from exapp.querycount import ReceiverQueryTracker
+from exapp.recording import SignalLog, signal_name
+from exapp.relcache import RelatedCache
+from exapp.signals import post_bulk_save, pre_bulk_save, related_changed, remote_signal
+from exapp.testing import SignalAssertionsMixin
+from exapp.topology import get_topology
+
+
+class SignalLogTests(SimpleTestCase):
+
+    def test_ring_buffer_evicts_oldest(self):
+        log = SignalLog(capacity=2)
+        for pk in range(5):
+            log.record('customer postsave', models.Customer, pk=pk)
+        self.assertEqual([r.pk for r in log['customer postsave']], [3, 4])
+
+    def test_per_key_capacity(self):
+        log = SignalLog(capacity=10, capacities={'customer presave': 1})
+        for pk in range(3):
+            log.record('customer presave', models.Customer, pk=pk)
+            log.record('customer postsave', models.Customer, pk=pk)
+        self.assertEqual(len(log['customer presave']), 1)
+        self.assertEqual(len(log['customer postsave']), 3)
+
+    def test_reading_missing_key_does_not_create_it(self):
+        log = SignalLog()
+        self.assertEqual(log['nope'], [])
+        self.assertEqual(log.keys(), [])
+
+    def test_weak_references_do_not_pin_instances(self):
+        log = SignalLog(weak=True)
+        customer = models.Customer(name='weak', pk=12)
+        log.record('customer presave', models.Customer, instance=customer)
+        record = log['customer presave'][0]
+        self.assertIs(record[1]['instance'], customer)
+        del customer
+        gc.collect()
+        self.assertIsNone(record.instance)
+        self.assertEqual(record.pk, 12)
+
+
+class SignalRecordTests(TestCase):
+
+    def setUp(self):
+        models.signal_log.clear()
+
+    def test_records_signal_name_and_pk(self):
+        company = models.Company(name='recorded')
+        company.save()
+        record = models.signal_log['company postsave'][0]
+        self.assertEqual(record.sender, models.Company)
+        self.assertEqual(record.signal, 'post_save')
+        self.assertEqual(record.pk, company.pk)
+        presave = models.signal_log['company presave'][0]
+        self.assertIsNone(presave.pk)
+        self.assertLessEqual(presave.timestamp, record.timestamp)
+
+
+class BenchmarkTests(TestCase):
+
+    def setUp(self):
+        models.signal_log.clear()
+
+    def test_run_scenario_rolls_back_and_counts_queries(self):
+        result = benchmarks.run_scenario(
+            benchmarks.ForeignKeyForward(), 3, allocations=False)
+        self.assertEqual(result['queries'], 3)
+        self.assertEqual(result['rows'], 3)
+        self.assertFalse(models.Customer.objects.exists())
+
+    def test_receivers_disconnected(self):
+        with benchmarks.receivers_disconnected():
+            models.Company(name='quiet').save()
+        self.assertEqual(models.signal_log.keys(), [])
+        models.Company(name='loud').save()
+        self.assertIn('company postsave', models.signal_log)
+
+
+class BulkRelatedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = models.Company.objects.create(name='bulk')
+        cls.customers = [models.Customer.objects.create(name='bulk %d' % i)
+                         for i in range(3)]
+        cls.categories = [models.CustomerCategory.objects.create(name='bulk cat %d' % i)
+                          for i in range(2)]
+
+    def setUp(self):
+        models.signal_log.clear()
+
+    def test_reverse_fk_add_sends_one_batch(self):
+        related.bulk_add(self.company, 'customers', self.customers)
+        six.assertCountEqual(self, models.signal_log.keys(),
+                             ['customer bulk presave', 'customer bulk postsave'])
+        record, = models.signal_log['customer bulk postsave']
+        self.assertEqual(record.pk, tuple(c.pk for c in self.customers))
+        self.assertIs(record.instance, self.company)
+        self.assertEqual(self.company.customers.count(), 3)
+        self.assertEqual(self.customers[0].company, self.company)
+
+    def test_reverse_fk_set_removes_and_adds(self):
+        related.bulk_add(self.company, 'customers', self.customers[:2])
+        models.signal_log.clear()
+        related.bulk_set(self.company, 'customers', self.customers[1:])
+        self.assertEqual(len(models.signal_log['customer bulk postsave']), 2)
+        six.assertCountEqual(self, self.company.customers.all(), self.customers[1:])
+
+    def test_m2m_direct_set(self):
+        customer = self.customers[0]
+        related.bulk_set(customer, 'categories_direct', self.categories)
+        record, = models.signal_log['category bulk postsave']
+        six.assertCountEqual(self, record.pk, [c.pk for c in self.categories])
+        six.assertCountEqual(self, customer.categories_direct.all(), self.categories)
+
+    def test_m2m_through_rows_send_through_bulk_signals(self):
+        category = self.categories[0]
+        related.bulk_add(category, 'customers_indirect', self.customers)
+        related.bulk_add(category, 'customers_indirect', self.customers)
+        self.assertEqual(models.CustomerCategoryRel.objects.count(), 3)
+        self.assertEqual(len(models.signal_log['rel batch presave']), 1)
+        self.assertEqual(len(models.signal_log['rel batch postsave']), 1)
+        rel = models.CustomerCategoryRel.objects.get(customer=self.customers[0])
+        related.bulk_remove(category, 'customers_indirect', self.customers[:1])
+        self.assertEqual(models.CustomerCategoryRel.objects.count(), 2)
+        record, = models.signal_log['rel batch postdelete']
+        self.assertEqual(record.pk, (rel.pk,))
+        self.assertNotIn('rel presave', models.signal_log)
+        self.assertNotIn('rel predelete', models.signal_log)
+        self.assertEqual(len(models.signal_log['customer bulk postsave']), 3)
+
+    def test_m2m_through_remove_reports_related_change(self):
+        category = self.categories[0]
+        related.bulk_add(category, 'customers_indirect', self.customers)
+        events = []
+        related_changed.connect(
+            lambda sender, instance, removed, **kwargs: events.append((instance, removed)),
+            weak=False, dispatch_uid='bulk_related_tests')
+        self.addCleanup(related_changed.disconnect, dispatch_uid='bulk_related_tests')
+        removed = self.customers[:2]
+        with self.assertNumQueries(2):
+            related.bulk_remove(category, 'customers_indirect', removed)
+        six.assertCountEqual(self, events, [(category, frozenset(c.pk for c in removed))]
+                             + [(customer, frozenset([category.pk])) for customer in removed])
+
+    def test_unsaved_objects_rejected(self):
+        with self.assertRaises(ValueError):
+            related.bulk_add(self.company, 'customers', [models.Customer(name='new')])
+        self.assertEqual(models.signal_log.keys(), [])
+
+    def test_to_one_relation_rejected(self):
+        with self.assertRaises(ValueError):
+            related.bulk_add(self.customers[0], 'company', [self.company])
+
+
+class DeferredSignalTests(TransactionTestCase):
+
+    def setUp(self):
+        models.signal_log.clear()
+
+    def connect_deferred(self, func, signal, sender):
+        deferred_receiver(signal, sender=sender)(func)
+        self.addCleanup(signal.disconnect, func.deferred_proxies[0], sender=sender)
+
+    def test_post_save_delivered_after_commit_once_per_row(self):
+        calls = []
+
+        def on_save(sender, **kwargs):
+            calls.append((kwargs['instance'].name, kwargs['created']))
+        self.connect_deferred(on_save, post_save, models.Customer)
+
+        with deferred_signals():
+            customer = models.Customer(name='first')
+            customer.save()
+            customer.name = 'second'
+            customer.save()
+            models.Company(name='deferred').save()
+            self.assertEqual(calls, [])
+            self.assertNotIn('customer postsave', models.signal_log)
+            self.assertEqual(len(models.signal_log['customer presave']), 2)
+
+        self.assertEqual(calls, [('second', True)])
+        self.assertEqual(len(models.signal_log['customer postsave']), 1)
+        self.assertEqual(len(models.signal_log['company postsave']), 1)
+
+    def test_rollback_drops_events(self):
+        with self.assertRaises(RuntimeError):
+            with deferred_signals():
+                models.Customer(name='rolled back').save()
+                raise RuntimeError
+        self.assertIn('customer presave', models.signal_log)
+        self.assertNotIn('customer postsave', models.signal_log)
+        self.assertFalse(models.Customer.objects.exists())
+
+    def test_nested_blocks_deliver_with_outermost(self):
+        with deferred_signals():
+            with deferred_signals():
+                customer = models.Customer.objects.create(name='nested')
+            self.assertNotIn('customer postsave', models.signal_log)
+            customer.delete()
+        self.assert_keys_include('customer postsave', 'customer postdelete')
+
+    def test_failed_inner_block_drops_only_its_events(self):
+        with deferred_signals():
+            models.Company.objects.create(name='kept')
+            with self.assertRaises(RuntimeError):
+                with deferred_signals():
+                    models.Customer.objects.create(name='dropped')
+                    raise RuntimeError
+        self.assertIn('company postsave', models.signal_log)
+        self.assertNotIn('customer postsave', models.signal_log)
+
+    def test_rolled_back_savepoint_drops_its_events(self):
+        with deferred_signals():
+            models.Company.objects.create(name='kept')
+            try:
+                with transaction.atomic():
+                    models.Customer.objects.create(name='dropped')
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertIn('company postsave', models.signal_log)
+        self.assertNotIn('customer postsave', models.signal_log)
+        self.assertFalse(models.Customer.objects.exists())
+
+    def test_failing_receiver_does_not_stop_delivery(self):
+        calls = []
+
+        def broken(sender, **kwargs):
+            raise ValueError('broken')
+
+        def on_save(sender, **kwargs):
+            calls.append(kwargs['instance'].name)
+        self.connect_deferred(broken, post_save, models.Customer)
+        self.connect_deferred(on_save, post_save, models.Customer)
+
+        with self.assertRaises(ValueError):
+            with deferred_signals():
+                models.Customer.objects.create(name='first')
+                models.Customer.objects.create(name='second')
+        self.assertEqual(calls, ['first', 'second'])
+        self.assertEqual(len(models.signal_log['customer postsave']), 2)
+
+    def assert_keys_include(self, *keys):
+        for key in keys:
+            self.assertIn(key, models.signal_log)
+
+
+def _fail_in_process(sender, **kwargs):
+    raise ValueError('boom %s' % kwargs['instance'].name)
+
+
+class AsyncReceiverTests(TestCase):
+
+    def setUp(self):
+        self.pool = executors.ReceiverPool(kind='thread', max_workers=3, max_pending=2)
+        self.addCleanup(self.pool.shutdown)
+
+    def connect_async(self, func, sender=models.Customer, pool=None):
+        executors.async_receiver(post_save, sender=sender, pool=pool or self.pool)(func)
+        self.addCleanup(post_save.disconnect, func.async_proxies[0], sender=sender)
+
+    def test_runs_off_thread_in_order_per_pk(self):
+        seen = []
+
+        def slow_receiver(sender, **kwargs):
+            seen.append((threading.current_thread().name, kwargs['instance'].name))
+        self.connect_async(slow_receiver)
+
+        customer = models.Customer.objects.create(name='0')
+        for i in range(1, 6):
+            customer.name = str(i)
+            customer.save()
+        self.assertEqual(self.pool.drain(), [])
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(name for name, _ in seen)), 1)
+        self.assertNotEqual(seen[0][0], threading.current_thread().name)
+
+    def test_errors_are_captured_and_drained(self):
+        def broken(sender, **kwargs):
+            raise ValueError('broken')
+        self.connect_async(broken)
+
+        customer = models.Customer.objects.create(name='err')
+        errors = self.pool.drain()
+        self.assertEqual(len(errors), 1)
+        self.assertIs(errors[0].receiver, broken)
+        self.assertEqual(errors[0].pk, customer.pk)
+        self.assertIn('broken', errors[0].traceback)
+        self.assertEqual(self.pool.drain(), [])
+
+        models.Customer.objects.create(name='err again')
+        with self.assertRaises(ValueError):
+            self.pool.drain(raise_errors=True)
+
+    def test_error_recorded_before_call_leaves_pending(self):
+        pool = self.pool
+        seen = []
+
+        class Slots(object):
+            def __init__(self, slots):
+                self.acquire = slots.acquire
+                self._release = slots.release
+
+            def release(self):
+                # drain() may return as soon as the call is no longer pending.
+                with pool._lock:
+                    seen.append((len(pool._pending), len(pool.errors)))
+                self._release()
+        pool._slots = Slots(pool._slots)
+
+        def broken(sender, **kwargs):
+            raise ValueError('broken')
+        pool.submit(broken, models.Customer, {}, key=(models.Customer, 1))
+        with self.assertRaises(ValueError):
+            pool.drain(raise_errors=True)
+        self.assertEqual(seen, [(0, 1)])
+
+    def test_process_pool(self):
+        pool = executors.ReceiverPool(kind='process', max_workers=1)
+        self.addCleanup(pool.shutdown)
+        self.connect_async(_fail_in_process, pool=pool)
+        models.Customer.objects.create(name='elsewhere')
+        error, = pool.drain()
+        self.assertIn('boom elsewhere', error.traceback)
+
+
+class _Sleep(object):
+    """Awaitable sleep usable without ``async``/``await`` syntax."""
+
+    def __init__(self, delay, result=None):
+        self.delay = delay
+        self.result = result
+
+    def __await__(self):
+        loop = aio.asyncio.get_event_loop()
+        future = loop.create_future()
+        loop.call_later(self.delay, future.set_result, self.result)
+        return future.__await__()
+
+
+@unittest.skipIf(aio.asyncio is None, "asyncio requires Python 3")
+class AsyncDispatcherTests(TestCase):
+
+    def setUp(self):
+        models.signal_log.clear()
+        self.dispatcher = aio.AsyncDispatcher(timeout=1)
+        self.addCleanup(self.dispatcher.close)
+
+    def test_save_awaits_receivers_concurrently(self):
+        finished = []
+
+        def slow(name):
+            def receiver(sender, instance, **kwargs):
+                finished.append(name)
+                return _Sleep(0.2, name)
+            return receiver
+        self.dispatcher.connect(post_save, slow('a'), sender=models.Customer)
+        self.dispatcher.connect(post_save, slow('b'), sender=models.Customer)
+
+        start = time.time()
+        models.Customer(name='async').save()
+        self.assertLess(time.time() - start, 0.35)
+        self.assertEqual(sorted(finished), ['a', 'b'])
+        self.assertEqual(sorted(models.signal_log.keys()),
+                         ['customer postsave', 'customer presave'])
+
+    def test_timeout_and_errors_are_returned(self):
+        def hangs(sender, **kwargs):
+            return _Sleep(5)
+
+        def breaks(sender, **kwargs):
+            raise ValueError('nope')
+
+        def quick(sender, **kwargs):
+            return _Sleep(0, 'ok')
+        self.dispatcher.connect(post_save, hangs, sender=models.Company, timeout=0.05)
+        self.dispatcher.connect(post_save, breaks, sender=models.Company)
+        self.dispatcher.connect(post_save, quick, sender=models.Company)
+
+        results = dict(self.dispatcher.send_sync(
+            post_save, models.Company, instance=None, created=False))
+        self.assertIsInstance(results[hangs], aio.asyncio.TimeoutError)
+        self.assertIsInstance(results[breaks], ValueError)
+        self.assertEqual(results[quick], 'ok')
+
+    def test_failures_reach_save(self):
+        finished = []
+
+        def breaks(sender, **kwargs):
+            raise ValueError('nope')
+
+        def quick(sender, **kwargs):
+            finished.append(True)
+            return _Sleep(0)
+        self.dispatcher.connect(post_save, breaks, sender=models.Company)
+        self.dispatcher.connect(post_save, quick, sender=models.Company)
+        with self.assertRaises(ValueError):
+            models.Company.objects.create(name='async')
+        self.assertEqual(finished, [True])
+
+    def test_scheduled_failures_are_logged(self):
+        def hangs(sender, **kwargs):
+            return _Sleep(5)
+        self.dispatcher.connect(post_save, hangs, sender=models.Company, timeout=0.01)
+        loop = aio.asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        saved = loop.create_future()
+
+        def save():
+            models.Company.objects.create(name='scheduled')
+            saved.set_result(None)
+        loop.call_soon(save)
+        loop.run_until_complete(saved)
+        with self.assertLogs('exapp.aio', 'ERROR') as logs:
+            loop.run_until_complete(self.dispatcher.drain())
+            loop.run_until_complete(aio.asyncio.sleep(0, loop=loop))
+        self.assertIn('hangs failed', logs.output[0])
+
+
+class RelatedChangedTests(TestCase):
+    """The same related_changed events on every Django version."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = models.Company.objects.create(name='related')
+        cls.other_company = models.Company.objects.create(name='other')
+        cls.customer = models.Customer.objects.create(name='c1')
+        cls.customer2 = models.Customer.objects.create(name='c2')
+        cls.cat1 = models.CustomerCategory.objects.create(name='cat1')
+        cls.cat2 = models.CustomerCategory.objects.create(name='cat2')
+
+    def setUp(self):
+        self.events = []
+        related_changed.connect(self.record, weak=False, dispatch_uid='related_changed_tests')
+        self.addCleanup(related_changed.disconnect, dispatch_uid='related_changed_tests')
+        # Fresh copies so snapshots reflect the database.
+        self.customer = models.Customer.objects.get(pk=self.customer.pk)
+        self.customer2 = models.Customer.objects.get(pk=self.customer2.pk)
+
+    def record(self, sender, instance, relation, added, removed, **kwargs):
+        self.events.append((sender, instance.pk, relation, set(added), set(removed)))
+
+    def test_fk_forward_save(self):
+        self.customer.company = self.company
+        self.customer.save()
+        self.customer.save()
+        self.customer.company = self.other_company
+        self.customer.save()
+        self.assertEqual(self.events, [
+            (models.Customer, self.customer.pk, 'company', {self.company.pk}, set()),
+            (models.Customer, self.customer.pk, 'company',
+             {self.other_company.pk}, {self.company.pk}),
+        ])
+
+    def test_snapshots_wait_for_first_receiver(self):
+        uid = 'related_changed._post_init.exapp.customer'
+        related_changed.disconnect(dispatch_uid='related_changed_tests')
+        post_init.disconnect(sender=models.Customer, dispatch_uid=uid)
+        self.addCleanup(relation_signals._start_snapshots, None)
+        relation_signals._defer_snapshots(models.Customer, models.Customer)
+        customer = models.Customer.objects.get(pk=self.customer.pk)
+        self.assertNotIn(relation_signals.SNAPSHOT_ATTR, customer.__dict__)
+        related_changed.connect(self.record, sender=models.Customer, weak=False,
+                                dispatch_uid='related_changed_tests')
+        customer = models.Customer.objects.get(pk=self.customer.pk)
+        self.assertIn(relation_signals.SNAPSHOT_ATTR, customer.__dict__)
+        customer.company = self.company
+        customer.save()
+        self.assertEqual(len(self.events), 1)
+
+    def test_fk_reverse_add_sends_once(self):
+        self.company.customers.add(self.customer, self.customer2)
+        self.assertEqual(self.events, [
+            (models.Customer, self.company.pk, 'customers',
+             {self.customer.pk, self.customer2.pk}, set()),
+        ])
+
+    def test_fk_reverse_add_reports_previous_owner(self):
+        previous = []
+        related_changed.connect(
+            lambda sender, **kw: previous.append(kw['previous']), weak=False,
+            dispatch_uid='previous')
+        self.addCleanup(related_changed.disconnect, dispatch_uid='previous')
+        self.other_company.customers.add(self.customer)
+        self.company.customers.add(models.Customer.objects.get(pk=self.customer.pk))
+        self.assertEqual(previous, [{self.customer.pk: None},
+                                    {self.customer.pk: self.other_company.pk}])
+
+    def test_fk_reverse_assignment_sends_net_change(self):
+        self.company.customers.add(self.customer)
+        del self.events[:]
+        self.company.customers = [self.customer, self.customer2]
+        self.company.customers = [self.customer2]
+        self.assertEqual(self.events, [
+            (models.Customer, self.company.pk, 'customers', {self.customer2.pk}, set()),
+            (models.Customer, self.company.pk, 'customers', set(), {self.customer.pk}),
+        ])
+
+    def test_fk_reverse_remove_and_clear(self):
+        self.company.customers.add(self.customer, self.customer2)
+        del self.events[:]
+        self.company.customers.remove(self.customer)
+        self.company.customers.clear()
+        self.assertEqual(self.events, [
+            (models.Customer, self.company.pk, 'customers', set(), {self.customer.pk}),
+            (models.Customer, self.company.pk, 'customers', set(), {self.customer2.pk}),
+        ])
+
+    def test_1to1_reverse_assignment_reported_when_child_saved(self):
+        extra = models.CustomerExtraJunk()
+        self.customer.extrajunk = extra
+        self.customer.save()
+        self.assertEqual(self.events, [])
+        extra.save()
+        self.assertEqual(self.events, [
+            (models.CustomerExtraJunk, extra.pk, 'customer', {self.customer.pk}, set()),
+        ])
+
+    def test_m2m_direct_assignment_both_sides(self):
+        self.customer.categories_direct = [self.cat1, self.cat2]
+        self.customer.categories_direct = [self.cat2]
+        self.cat1.customers_direct = [self.customer2]
+        self.assertEqual(self.events, [
+            (models.Customer, self.customer.pk, 'categories_direct',
+             {self.cat1.pk, self.cat2.pk}, set()),
+            (models.Customer, self.customer.pk, 'categories_direct', set(), {self.cat1.pk}),
+            (models.Customer, self.cat1.pk, 'customers_direct', {self.customer2.pk}, set()),
+        ])
+
+    def test_m2m_through_rows(self):
+        rel = models.CustomerCategoryRel(customer=self.customer, category=self.cat1)
+        rel.save()
+        rel.category = self.cat2
+        rel.save()
+        rel.delete()
+        self.assertEqual(self.events, [
+            (models.Customer, self.customer.pk, 'categories_indirect', {self.cat1.pk}, set()),
+            (models.Customer, self.customer.pk, 'categories_indirect',
+             {self.cat2.pk}, {self.cat1.pk}),
+            (models.Customer, self.customer.pk, 'categories_indirect', set(), {self.cat2.pk}),
+        ])
+
+    def test_delete_removes_from_relations(self):
+        self.customer.company = self.company
+        self.customer.save()
+        self.customer.categories_direct.add(self.cat1)
+        del self.events[:]
+        pk = self.customer.pk
+        self.customer.delete()
+        six.assertCountEqual(self, self.events, [
+            (models.Customer, pk, 'company', set(), {self.company.pk}),
+            (models.Customer, pk, 'categories_direct', set(), {self.cat1.pk}),
+        ])
+
+    def test_no_listeners_no_queries(self):
+        related_changed.disconnect(dispatch_uid='related_changed_tests')
+        self.company.customers.add(self.customer)
+        with self.assertNumQueries(1):
+            self.company.customers.clear()
+
+    def test_bulk_helpers_send_once(self):
+        related.bulk_add(self.company, 'customers', [self.customer, self.customer2])
+        related.bulk_set(self.customer, 'categories_indirect', [self.cat1, self.cat2])
+        related.bulk_set(self.customer, 'categories_direct', [self.cat1])
+        self.assertEqual(self.events, [
+            (models.Customer, self.company.pk, 'customers',
+             {self.customer.pk, self.customer2.pk}, set()),
+            (models.Customer, self.customer.pk, 'categories_indirect',
+             {self.cat1.pk, self.cat2.pk}, set()),
+            (models.Customer, self.customer.pk, 'categories_direct', {self.cat1.pk}, set()),
+        ])
+
+
+class ProfilerTests(TestCase):
+
+    def setUp(self):
+        self.profiler = profiling.Profiler([post_save]).enable()
+        self.addCleanup(self.profiler.disable)
+
+    def rows(self, receiver):
+        return [row for row in self.profiler.report() if row['receiver'] == receiver]
+
+    def test_times_each_receiver_per_sender(self):
+        customer = models.Customer.objects.create(name='timed')
+        customer.save()
+        models.Company.objects.create(name='timed')
+        row, = self.rows('exapp.models.post_customer_save')
+        self.assertEqual((row['signal'], row['sender'], row['calls']),
+                         ('post_save', 'exapp.Customer', 2))
+        self.assertTrue(0 <= row['p50_ms'] <= row['p99_ms'] <= row['max_ms'])
+        self.assertEqual(len(self.rows('exapp.models.post_company_save')), 1)
+
+    def test_counts_exceptions(self):
+        def failing(sender, **kwargs):
+            raise ValueError('boom')
+        post_save.connect(failing, sender=models.Company)
+        self.addCleanup(post_save.disconnect, failing, sender=models.Company)
+        with self.assertRaises(ValueError):
+            models.Company.objects.create(name='fails')
+        row, = [r for r in self.profiler.report() if r['receiver'].endswith('failing')]
+        self.assertEqual((row['calls'], row['errors'], row['last_error']),
+                         (1, 1, 'ValueError: boom'))
+
+    def test_disable_restores_dispatch(self):
+        self.assertTrue(dispatch.is_wrapped(post_save))
+        self.profiler.disable()
+        self.assertFalse(dispatch.is_wrapped(post_save))
+        models.Customer.objects.create(name='untimed')
+        self.assertEqual(self.profiler.report(), [])
+
+    def test_dump(self):
+        models.Customer.objects.create(name='dumped')
+        path = os.path.join(tempfile.mkdtemp(), 'profile.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        self.profiler.dump(path)
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual(data['receivers'], json.loads(json.dumps(self.profiler.report())))
+
+    def test_dumping_survives_failed_dump(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'profile.json')
+        attempts = []
+        done = threading.Event()
+        dump = self.profiler.dump
+
+        def flaky_dump(path):
+            if done.is_set():
+                return
+            attempts.append(path)
+            if len(attempts) == 1:
+                raise IOError('disk full')
+            dump(path)
+            done.set()
+        self.profiler.dump = flaky_dump
+        profiling.logger.disabled = True
+        self.addCleanup(setattr, profiling.logger, 'disabled', False)
+        self.profiler.start_dumping(path, interval=0.01)
+        self.addCleanup(self.profiler.stop_dumping)
+        self.assertTrue(done.wait(5))
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(os.listdir(directory), ['profile.json'])
+
+    def test_histogram_percentiles(self):
+        hist = profiling.Histogram()
+        for ms in range(1, 101):
+            hist.add(ms / 1000.0)
+        self.assertEqual(hist.count, 100)
+        # Within one bucket (~19%) of the true value.
+        for p in (50, 95, 99):
+            self.assertAlmostEqual(hist.percentile(p) / (p / 1000.0), 1, delta=0.19)
+        self.assertEqual(hist.percentile(100), 0.1)
+
+
+class ReceiverQueryTrackerTests(TestCase):
+
+    def connect(self, receiver, signal=post_save, sender=models.Customer):
+        signal.connect(receiver, sender=sender)
+        self.addCleanup(signal.disconnect, receiver, sender=sender)
+
+    def test_attributes_queries_to_receiver(self):
+        def count_companies(sender, **kwargs):
+            models.Company.objects.count()
+            models.Company.objects.count()
+        self.connect(count_companies)
+        with ReceiverQueryTracker() as tracker:
+            models.Customer.objects.create(name='tracked')
+            models.Customer.objects.create(name='tracked')
+        row, = [r for r in tracker.report() if r['receiver'].endswith('count_companies')]
+        self.assertEqual((row['signal'], row['sender'], row['calls'], row['queries'],
+                          row['max_queries']),
+                         ('post_save', 'exapp.Customer', 2, 4, 2))
+        self.assertEqual(len(row['sample_sql']), 4)
+        self.assertEqual(sum(r['queries'] for r in tracker.report()), 4)
+        # The two INSERTs were made outside any receiver.
+        self.assertEqual(tracker.count, 6)
+        self.assertEqual([r['queries'] for r in tracker.report(signal='pre_save')], [0])
+        self.assertEqual(tracker.report(signal=post_save, sender=models.Customer),
+                         tracker.report(signal='post_save', sender='exapp.Customer'))
+
+    def test_nested_signals_count_exclusively(self):
+        def save_company(sender, instance, **kwargs):
+            models.Company.objects.create(name='from receiver')
+
+        def count_customers(sender, **kwargs):
+            models.Customer.objects.count()
+        self.connect(save_company)
+        self.connect(count_customers, sender=models.Company)
+        with ReceiverQueryTracker() as tracker:
+            models.Customer.objects.create(name='outer')
+        by_receiver = dict((r['receiver'].rsplit('.', 1)[-1], r['queries'])
+                           for r in tracker.report() if r['queries'])
+        self.assertEqual(by_receiver, {'save_company': 1, 'count_customers': 1})
+
+    def test_unwraps_on_exit(self):
+        with ReceiverQueryTracker(signals=[post_save]):
+            self.assertTrue(dispatch.is_wrapped(post_save))
+        self.assertFalse(dispatch.is_wrapped(post_save))
+
+
+class SignalAssertionsMixinTests(SignalAssertionsMixin, TestCase):
+
+    def test_query_budget(self):
+        def n_plus_one(sender, instance, **kwargs):
+            for company in models.Company.objects.all():
+                list(company.customers.all())
+        post_save.connect(n_plus_one, sender=models.Customer)
+        self.addCleanup(post_save.disconnect, n_plus_one, sender=models.Customer)
+        models.Company.objects.create(name='a')
+        models.Company.objects.create(name='b')
+        models.Customer.objects.create(name='budget')
+        self.assert_max_queries_per_signal(3)
+        self.assert_max_queries_per_signal(0, signal=pre_save)
+        with self.assertRaises(AssertionError) as cm:
+            self.assert_sent_exact('company presave', 'company postsave', 'customer presave',
+                                   'customer postsave', max_queries_per_signal=2)
+        self.assertIn('n_plus_one (post_save from exapp.Customer): 3 queries', str(cm.exception))
+
+    def test_query_log_still_works(self):
+        with self.assertRaises(AssertionError):
+            with self.assertNumQueries(0):
+                models.Customer.objects.create(name='logged')
+        with self.assertNumQueries(1):
+            models.Company.objects.count()
+        self.assertEqual(self.signal_queries.count, 2)
+
+
+class CoalesceSavesTests(TestCase):
+
+    def setUp(self):
+        models.signal_log.clear()
+        self.calls = []
+
+        def record(sender, instance, created, update_fields, **kwargs):
+            self.calls.append((instance.pk, created, update_fields))
+        post_save.connect(record, sender=models.Customer, weak=False, dispatch_uid='coalesce')
+        self.addCleanup(post_save.disconnect, sender=models.Customer, dispatch_uid='coalesce')
+
+    def test_repeated_saves_fire_once(self):
+        with coalesce_saves():
+            customer = models.Customer.objects.create(name='once')
+            customer.save()
+            customer.save(update_fields=['name'])
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [(customer.pk, True, None)])
+        self.assertEqual(len(models.signal_log['customer presave']), 3)
+        self.assertEqual(len(models.signal_log['customer postsave']), 1)
+        self.assertIs(models.signal_log['customer postsave'][0][1]['instance'], customer)
+
+    def test_repeated_saves_fire_once_under_receiver_wrappers(self):
+        profiler = profiling.Profiler([post_save]).enable()
+        self.addCleanup(profiler.disable)
+        with ReceiverQueryTracker() as tracker:
+            with coalesce_saves():
+                customer = models.Customer.objects.create(name='wrapped')
+                customer.save()
+                customer.save()
+        self.assertEqual(self.calls, [(customer.pk, True, None)])
+        row, = [r for r in profiler.report() if r['receiver'].endswith('record')]
+        self.assertEqual(row['calls'], 1)
+        self.assertEqual([r['calls'] for r in tracker.report(signal='post_save')
+                          if r['receiver'].endswith('record')], [1])
+
+    def test_update_fields_union(self):
+        customer = models.Customer.objects.create(name='fields')
+        del self.calls[:]
+        with coalesce_saves():
+            customer.save(update_fields=['name'])
+            customer.save(update_fields=['company'])
+        self.assertEqual(self.calls, [(customer.pk, False, frozenset(['name', 'company']))])
+
+    def test_one_event_per_row(self):
+        with coalesce_saves():
+            first = models.Customer.objects.create(name='first')
+            second = models.Customer.objects.create(name='second')
+            first.save()
+            second.save()
+            first.save()
+        self.assertEqual(self.calls, [(first.pk, True, None), (second.pk, True, None)])
+
+    def test_nested_blocks_deliver_at_outermost_exit(self):
+        customer = models.Customer.objects.create(name='nested')
+        del self.calls[:]
+        with coalesce_saves():
+            with coalesce_saves():
+                customer.save(update_fields=['name'])
+            self.assertEqual(self.calls, [])
+            customer.save(update_fields=['company'])
+        self.assertEqual(self.calls, [(customer.pk, False, frozenset(['name', 'company']))])
+        self.assertFalse(dispatch.is_wrapped(post_save))
+
+    def test_drops_held_events_when_block_raises(self):
+        with self.assertRaises(ValueError):
+            with coalesce_saves():
+                models.Customer.objects.create(name='raises')
+                raise ValueError
+        self.assertEqual(self.calls, [])
+        self.assertFalse(dispatch.is_wrapped(post_save))
+
+    def test_inner_block_raising_drops_only_its_events(self):
+        customer = models.Customer.objects.create(name='inner')
+        del self.calls[:]
+        with coalesce_saves():
+            customer.save(update_fields=['name'])
+            try:
+                with coalesce_saves():
+                    customer.save(update_fields=['company'])
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(self.calls, [(customer.pk, False, frozenset(['name']))])
+
+    def test_other_threads_unaffected(self):
+        def save():
+            post_save.send(sender=models.Customer, instance=customer, created=False,
+                           update_fields=None, raw=False, using='default')
+        customer = models.Customer.objects.create(name='threads')
+        del self.calls[:]
+        with coalesce_saves():
+            thread = threading.Thread(target=save)
+            thread.start()
+            thread.join()
+            self.assertEqual(self.calls, [(customer.pk, False, None)])
+
+
+class DirtyFieldsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = models.Company.objects.create(name='dirty')
+
+    def setUp(self):
+        self.customer = models.Customer.objects.create(name='dirty', company=self.company)
+        models.signal_log.clear()
+
+    def test_dirty_fields(self):
+        customer = models.Customer.objects.get(pk=self.customer.pk)
+        self.assertEqual(customer.get_dirty_fields(), {})
+        customer.name = 'changed'
+        customer.company = None
+        self.assertEqual(customer.get_dirty_fields(),
+                         {'name': 'dirty', 'company': self.company.pk})
+        self.assertTrue(customer.is_dirty())
+        self.assertEqual(models.Customer(name='new').get_dirty_fields(),
+                         {'name': None, 'company': None})
+
+    def narrow(self):
+        models.Customer.narrow_update_fields = True
+        self.addCleanup(delattr, models.Customer, 'narrow_update_fields')
+
+    def test_full_writes_by_default(self):
+        self.customer.name = 'full'
+        models.Customer.objects.filter(pk=self.customer.pk).update(company=None)
+        self.customer.save()
+        self.assertEqual(models.Customer.objects.get(pk=self.customer.pk).company_id,
+                         self.company.pk)
+
+    def test_update_writes_only_changed_fields(self):
+        self.narrow()
+        self.customer.name = 'narrow'
+        with self.assertNumQueries(1):
+            self.customer.save()
+        record = models.signal_log['customer postsave'][0]
+        self.assertEqual(record[1]['instance'].saved_changes, {'name': 'dirty'})
+        self.assertFalse(self.customer.is_dirty())
+        # A concurrent change to another column isn't overwritten.
+        models.Customer.objects.filter(pk=self.customer.pk).update(company=None)
+        self.customer.name = 'again'
+        self.customer.save()
+        self.assertIsNone(models.Customer.objects.get(pk=self.customer.pk).company_id)
+
+    def test_narrowing_writes_pre_save_changes(self):
+        self.narrow()
+        seen = []
+
+        def pre(sender, instance, **kwargs):
+            instance.company = None
+
+        def post(sender, instance, **kwargs):
+            seen.append(instance.saved_changes)
+        pre_save.connect(pre, sender=models.Customer)
+        self.addCleanup(pre_save.disconnect, pre, sender=models.Customer)
+        post_save.connect(post, sender=models.Customer)
+        self.addCleanup(post_save.disconnect, post, sender=models.Customer)
+        self.customer.name = 'hooked'
+        self.customer.save()
+        self.assertEqual(seen, [{'name': 'dirty', 'company': self.company.pk}])
+        customer = models.Customer.objects.get(pk=self.customer.pk)
+        self.assertEqual((customer.name, customer.company_id), ('hooked', None))
+        self.assertFalse(self.customer.is_dirty())
+
+    def test_narrowing_reinserts_deleted_row(self):
+        self.narrow()
+        seen = []
+
+        def receiver(sender, instance, created, update_fields, **kwargs):
+            seen.append((created, update_fields, instance.saved_changes))
+        post_save.connect(receiver, sender=models.Customer)
+        self.addCleanup(post_save.disconnect, receiver, sender=models.Customer)
+        models.Customer.objects.filter(pk=self.customer.pk).delete()
+        self.customer.name = 'back'
+        self.customer.save()
+        customer = models.Customer.objects.get(pk=self.customer.pk)
+        self.assertEqual((customer.name, customer.company_id), ('back', self.company.pk))
+        self.assertEqual(seen, [(True, None, {'name': None, 'company': None})])
+
+    def test_receivers_see_old_values(self):
+        seen = []
+
+        def receiver(sender, instance, update_fields, **kwargs):
+            seen.append((update_fields, instance.saved_changes))
+        post_save.connect(receiver, sender=models.Customer)
+        self.addCleanup(post_save.disconnect, receiver, sender=models.Customer)
+        self.customer.company = None
+        self.customer.save()
+        self.assertEqual(seen, [(None, {'company': self.company.pk})])
+
+    def test_unchanged_save_still_fires_by_default(self):
+        with self.assertNumQueries(1):
+            self.customer.save()
+        self.assertEqual(self.customer.saved_changes, {})
+        self.assertIn('customer presave', models.signal_log.keys())
+
+    def test_skip_unchanged(self):
+        with self.assertNumQueries(0):
+            self.customer.save(skip_unchanged=True)
+        self.assertEqual(models.signal_log.keys(), [])
+        self.assertEqual(self.customer.saved_changes, {})
+        self.customer.name = 'changed'
+        self.customer.save(skip_unchanged=True)
+        self.assertEqual(sorted(models.signal_log.keys()),
+                         ['customer postsave', 'customer presave'])
+
+    def test_explicit_update_fields_keep_other_changes_dirty(self):
+        self.customer.name = 'name'
+        self.customer.company = None
+        self.customer.save(update_fields=['name'])
+        self.assertEqual(self.customer.saved_changes, {'name': 'dirty'})
+        self.assertEqual(self.customer.get_dirty_fields(), {'company': self.company.pk})
+
+    def test_refresh_from_db_resets_snapshot(self):
+        self.customer.name = 'local'
+        self.customer.refresh_from_db()
+        self.assertFalse(self.customer.is_dirty())
+
+
+class SignalQuerySetTests(TestCase):
+
+    def setUp(self):
+        models.signal_log.clear()
+        self.sent = []
+
+        def record(sender, signal, instances, pks, created, update_fields, **kwargs):
+            self.sent.append((signal, len(instances) if instances else None,
+                              pks and len(pks), created, update_fields))
+        for signal in (pre_bulk_save, post_bulk_save):
+            signal.connect(record, sender=models.Customer, weak=False,
+                           dispatch_uid='signal_queryset_tests')
+            self.addCleanup(signal.disconnect, sender=models.Customer,
+                            dispatch_uid='signal_queryset_tests')
+
+    def test_bulk_create_with_signals(self):
+        customers = [models.Customer(name='bulk %d' % i) for i in range(5)]
+        with self.assertNumQueries(3):
+            created = models.Customer.objects.bulk_create_with_signals(customers, batch_size=2)
+        self.assertEqual(created, customers)
+        self.assertEqual(models.Customer.objects.filter(name__startswith='bulk ').count(), 5)
+        self.assertEqual([(s, n, c) for s, n, _, c, _ in self.sent], [
+            (pre_bulk_save, 2, True), (post_bulk_save, 2, True),
+            (pre_bulk_save, 2, True), (post_bulk_save, 2, True),
+            (pre_bulk_save, 1, True), (post_bulk_save, 1, True),
+        ])
+        self.assertNotIn('customer presave', models.signal_log.keys())
+        self.assertEqual(len(models.signal_log['customer batch presave']), 3)
+        self.assertFalse(customers[0]._state.adding)
+
+    def test_update_with_signals(self):
+        company = models.Company.objects.create(name='target')
+        models.Customer.objects.bulk_create([models.Customer(name='u%d' % i) for i in range(5)])
+        del self.sent[:]
+        qs = models.Customer.objects.filter(name__startswith='u')
+        # One SELECT for the pks, then one UPDATE per batch.
+        with self.assertNumQueries(3):
+            updated = qs.update_with_signals(company=company, batch_size=3)
+        self.assertEqual(updated, 5)
+        self.assertEqual(qs.filter(company=company).count(), 5)
+        fields = frozenset(['company'])
+        self.assertEqual(self.sent, [
+            (pre_bulk_save, None, 3, False, fields), (post_bulk_save, None, 3, False, fields),
+            (pre_bulk_save, None, 2, False, fields), (post_bulk_save, None, 2, False, fields),
+        ])
+        pks = set(qs.values_list('pk', flat=True))
+        logged = models.signal_log['customer batch postsave']
+        self.assertEqual(set(pk for record in logged for pk in record.pk), pks)
+
+
+class DeletePlanTests(TestCase):
+
+    def setUp(self):
+        self.company = models.Company.objects.create(name='doomed')
+        self.category = models.CustomerCategory.objects.create(name='kept')
+        self.customers = [models.Customer.objects.create(name='c%d' % i, company=self.company)
+                          for i in range(3)]
+        self.extras = [models.CustomerExtraJunk.objects.create(customer=c)
+                       for c in self.customers]
+        self.rels = [models.CustomerCategoryRel.objects.create(customer=c, category=self.category)
+                     for c in self.customers]
+        self.customers[0].categories_direct.add(self.category)
+        models.signal_log.clear()
+
+    def test_summary(self):
+        plan = DeletePlan(models.Company.objects.filter(pk=self.company.pk))
+        self.assertEqual(plan.summary(), {
+            'exapp.Company': 1, 'exapp.Customer': 3, 'exapp.CustomerExtraJunk': 3,
+            'exapp.CustomerCategoryRel': 3, 'exapp.Customer_categories_direct': 1,
+        })
+        self.assertEqual(models.Customer.objects.count(), 3)
+
+    def test_one_batched_signal_per_model(self):
+        total, counts = models.Company.objects.filter(pk=self.company.pk).planned_delete()
+        self.assertEqual(counts['exapp.Customer'], 3)
+        self.assertEqual(models.Customer.objects.count(), 0)
+        self.assertEqual(models.CustomerCategory.objects.count(), 1)
+        self.assertEqual(sorted(models.signal_log.keys()), [
+            'customer batch postdelete', 'customer batch predelete',
+            'extra batch postdelete', 'extra batch predelete',
+            'rel batch postdelete', 'rel batch predelete',
+        ])
+        record, = models.signal_log['customer batch predelete']
+        self.assertEqual(sorted(record.pk), sorted(c.pk for c in self.customers))
+
+    def test_per_instance_receivers_still_called(self):
+        calls = []
+
+        @per_instance_delete
+        def per_row(sender, instance, **kwargs):
+            calls.append((signal_name(kwargs['signal']), instance.pk))
+
+        def per_row_unmarked(sender, instance, **kwargs):
+            calls.append('unmarked')
+        for signal in (pre_delete, post_delete):
+            signal.connect(per_row, sender=models.CustomerExtraJunk)
+            signal.connect(per_row_unmarked, sender=models.CustomerExtraJunk)
+            self.addCleanup(signal.disconnect, per_row, sender=models.CustomerExtraJunk)
+            self.addCleanup(signal.disconnect, per_row_unmarked,
+                            sender=models.CustomerExtraJunk)
+        pks = [e.pk for e in self.extras]
+        planned_delete(self.customers)
+        self.assertIsNone(self.customers[0].pk)
+        self.assertEqual(sorted(calls), sorted(
+            [('pre_delete', pk) for pk in pks] + [('post_delete', pk) for pk in pks]))
+
+    def test_per_instance_receivers_are_wrapped(self):
+        calls = []
+
+        @per_instance_delete
+        def per_row(sender, instance, **kwargs):
+            calls.append(instance.pk)
+
+        def factory(signal, sender, receiver):
+            if receiver is not per_row:
+                return receiver
+
+            def wrapped(**kwargs):
+                calls.append(signal_name(signal))
+                return receiver(**kwargs)
+            return wrapped
+        post_delete.connect(per_row, sender=models.CustomerExtraJunk)
+        self.addCleanup(post_delete.disconnect, per_row, sender=models.CustomerExtraJunk)
+        dispatch.add_wrapper(post_delete, factory)
+        self.addCleanup(dispatch.remove_wrapper, post_delete, factory)
+        pk = self.extras[0].pk
+        planned_delete([self.extras[0]])
+        self.assertEqual(calls, ['post_delete', pk])
+
+    def test_related_changed_still_sent(self):
+        events = []
+        related_changed.connect(
+            lambda sender, relation, removed, **kw: events.append((relation, set(removed))),
+            weak=False, dispatch_uid='delete_plan_tests')
+        self.addCleanup(related_changed.disconnect, dispatch_uid='delete_plan_tests')
+        planned_delete([self.customers[0]])
+        self.assertIn(('categories_direct', {self.category.pk}), events)
+        self.assertIn(('company', {self.company.pk}), events)
+
+    def test_plan_runs_once(self):
+        plan = DeletePlan([self.extras[0]])
+        plan.execute()
+        with self.assertRaises(ValueError):
+            plan.execute()
+
+
+class CompiledReceiversTests(SimpleTestCase):
+
+    def setUp(self):
+        self.signal = Signal(providing_args=['value'])
+        dispatch.compile_signal(self.signal)
+        self.addCleanup(dispatch.decompile_signal, self.signal)
+
+    def test_model_signals_compiled_at_ready(self):
+        for signal in dispatch.MODEL_SIGNALS:
+            self.assertTrue(dispatch.is_compiled(signal))
+        self.assertEqual(dispatch.receivers_for(post_save, models.Customer),
+                         tuple(type(post_save)._live_receivers(post_save, models.Customer)))
+
+    def test_rebuilt_on_connect_and_disconnect(self):
+        def receiver(sender, **kwargs):
+            return 'called'
+        self.assertFalse(dispatch.has_receivers(self.signal, models.Customer))
+        self.signal.connect(receiver, sender=models.Customer)
+        self.assertEqual(dispatch.receivers_for(self.signal, models.Customer), (receiver,))
+        self.assertEqual(dispatch.receivers_for(self.signal, models.Company), ())
+        self.assertEqual(self.signal.send(sender=models.Customer, value=1),
+                         [(receiver, 'called')])
+        self.signal.disconnect(receiver, sender=models.Customer)
+        self.assertFalse(dispatch.has_receivers(self.signal, models.Customer))
+        self.assertEqual(self.signal.send(sender=models.Customer, value=1), [])
+
+    def test_dead_weak_receivers_dropped(self):
+        def receiver(sender, **kwargs):
+            pass
+        self.signal.connect(receiver)
+        self.assertTrue(dispatch.has_receivers(self.signal, models.Company))
+        del receiver
+        gc.collect()
+        self.assertFalse(dispatch.has_receivers(self.signal, models.Company))
+
+    def test_strong_receivers_returned_frozen(self):
+        def receiver(sender, **kwargs):
+            pass
+        self.signal.connect(receiver, weak=False)
+        first = dispatch.receivers_for(self.signal, None)
+        self.assertIs(dispatch.receivers_for(self.signal, None), first)
+
+    def test_connect_and_disconnect_left_alone(self):
+        for signal in dispatch.MODEL_SIGNALS:
+            self.assertNotIn('connect', signal.__dict__)
+            self.assertNotIn('disconnect', signal.__dict__)
+
+    def test_shares_django_receiver_cache(self):
+        signal = Signal(use_caching=True)
+        dispatch.compile_signal(signal)
+        self.addCleanup(dispatch.decompile_signal, signal)
+
+        def receiver(sender, **kwargs):
+            return 'called'
+        signal.connect(receiver, weak=False)
+        self.assertEqual(dispatch.receivers_for(signal, models.Customer), (receiver,))
+        self.assertEqual(dispatch.receivers_for(signal, None), (receiver,))
+        self.assertEqual(tuple(signal.sender_receivers_cache[models.Customer]), (receiver,))
+        signal.disconnect(receiver)
+        self.assertEqual(len(signal.sender_receivers_cache), 0)
+        self.assertEqual(signal.send(sender=models.Customer), [])
+
+    def test_decompile_restores_dispatch(self):
+        dispatch.decompile_signal(self.signal)
+        self.assertFalse(dispatch.is_compiled(self.signal))
+        self.assertNotIn('_live_receivers', self.signal.__dict__)
+        self.assertNotIn('connect', self.signal.__dict__)
+
+
+class JournalTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.journal = Journal(self.directory, flush_records=3, flush_interval=3600)
+        self.addCleanup(self.journal.close)
+        self.reader = JournalReader(self.directory)
+
+    def test_group_flush(self):
+        self.journal.append('post_save', 'exapp.Customer', 1)
+        self.journal.append('post_save', 'exapp.Customer', 2)
+        self.assertEqual(self.reader.count(), 0)
+        self.journal.append('post_save', 'exapp.Customer', 3)
+        self.assertEqual(self.reader.count(), 3)
+
+    def test_scan_and_filters(self):
+        self.journal.append('post_save', 'exapp.Customer', 1, created=True,
+                            fields=['name'], timestamp=100)
+        self.journal.append('post_save', 'exapp.Company', 7, fields=['name'], timestamp=200)
+        self.journal.append('related_changed', 'exapp.Customer', 1,
+                            fields=['categories_direct'], timestamp=300)
+        self.journal.append('post_delete', 'exapp.Customer', 1, timestamp=400)
+        self.journal.flush()
+        events = list(self.reader.scan())
+        self.assertEqual(events[0], JournalEvent(100, 'post_save', 'exapp.Customer', 1, True,
+                                                 frozenset(['name'])))
+        self.assertEqual([e.pk for e in self.reader.scan(model='exapp.Customer')], [1, 1, 1])
+        self.assertEqual([e.timestamp for e in self.reader.scan(since=200, until=400)],
+                         [200, 300])
+        self.assertEqual(self.reader.count(created=True), 1)
+        self.assertEqual(self.reader.count(model='exapp.Customer', field='categories_direct'), 1)
+        self.assertEqual(self.reader.count(signal='pre_save'), 0)
+        self.assertEqual(self.reader.count_by('model'),
+                         {'exapp.Customer': 3, 'exapp.Company': 1})
+        self.assertEqual(self.reader.count_by('signal', model='exapp.Customer'),
+                         {'post_save': 1, 'related_changed': 1, 'post_delete': 1})
+
+    def test_segments_rotate(self):
+        journal = Journal(self.directory, segment_bytes=RECORD.size * 2, flush_records=1)
+        self.addCleanup(journal.close)
+        for pk in range(5):
+            journal.append('post_save', 'exapp.Customer', pk, timestamp=pk)
+        journal.close()
+        self.assertEqual(len(self.reader.segments()), 3)
+        self.assertEqual([e.pk for e in self.reader.scan(since=1, until=4)], [1, 2, 3])
+
+    def test_ignores_partial_record(self):
+        self.journal.append('post_save', 'exapp.Customer', 1)
+        self.journal.close()
+        segment, = self.reader.segments()
+        with open(segment.path, 'ab') as f:
+            f.write(b'\0' * 5)
+        self.assertEqual(self.reader.count(), 1)
+
+    def test_record_signal(self):
+        def receiver(sender, **kwargs):
+            self.journal.record_signal(None, sender, kwargs)
+        for signal in (post_save, related_changed):
+            signal.connect(receiver, sender=models.Customer)
+            self.addCleanup(signal.disconnect, receiver, sender=models.Customer)
+        customer = models.Customer.objects.create(name='journaled')
+        customer.name = 'renamed'
+        customer.save()
+        category = models.CustomerCategory.objects.create(name='journal cat')
+        customer.categories_direct.add(category)
+        self.journal.flush()
+        self.assertEqual([(e.signal, e.pk, e.created, e.fields) for e in self.reader.scan()], [
+            ('post_save', customer.pk, True, frozenset(['name', 'company'])),
+            ('post_save', customer.pk, False, frozenset(['name'])),
+            ('related_changed', customer.pk, False, frozenset(['categories_direct'])),
+        ])
+
+    def test_record_reverse_relation(self):
+        def receiver(sender, **kwargs):
+            self.journal.record_signal(None, sender, kwargs)
+        related_changed.connect(receiver, sender=models.Customer)
+        self.addCleanup(related_changed.disconnect, receiver, sender=models.Customer)
+        company = models.Company.objects.create(name='journaled')
+        customer = models.Customer.objects.create(name='journaled')
+        company.customers.add(customer)
+        self.journal.flush()
+        self.assertEqual(
+            [(e.signal, e.model, e.pk, e.fields) for e in self.reader.scan()],
+            [('related_changed', 'exapp.Company', company.pk, frozenset(['customers']))])
+
+
+    def test_record_bulk_create_without_returned_pks(self):
+        def receiver(sender, **kwargs):
+            self.journal.record_signal(None, sender, kwargs)
+        post_bulk_save.connect(receiver, sender=models.Company)
+        self.addCleanup(post_bulk_save.disconnect, receiver, sender=models.Company)
+        models.Company.objects.bulk_create_with_signals(
+            [models.Company(name='bulk 1'), models.Company(name='bulk 2')])
+        models.Company.objects.bulk_create_with_signals(
+            [models.Company(pk=100, name='bulk 3'), models.Company(pk=101, name='bulk 4')])
+        self.journal.flush()
+        # SQLite doesn't return the pks of bulk inserted rows.
+        self.assertEqual([(e.signal, e.model, e.pk, e.created) for e in self.reader.scan()], [
+            ('post_bulk_save', 'exapp.Company', None, True),
+            ('post_bulk_save', 'exapp.Company', 100, True),
+            ('post_bulk_save', 'exapp.Company', 101, True),
+        ])
+
+
+class OutboxTests(TestCase):
+
+    outbox_models = (models.Customer, models.Company, models.CustomerCategoryRel)
+
+    def setUp(self):
+        outbox.connect(self.outbox_models)
+        self.addCleanup(outbox.disconnect, self.outbox_models)
+
+    def rows(self):
+        return list(models.SignalOutbox.objects.order_by('pk').values_list(
+            'signal', 'model', 'object_pk', 'created', 'fields'))
+
+    def test_saves_and_deletes_add_rows(self):
+        customer = models.Customer.objects.create(name='boxed')
+        customer.name = 'renamed'
+        customer.save()
+        models.CustomerCategory.objects.create(name='not boxed')
+        pk = str(customer.pk)
+        customer.delete()
+        self.assertEqual(self.rows(), [
+            ('post_save', 'exapp.Customer', pk, True, 'company,name'),
+            ('post_save', 'exapp.Customer', pk, False, 'name'),
+            ('post_delete', 'exapp.Customer', pk, False, ''),
+        ])
+
+    def test_one_insert_per_event(self):
+        company = models.Company.objects.create(name='boxed')
+        company.name = 'renamed'
+        with self.assertNumQueries(2):
+            company.save()
+
+    def test_batched_signals_add_a_row_per_pk(self):
+        models.Company.objects.create(name='a')
+        models.Company.objects.create(name='b')
+        models.SignalOutbox.objects.all().delete()
+        models.Company.objects.all().update_with_signals(name='c')
+        pks = sorted(str(pk) for pk in models.Company.objects.values_list('pk', flat=True))
+        self.assertEqual(sorted(row[2] for row in self.rows()), pks)
+        self.assertEqual(set(row[:2] + row[3:] for row in self.rows()),
+                         set([('post_bulk_save', 'exapp.Company', False, 'name')]))
+
+    def test_rolled_back_write_leaves_no_row(self):
+        try:
+            with transaction.atomic():
+                models.Customer.objects.create(name='rolled back')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(self.rows(), [])
+
+    def test_relay_in_batches(self):
+        for i in range(5):
+            models.Company.objects.create(name='c%d' % i)
+        sink = outbox.MemorySink()
+        self.assertEqual(outbox.relay(sink, batch_size=2), 5)
+        self.assertEqual([len(batch) for batch in sink.batches], [2, 2, 1])
+        ids = [event['id'] for event in sink.events]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(sink.events[0]['signal'], 'post_save')
+        self.assertEqual(sink.events[0]['fields'], ['name'])
+        self.assertFalse(models.SignalOutbox.objects.exists())
+
+    def quiet(self):
+        outbox.logger.disabled = True
+        self.addCleanup(setattr, outbox.logger, 'disabled', False)
+
+    def test_failed_send_keeps_rows(self):
+        class BrokenSink(outbox.Sink):
+            def send(self, events):
+                raise IOError('downstream is down')
+        models.Company.objects.create(name='kept')
+        self.quiet()
+        with self.assertRaises(IOError):
+            outbox.relay(BrokenSink(), backoff=0, max_attempts=2)
+        self.assertEqual(len(self.rows()), 1)
+
+    def test_failed_send_is_retried(self):
+        class FlakySink(outbox.MemorySink):
+            failures = 2
+
+            def send(self, events):
+                if self.failures:
+                    self.failures -= 1
+                    raise IOError('downstream is down')
+                super(FlakySink, self).send(events)
+        models.Company.objects.create(name='retried')
+        sink = FlakySink()
+        self.quiet()
+        self.assertEqual(outbox.relay(sink, backoff=0), 1)
+        self.assertEqual(len(sink.batches), 1)
+        self.assertEqual(self.rows(), [])
+
+    def test_sink_options_merged_for_configured_sink(self):
+        config = {'sink': 'exapp.outbox.FileSink', 'sink_options': {'path': '/configured'}}
+        with self.settings(SIGNAL_OUTBOX=config):
+            self.assertEqual(outbox.get_sink('exapp.outbox.FileSink').path, '/configured')
+            self.assertEqual(outbox.get_sink('exapp.outbox.FileSink', path='/given').path,
+                             '/given')
+            self.assertIsInstance(outbox.get_sink('exapp.outbox.MemorySink'),
+                                  outbox.MemorySink)
+
+    def test_command_writes_json_lines(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'events.jsonl')
+        models.Company.objects.create(name='filed')
+        models.Company.objects.create(name='filed too')
+        call_command('relay_signals', file=path, once=True, batch_size=1, verbosity=0)
+        with open(path) as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual([e['model'] for e in events], ['exapp.Company', 'exapp.Company'])
+        self.assertFalse(models.SignalOutbox.objects.exists())
+
+
+def _rows(objs):
+    return [tuple(getattr(obj, f.attname) for f in obj._meta.concrete_fields) for obj in objs]
+
+
+class RelatedCacheTests(TransactionTestCase):
+
+    def setUp(self):
+        self.cache = RelatedCache(maxsize=100).connect(
+            [models.Company, models.Customer, models.CustomerCategory,
+             models.CustomerExtraJunk, models.CustomerCategoryRel])
+        self.addCleanup(self.cache.disconnect)
+        self.company = models.Company.objects.create(name='cached')
+        self.other = models.Company.objects.create(name='other')
+        self.customer = models.Customer.objects.create(name='c1', company=self.company)
+        self.customer2 = models.Customer.objects.create(name='c2', company=self.company)
+        self.category = models.CustomerCategory.objects.create(name='cat')
+
+    def fresh(self, instance, accessor):
+        if accessor == 'extrajunk':
+            return list(models.CustomerExtraJunk.objects.filter(customer=instance))
+        return list(getattr(instance, accessor).order_by('pk'))
+
+    def assertFresh(self, instance, accessor):
+        self.assertEqual(_rows(self.cache.get(instance, accessor)),
+                         _rows(self.fresh(instance, accessor)))
+
+    def warm(self, *pairs):
+        for instance, accessor in pairs:
+            self.cache.get(instance, accessor)
+
+    def test_hit_makes_no_query(self):
+        self.warm((self.company, 'customers'))
+        with self.assertNumQueries(0):
+            customers = self.cache.get(self.company, 'customers')
+        self.assertEqual([c.name for c in customers], ['c1', 'c2'])
+        self.assertEqual(self.cache.get_pks(self.company, 'customers'),
+                         frozenset([self.customer.pk, self.customer2.pk]))
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+    def test_untracked_relation_is_refused(self):
+        with self.assertRaises(ValueError):
+            self.cache.get(self.customer, 'customercategoryrel_set')
+
+    def test_lru_eviction(self):
+        cache = RelatedCache(maxsize=2).connect([models.Company, models.Customer])
+        self.addCleanup(cache.disconnect)
+        cache.get(self.company, 'customers')
+        cache.get(self.other, 'customers')
+        cache.get(self.company, 'customers')
+        cache.get(self.customer, 'categories_direct')
+        self.assertEqual(cache.stats()['evictions'], 1)
+        with self.assertNumQueries(0):
+            cache.get(self.company, 'customers')
+        with self.assertNumQueries(1):
+            cache.get(self.other, 'customers')
+
+    def test_1to1_forward(self):
+        self.warm((self.customer, 'extrajunk'))
+        extra = models.CustomerExtraJunk()
+        extra.customer = self.customer
+        extra.save()
+        self.assertFresh(self.customer, 'extrajunk')
+
+    def test_1to1_reverse(self):
+        extra = models.CustomerExtraJunk.objects.create(customer=self.customer)
+        self.warm((self.customer, 'extrajunk'), (self.customer2, 'extrajunk'))
+        self.customer2.extrajunk = extra
+        extra.save()
+        self.assertFresh(self.customer, 'extrajunk')
+        self.assertFresh(self.customer2, 'extrajunk')
+
+    def test_1toM_forward(self):
+        self.warm((self.company, 'customers'), (self.other, 'customers'))
+        self.customer.company = self.other
+        self.customer.save()
+        self.assertFresh(self.company, 'customers')
+        self.assertFresh(self.other, 'customers')
+
+    def test_1toM_reverse_add_and_remove(self):
+        self.warm((self.company, 'customers'), (self.other, 'customers'))
+        self.other.customers.add(self.customer)
+        self.assertFresh(self.company, 'customers')
+        self.assertFresh(self.other, 'customers')
+        self.other.customers.remove(self.customer)
+        self.assertFresh(self.other, 'customers')
+
+    def test_1toM_reverse_assignment(self):
+        self.warm((self.company, 'customers'), (self.other, 'customers'))
+        manager = self.other.customers
+        if hasattr(manager, 'set'):
+            manager.set([self.customer2])
+        else:
+            self.other.customers = [self.customer2]
+        self.assertFresh(self.company, 'customers')
+        self.assertFresh(self.other, 'customers')
+
+    def test_related_row_saved(self):
+        self.warm((self.company, 'customers'))
+        self.customer.name = 'renamed'
+        self.customer.save()
+        self.assertFresh(self.company, 'customers')
+
+    def test_m2m_indirect(self):
+        self.warm((self.customer, 'categories_indirect'), (self.category, 'customers_indirect'))
+        rel = models.CustomerCategoryRel(customer=self.customer, category=self.category)
+        rel.save()
+        self.assertFresh(self.customer, 'categories_indirect')
+        self.assertFresh(self.category, 'customers_indirect')
+        rel.delete()
+        self.assertFresh(self.customer, 'categories_indirect')
+        self.assertFresh(self.category, 'customers_indirect')
+
+    def test_m2m_direct(self):
+        self.warm((self.customer, 'categories_direct'), (self.category, 'customers_direct'))
+        self.customer.categories_direct.add(self.category)
+        self.assertFresh(self.customer, 'categories_direct')
+        self.assertFresh(self.category, 'customers_direct')
+        self.category.customers_direct.add(self.customer2)
+        self.assertFresh(self.customer2, 'categories_direct')
+        self.assertFresh(self.category, 'customers_direct')
+        self.category.customers_direct.clear()
+        self.assertFresh(self.customer, 'categories_direct')
+        self.assertFresh(self.category, 'customers_direct')
+
+    def test_deletion(self):
+        extra = models.CustomerExtraJunk.objects.create(customer=self.customer)
+        self.customer.categories_direct.add(self.category)
+        self.warm((self.customer, 'extrajunk'), (self.company, 'customers'),
+                  (self.category, 'customers_direct'))
+        extra.delete()
+        self.assertFresh(self.customer, 'extrajunk')
+        self.customer.delete()
+        self.assertFresh(self.company, 'customers')
+        self.assertFresh(self.category, 'customers_direct')
+        self.warm((self.category, 'customers_direct'))
+        self.category.delete()
+        self.assertEqual(len(self.cache), 1)
+
+    def test_batched_saves_and_deletes(self):
+        self.warm((self.company, 'customers'), (self.other, 'customers'))
+        models.Customer.objects.filter(pk=self.customer.pk).update_with_signals(
+            company=self.other)
+        self.assertFresh(self.company, 'customers')
+        self.assertFresh(self.other, 'customers')
+        models.Customer.objects.bulk_create_with_signals(
+            [models.Customer(name='c3', company=self.company)])
+        self.assertFresh(self.company, 'customers')
+        models.Customer.objects.filter(name='c3').planned_delete()
+        self.assertFresh(self.company, 'customers')
+
+    def test_bulk_related_helpers(self):
+        self.warm((self.company, 'customers'), (self.other, 'customers'))
+        related.bulk_add(self.other, 'customers', [self.customer])
+        self.assertFresh(self.company, 'customers')
+        self.assertFresh(self.other, 'customers')
+
+    def test_rolled_back_change_is_not_cached(self):
+        self.warm((self.other, 'customers'))
+        try:
+            with transaction.atomic():
+                self.other.customers.add(self.customer)
+                self.assertFresh(self.other, 'customers')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFresh(self.other, 'customers')
+
+    def test_cached_again_after_commit(self):
+        with transaction.atomic():
+            self.other.customers.add(self.customer)
+            self.warm((self.other, 'customers'))
+            self.assertEqual(len(self.cache), 0)
+        self.warm((self.other, 'customers'))
+        with self.assertNumQueries(0):
+            customers = self.cache.get(self.other, 'customers')
+        self.assertEqual(_rows(customers), _rows(self.fresh(self.other, 'customers')))
+
+
+class RelationCountsTests(TestCase):
+
+    def setUp(self):
+        self.counts = RelationCounts().connect()
+        self.addCleanup(self.counts.disconnect)
+        self.company = models.Company.objects.create(name='counted')
+        self.other = models.Company.objects.create(name='other')
+        self.customer = models.Customer.objects.create(name='c1', company=self.company)
+        self.customer2 = models.Customer.objects.create(name='c2', company=self.company)
+        self.category = models.CustomerCategory.objects.create(name='cat')
+        self.category2 = models.CustomerCategory.objects.create(name='cat2')
+        self.companies = [self.company, self.other]
+        self.categories = [self.category, self.category2]
+        # Create the counter rows, so changes below go through F() updates.
+        self.counts.get_many(self.companies, 'customers')
+        self.counts.get_many(self.categories, 'customers_direct')
+        self.counts.get_many(self.categories, 'customers_indirect')
+
+    def assertCounts(self):
+        for accessor, owners in (('customers', self.companies),
+                                 ('customers_direct', self.categories),
+                                 ('customers_indirect', self.categories)):
+            self.assertEqual(
+                self.counts.get_many(owners, accessor),
+                dict((owner.pk, getattr(owner, accessor).count()) for owner in owners))
+
+    def test_read_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.counts.get(self.company, 'customers'), 2)
+
+    def test_missing_row_is_counted(self):
+        models.RelationCount.objects.all().delete()
+        self.assertEqual(self.counts.get(self.company, 'customers'), 2)
+        self.assertTrue(models.RelationCount.objects.filter(object_pk=str(self.company.pk))
+                        .exists())
+
+    def test_fk_reassignment(self):
+        self.customer.company = self.other
+        self.customer.save()
+        self.assertCounts()
+        self.customer.company = None
+        self.customer.save()
+        self.assertCounts()
+
+    def test_reverse_add_remove_and_assign(self):
+        self.other.customers.add(self.customer)
+        self.assertCounts()
+        self.other.customers.remove(self.customer)
+        self.assertCounts()
+        manager = self.other.customers
+        if hasattr(manager, 'set'):
+            manager.set([self.customer, self.customer2])
+        else:
+            self.other.customers = [self.customer, self.customer2]
+        self.assertCounts()
+        self.other.customers.clear()
+        self.assertCounts()
+
+    def test_m2m_direct(self):
+        self.customer.categories_direct.add(self.category, self.category2)
+        self.category.customers_direct.add(self.customer2)
+        self.assertCounts()
+        self.customer.categories_direct.clear()
+        self.assertCounts()
+        self.category.customers_direct.clear()
+        self.assertCounts()
+
+    def test_through_rows(self):
+        rel = models.CustomerCategoryRel.objects.create(
+            customer=self.customer, category=self.category)
+        models.CustomerCategoryRel.objects.create(customer=self.customer2, category=self.category)
+        self.assertCounts()
+        rel.category = self.category2
+        rel.save()
+        self.assertCounts()
+        rel.delete()
+        self.assertCounts()
+
+    def test_deletes(self):
+        self.customer.categories_direct.add(self.category)
+        models.CustomerCategoryRel.objects.create(customer=self.customer, category=self.category2)
+        self.customer.delete()
+        self.assertCounts()
+        models.Customer.objects.filter(pk=self.customer2.pk).planned_delete()
+        self.assertCounts()
+        self.company.delete()
+        self.assertFalse(models.RelationCount.objects.filter(
+            model='exapp.Company', object_pk=str(self.company.pk)).exists())
+
+    def test_batched_saves(self):
+        models.Customer.objects.bulk_create_with_signals(
+            [models.Customer(name='c3', company=self.other),
+             models.Customer(name='c4', company=self.company)])
+        self.assertCounts()
+        models.Customer.objects.filter(company=self.company).update_with_signals(
+            company=self.other)
+        self.assertCounts()
+        models.Customer.objects.filter(name='c1').update_with_signals(name='renamed')
+        self.assertCounts()
+
+    def test_recount_repairs_drift(self):
+        models.Customer.objects.filter(pk=self.customer.pk).update(company=self.other)
+        models.RelationCount.objects.create(model='exapp.Company', relation='customers',
+                                            object_pk='0', count=3)
+        relation = self.counts.relations[(models.Company, 'customers')]
+        self.assertEqual(self.counts.recount(relation, dry_run=True), (2, 2, 0, 1))
+        self.assertEqual(self.counts.get(self.other, 'customers'), 0)
+        call_command('recount', 'exapp.Company.customers', verbosity=0)
+        self.assertCounts()
+        self.assertEqual(self.counts.recount(relation), (2, 0, 0, 0))
+
+
+class PrefetchReceiverTests(TestCase):
+
+    def setUp(self):
+        companies = [models.Company.objects.create(name='co%d' % i) for i in range(3)]
+        category = models.CustomerCategory.objects.create(name='pre cat')
+        for i in range(6):
+            customer = models.Customer.objects.create(name='pre%d' % i,
+                                                      company=companies[i % 3])
+            customer.categories_direct.add(category)
+        # Fresh instances, without cached relations.
+        self.customers = list(models.Customer.objects.filter(name__startswith='pre'))
+        self.seen = []
+
+    def connect(self, **kwargs):
+        @prefetching_receiver(post_save, sender=models.Customer, weak=False,
+                              dispatch_uid='prefetch test', **kwargs)
+        def customer_saved(sender, instance, **kw):
+            self.seen.append((instance.company.name,
+                              [c.name for c in instance.categories_direct.all()]))
+        self.addCleanup(post_save.disconnect, sender=models.Customer,
+                        dispatch_uid='prefetch test')
+
+    def save_all_coalesced(self):
+        block = coalesce_saves()
+        block.__enter__()
+        for customer in self.customers:
+            customer.save()
+        return block
+
+    def test_burst_loads_relations_once(self):
+        self.connect(prefetch=['company', 'categories_direct'])
+        block = self.save_all_coalesced()
+        with self.assertNumQueries(2):
+            block.__exit__(None, None, None)
+        self.assertEqual(len(self.seen), 6)
+        self.assertEqual(self.seen[0], ('co0', ['pre cat']))
+
+    def test_without_prefetch_each_call_queries(self):
+        self.connect()
+        block = self.save_all_coalesced()
+        with self.assertNumQueries(12):
+            block.__exit__(None, None, None)
+
+    def test_m2m_prefetch_is_not_kept(self):
+        self.connect(prefetch=['categories_direct'])
+        self.save_all_coalesced().__exit__(None, None, None)
+        customer = self.customers[0]
+        self.assertNotIn('categories_direct',
+                         getattr(customer, '_prefetched_objects_cache', {}))
+        customer.categories_direct.clear()
+        self.assertEqual(list(customer.categories_direct.all()), [])
+
+    def test_deferred_receiver_prefetch(self):
+        calls = []
+
+        @deferred_receiver(post_save, sender=models.Customer, prefetch=['company'])
+        def customer_saved(sender, instance, **kwargs):
+            calls.append(instance.company.name)
+        self.addCleanup(post_save.disconnect, customer_saved.deferred_proxies[0],
+                        sender=models.Customer)
+        block = self.save_all_coalesced()
+        with self.assertNumQueries(1):
+            block.__exit__(None, None, None)
+        self.assertEqual(sorted(calls), ['co0', 'co0', 'co1', 'co1', 'co2', 'co2'])
+
+    def test_single_send_is_unchanged(self):
+        self.connect(prefetch=['company', 'categories_direct'])
+        self.customers[0].save()
+        self.assertEqual(self.seen, [('co0', ['pre cat'])])
+
+
+class BusTests(SimpleTestCase):
+
+    def setUp(self):
+        self.transport = bus.MemoryTransport(capacity=3)
+        self.broadcaster = bus.Broadcaster(self.transport, batch_size=4, flush_interval=None)
+        self.subscriber = bus.Subscriber(self.transport)
+        self.addCleanup(self.subscriber.stop)
+        self.received = []
+
+        def remote(sender, **kwargs):
+            self.received.append((sender, kwargs['event'], kwargs['pk'], kwargs['fields']))
+        remote_signal.connect(remote, weak=False, dispatch_uid='bus test')
+        self.addCleanup(remote_signal.disconnect, dispatch_uid='bus test')
+
+    def test_events_are_merged_and_batched(self):
+        self.broadcaster.publish('post_save', 'exapp.Customer', 1, ['name'])
+        self.broadcaster.publish('post_save', 'exapp.Customer', 1, ['company'])
+        self.broadcaster.publish('post_save', 'exapp.Customer', 2)
+        self.assertEqual(self.subscriber.poll(), [])
+        self.broadcaster.flush()
+        events = self.subscriber.poll()
+        self.assertEqual([(e.signal, e.model, e.pk, e.fields) for e in events], [
+            ('post_save', 'exapp.Customer', 1, ('company', 'name')),
+            ('post_save', 'exapp.Customer', 2, ())])
+        self.assertEqual(self.received[0], (models.Customer, 'post_save', 1, ('company', 'name')))
+
+    def test_full_batch_is_sent(self):
+        for pk in range(5):
+            self.broadcaster.publish('post_delete', 'exapp.Company', pk)
+        self.assertEqual(len(self.subscriber.poll()), 4)
+        self.assertEqual(self.broadcaster.stats['batches'], 1)
+
+    def test_large_batches_are_split(self):
+        self.transport.max_payload = 150
+        for pk in range(4):
+            self.broadcaster.publish('post_save', 'exapp.Customer', pk, ['name'])
+        self.assertEqual(len(self.subscriber.poll()), 4)
+        self.assertGreater(self.broadcaster.stats['batches'], 1)
+
+    def test_backlog_collapses_per_model(self):
+        self.broadcaster.batch_size = 100
+        self.broadcaster.max_pending = 3
+        for pk in range(3):
+            self.broadcaster.publish('post_save', 'exapp.Customer', pk)
+        self.broadcaster.publish('post_save', 'exapp.Company', 1)
+        self.broadcaster.flush()
+        self.assertEqual([(e.signal, e.model, e.pk) for e in self.subscriber.poll()], [
+            (None, 'exapp.Customer', None), (None, 'exapp.Company', None)])
+        self.assertEqual(self.broadcaster.stats['collapsed'], 4)
+
+    def test_dropped_batch_signals_everything_changed(self):
+        self.broadcaster.batch_size = 1
+        for pk in range(5):
+            self.broadcaster.publish('post_save', 'exapp.Customer', pk)
+        self.assertEqual(self.broadcaster.stats['dropped'], 2)
+        self.subscriber.poll()
+        self.broadcaster.publish('post_save', 'exapp.Customer', 9)
+        self.assertEqual([(e.signal, e.pk) for e in self.subscriber.poll()],
+                         [(None, None), ('post_save', 9)])
+        self.assertEqual(self.received[-2][0], None)
+
+    def test_own_events_are_ignored(self):
+        self.subscriber.ignore = self.broadcaster.origin
+        self.broadcaster.publish('post_save', 'exapp.Customer', 1)
+        self.broadcaster.flush()
+        self.assertEqual(self.subscriber.poll(), [])
+
+    def test_unknown_models_are_skipped(self):
+        self.broadcaster.publish('post_save', 'gone.Model', 1)
+        self.broadcaster.flush()
+        self.assertEqual(len(self.subscriber.poll()), 1)
+        self.assertEqual(self.received, [])
+
+    def quiet(self):
+        bus.logger.disabled = True
+        self.addCleanup(setattr, bus.logger, 'disabled', False)
+
+    def test_oversized_event_is_dropped(self):
+        self.quiet()
+        self.transport.max_payload = 150
+        self.broadcaster.publish('post_save', 'exapp.Customer', 0)
+        self.broadcaster.flush()
+        self.subscriber.poll()
+        self.broadcaster.publish('post_save', 'exapp.Customer', 1, ['f%d' % i for i in range(50)])
+        self.broadcaster.flush()
+        self.assertEqual(self.broadcaster.stats['oversized'], 1)
+        self.broadcaster.publish('post_save', 'exapp.Customer', 2)
+        self.broadcaster.flush()
+        self.assertEqual([(e.signal, e.pk) for e in self.subscriber.poll()],
+                         [(None, None), ('post_save', 2)])
+
+    def test_send_errors_do_not_stop_the_flush_thread(self):
+        self.quiet()
+        broadcaster = bus.Broadcaster(self.transport, flush_interval=0.01)
+        self.addCleanup(broadcaster.close)
+        send = self.transport.send
+        failures = []
+
+        def flaky_send(payload):
+            if failures:
+                raise failures.pop()
+            return send(payload)
+        self.transport.send = flaky_send
+        deadline = time.time() + 5
+        broadcaster.publish('post_save', 'exapp.Customer', 0)
+        while not self.subscriber.poll(timeout=0.1) and time.time() < deadline:
+            pass
+        failures.append(OSError(errno.EPERM, 'refused'))
+        broadcaster.publish('post_save', 'exapp.Customer', 1)
+        while not broadcaster.stats['errors'] and time.time() < deadline:
+            time.sleep(0.01)
+        broadcaster.publish('post_save', 'exapp.Customer', 2)
+        events = []
+        while len(events) < 2 and time.time() < deadline:
+            events.extend(self.subscriber.poll(timeout=0.1))
+        self.assertEqual(broadcaster.stats['errors'], 1)
+        self.assertEqual([(e.signal, e.pk) for e in events], [(None, None), ('post_save', 2)])
+
+    @unittest.skipUnless(hasattr(bus.socket, 'AF_UNIX'), "needs Unix sockets")
+    def test_unix_datagrams(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        transport = bus.UnixDatagramTransport(directory)
+        self.addCleanup(transport.close)
+        subscriber = bus.Subscriber(transport)
+        self.addCleanup(subscriber.stop)
+        stale = bus.Subscriber(transport)
+        stale.endpoint.sock.close()
+        broadcaster = bus.Broadcaster(transport, flush_interval=None)
+        broadcaster.publish('post_delete', 'exapp.Company', 3)
+        broadcaster.flush()
+        events = subscriber.poll(timeout=1)
+        self.assertEqual([(e.signal, e.model, e.pk) for e in events],
+                         [('post_delete', 'exapp.Company', 3)])
+        self.assertFalse(os.path.exists(stale.endpoint.path))
+
+
+class BusSignalTests(TransactionTestCase):
+
+    def setUp(self):
+        transport = bus.MemoryTransport()
+        self.broadcaster = bus.Broadcaster(transport, flush_interval=None)
+        self.subscriber = bus.Subscriber(transport)
+        self.addCleanup(self.subscriber.stop)
+        publishing = [models.Company, models.Customer]
+        bus.connect(self.broadcaster, publishing)
+        self.addCleanup(bus.disconnect, self.broadcaster, publishing)
+
+    def events(self):
+        self.broadcaster.flush()
+        return set((e.signal, e.model, e.pk, e.fields) for e in self.subscriber.poll())
+
+    def test_model_signals_are_published(self):
+        company = models.Company.objects.create(name='bus')
+        customer = models.Customer.objects.create(name='c', company=company)
+        pk = customer.pk
+        customer.name = 'renamed'
+        customer.save(update_fields=['name'])
+        customer.delete()
+        self.assertEqual(self.events(), {
+            ('post_save', 'exapp.Company', company.pk, ('name',)),
+            ('post_save', 'exapp.Customer', pk, ('company', 'name')),
+            ('related_changed', 'exapp.Customer', pk, ('company',)),
+            ('post_delete', 'exapp.Customer', pk, ())})
+
+    def test_reverse_relation_is_published_for_its_owner(self):
+        company = models.Company.objects.create(name='bus')
+        customer = models.Customer.objects.create(name='c')
+        self.events()
+        company.customers.add(customer)
+        self.assertIn(('related_changed', 'exapp.Company', company.pk, ('customers',)),
+                      self.events())
+
+    @unittest.skipUnless(hasattr(transaction, 'on_commit'), "needs on_commit")
+    def test_published_after_commit(self):
+        with transaction.atomic():
+            company = models.Company.objects.create(name='bus')
+            self.assertEqual(self.events(), set())
+        self.assertEqual(self.events(), {('post_save', 'exapp.Company', company.pk, ('name',))})
+
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                models.Company.objects.create(name='rolled back')
+                raise ValueError
+        self.assertEqual(self.events(), set())
+
+    def test_remote_events_invalidate_related_cache(self):
+        cache = RelatedCache().connect([models.Company, models.Customer])
+        self.addCleanup(cache.disconnect)
+        company = models.Company.objects.create(name='bus')
+        customer = models.Customer.objects.create(name='c', company=company)
+        cache.get(company, 'customers')
+        models.Customer.objects.filter(pk=customer.pk).update(name='elsewhere')
+        remote_signal.send(sender=models.Customer, event='post_save', pk=customer.pk,
+                           fields=('name',), origin='other')
+        self.assertEqual([c.name for c in cache.get(company, 'customers')], ['elsewhere'])
+        cache.get(company, 'customers')
+        remote_signal.send(sender=None, event=None, pk=None, fields=(), origin='other')
+        self.assertEqual(len(cache), 0)
+
+    def test_remote_reverse_relation_change_invalidates_related_cache(self):
+        cache = RelatedCache().connect([models.Company, models.Customer])
+        self.addCleanup(cache.disconnect)
+        company = models.Company.objects.create(name='bus')
+        customer = models.Customer.objects.create(name='c')
+        # Labelled with the instance's model, and with the field's (older publishers).
+        for sender in (models.Company, models.Customer):
+            models.Customer.objects.filter(pk=customer.pk).update(company=None)
+            cache.clear()
+            self.assertEqual(cache.get_pks(company, 'customers'), frozenset())
+            models.Customer.objects.filter(pk=customer.pk).update(company=company)
+            remote_signal.send(sender=sender, event='related_changed', pk=company.pk,
+                               fields=('customers',), origin='other')
+            self.assertEqual(cache.get_pks(company, 'customers'), frozenset([customer.pk]))
+
+
+class ReplayTests(TestCase):
+
+    def setUp(self):
+        company = models.Company.objects.create(name='replayed')
+        self.customers = [models.Customer.objects.create(name='r%d' % i, company=company)
+                          for i in range(5)]
+        models.signal_log.clear()
+        self.seen = []
+        self.fail_at = None
+
+        def backfill(sender, instance, created, replay=False, **kwargs):
+            if instance.pk == self.fail_at:
+                raise RuntimeError("interrupted")
+            self.seen.append((instance.pk, created, replay))
+        post_save.connect(backfill, sender=models.Customer, weak=False,
+                          dispatch_uid='replay test')
+        self.addCleanup(post_save.disconnect, sender=models.Customer,
+                        dispatch_uid='replay test')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def pks(self):
+        return [c.pk for c in self.customers]
+
+    def test_only_selected_receivers_run(self):
+        report = replay.replay(['backfill'], models=['exapp.Customer', 'exapp.Company'])
+        self.assertEqual(self.seen, [(pk, False, True) for pk in self.pks()])
+        self.assertEqual(models.signal_log.keys(), [])
+        self.assertEqual(report.rows, {'exapp.Customer': 5})
+        self.assertEqual(report.total, 5)
+
+    def test_rows_are_read_in_chunks(self):
+        # One bounds query, then pages of 2, 2 and 1 rows.
+        with self.assertNumQueries(4 + 3 * 2):
+            replay.replay(['backfill'], models=['exapp.Customer'], chunk_size=2,
+                          segment_size=10 ** 9)
+        self.assertEqual([pk for pk, _, _ in self.seen], self.pks())
+
+    def test_selects_by_dotted_name(self):
+        replay.replay(['exapp.models.post_customer_save'], models=['exapp.Customer'])
+        self.assertEqual(len(models.signal_log['customer postsave']), 5)
+        self.assertEqual(self.seen, [])
+
+    def test_selects_under_receiver_wrappers(self):
+        profiler = profiling.Profiler(signals=[post_save]).enable()
+        self.addCleanup(profiler.disable)
+        self.assertIn('exapp.models.post_customer_save', replay.receivers_for(models.Customer))
+        replay.replay(['backfill'], models=['exapp.Customer'])
+        self.assertEqual(len(self.seen), 5)
+
+    def test_unknown_receiver(self):
+        with self.assertRaises(ValueError):
+            replay.replay(['nonesuch'])
+
+    def test_checkpoint_resumes(self):
+        path = os.path.join(self.directory, 'replay.json')
+        self.fail_at = self.pks()[3]
+        with self.assertRaises(RuntimeError):
+            replay.replay(['backfill'], models=['exapp.Customer'], chunk_size=1,
+                          segment_size=1, checkpoint=path)
+        first = [pk for pk, _, _ in self.seen]
+        self.assertEqual(first, self.pks()[:3])
+        self.seen, self.fail_at = [], None
+        report = replay.replay(['backfill'], models=['exapp.Customer'], chunk_size=1,
+                               segment_size=1, checkpoint=path)
+        self.assertEqual([pk for pk, _, _ in self.seen], self.pks()[3:])
+        self.assertEqual(report.skipped['exapp.Customer'], 3)
+
+        with self.assertRaises(ValueError):
+            replay.replay(['backfill'], models=['exapp.Customer'], segment_size=2,
+                          checkpoint=path)
+
+    def test_checkpoint_compacts_finished_segments(self):
+        checkpoint = replay.Checkpoint(None, {})
+        checkpoint.start('m', 3)
+        checkpoint.add(('m', 4))
+        self.assertEqual(checkpoint.models['m'], (3, {4}))
+        checkpoint.add(('m', 3))
+        self.assertEqual(checkpoint.models['m'], (5, set()))
+        self.assertIn(('m', 1), checkpoint)
+        self.assertNotIn(('m', 5), checkpoint)
+
+    def test_command(self):
+        out = six.StringIO()
+        call_command('replay_signals', '--list', '--model', 'exapp.Customer', stdout=out)
+        self.assertIn('exapp.models.post_customer_save', out.getvalue())
+        out = six.StringIO()
+        call_command('replay_signals', 'backfill', '--model', 'exapp.Customer', stdout=out)
+        self.assertIn('exapp.Customer: 5 rows in 1 segments', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        self.assertEqual(len(self.seen), 5)
+
+
+class MutedTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        for name in ('expensive', 'cheap'):
+            post_save.connect(self.receiver(name), sender=models.Customer, weak=False,
+                              dispatch_uid='muted test %s' % name)
+            self.addCleanup(post_save.disconnect, sender=models.Customer,
+                            dispatch_uid='muted test %s' % name)
+        models.signal_log.clear()
+
+    def receiver(self, name):
+        def receiver(sender, instance, **kwargs):
+            self.calls.append((name, instance.name))
+        receiver.__name__ = name
+        return receiver
+
+    def test_mutes_named_receivers_only(self):
+        with muted(post_save, sender=models.Customer, receivers=['expensive']) as mute:
+            models.Customer.objects.create(name='quiet')
+            models.Company.objects.create(name='not muted')
+        self.assertEqual(self.calls, [('cheap', 'quiet')])
+        self.assertEqual(mute.count, 1)
+        self.assertEqual(len(models.signal_log['customer postsave']), 1)
+        models.Customer.objects.create(name='loud')
+        self.assertEqual(self.calls[1:], [('expensive', 'loud'), ('cheap', 'loud')])
+
+    def test_wrapper_only_while_muted(self):
+        signal = Signal()
+        self.assertFalse(dispatch.is_wrapped(signal))
+        with muted(signal):
+            with muted(signal):
+                self.assertTrue(dispatch.is_wrapped(signal))
+            self.assertTrue(dispatch.is_wrapped(signal))
+        self.assertFalse(dispatch.is_wrapped(signal))
+        self.assertNotIn('_live_receivers', signal.__dict__)
+
+    def test_other_threads_are_unaffected(self):
+        signal = Signal()
+        calls = []
+
+        def receiver(sender, **kwargs):
+            calls.append(threading.current_thread().name)
+        signal.connect(receiver, weak=False)
+        with muted(signal):
+            signal.send(sender=None)
+            thread = threading.Thread(target=signal.send, args=(None,), name='other')
+            thread.start()
+            thread.join()
+        self.assertEqual(calls, ['other'])
+
+    def test_log_replays_once_per_row(self):
+        log = MutedLog()
+        with muted(post_save, sender=models.Customer,
+                   receivers=['exapp.models.post_customer_save', 'expensive'], log=log):
+            customer = models.Customer.objects.create(name='first')
+            customer.name = 'second'
+            customer.save()
+            models.Customer.objects.create(name='other')
+        self.assertNotIn('customer postsave', models.signal_log.keys())
+        self.assertEqual(len(log), 2)
+        self.calls = []
+        log.replay()
+        self.assertEqual(self.calls, [('expensive', 'second'), ('expensive', 'other')])
+        self.assertEqual([r.instance.name for r in models.signal_log['customer postsave']],
+                         ['second', 'other'])
+        self.assertEqual(len(log), 0)
+
+    def test_decorator(self):
+        @muted(post_save, receivers=['cheap'])
+        def create(name):
+            return models.Customer.objects.create(name=name)
+        create('decorated')
+        self.assertEqual(self.calls, [('expensive', 'decorated')])
+
+
+class SignalEventTests(TestCase):
+
+    def connect(self, receiver):
+        event_receiver(pre_save, sender=models.Customer, dispatch_uid='event test')(receiver)
+        self.addCleanup(pre_save.disconnect, sender=models.Customer,
+                        dispatch_uid='event test')
+
+    def test_event_fields(self):
+        seen = []
+
+        def receiver(event):
+            seen.append((event.name, event.label, event.pk, event.raw, event['using'],
+                         event.get('update_fields'), 'instance' in event, event.get('nope')))
+        self.connect(receiver)
+        customer = models.Customer.objects.create(name='evented')
+        customer.save(update_fields=['name'])
+        self.assertEqual(seen, [
+            ('pre_save', 'exapp.Customer', None, False, 'default', None, True, None),
+            ('pre_save', 'exapp.Customer', customer.pk, False, 'default',
+             frozenset(['name']), True, None)])
+
+    def test_unkept_events_are_reused(self):
+        ids = []
+
+        def receiver(event):
+            ids.append(id(event))
+        self.connect(receiver)
+        customer = models.Customer.objects.create(name='pooled')
+        customer.save()
+        customer.save()
+        self.assertEqual(len(set(ids[1:])), 1)
+
+    def test_kept_events_are_left_alone(self):
+        kept = []
+
+        def receiver(event):
+            kept.append(event)
+        self.connect(receiver)
+        first = models.Customer.objects.create(name='first')
+        models.Customer.objects.create(name='second')
+        self.assertIsNot(kept[0], kept[1])
+        self.assertIs(kept[0].instance, first)
+        self.assertEqual(kept[0].name, 'pre_save')
+
+    def test_pool_is_bounded(self):
+        pool = EventPool(size=1)
+        a, b = pool.acquire(None, {}), pool.acquire(None, {})
+        pool.release(a)
+        pool.release(b)
+        self.assertEqual(len(pool), 1)
+        self.assertIsNone(a.kwargs)
+        self.assertIs(pool.acquire(None, {'instance': 1}), a)
+
+    def test_log_records_from_events(self):
+        models.signal_log.clear()
+        customer = models.Customer.objects.create(name='logged')
+        record = models.signal_log['customer presave'][0]
+        self.assertEqual((record.sender, record.signal, record.pk, record.instance),
+                         (models.Customer, 'pre_save', None, customer))
+
+    @unittest.skipIf(benchmarks.tracemalloc is None, "needs tracemalloc")
+    def test_save_allocation_budget(self):
+        tracemalloc = benchmarks.tracemalloc
+        capacity = models.signal_log.capacity
+        models.signal_log.capacity = 10
+        models.signal_log.clear()
+        self.addCleanup(models.signal_log.clear)
+        self.addCleanup(setattr, models.signal_log, 'capacity', capacity)
+        customer = models.Customer.objects.create(name='budget')
+
+        def traced():
+            # sqlite3 keeps a weak reference to each cursor and only prunes
+            # them every 200 cursors, so leave its backend's cursors out.
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, '*/sqlite3/base.py'),
+                 tracemalloc.Filter(False, tracemalloc.__file__)])
+            return sum(stat.size for stat in snapshot.statistics('filename'))
+
+        tracemalloc.start()
+        try:
+            for _ in range(20):
+                customer.save()     # Fill the log's ring buffers.
+            traced()                # Compile the filters' patterns.
+            gc.collect()
+            before = traced()
+            for _ in range(100):
+                customer.save()
+            gc.collect()
+            retained = traced() - before
+        finally:
+            tracemalloc.stop()
+        tracemalloc.start()
+        try:
+            customer.save()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(retained / 100.0, 64)
+        self.assertLess(peak, 32 * 1024)
+
+
+class TopologyTests(SimpleTestCase):
+
+    def relation(self, model, name):
+        return get_topology().get(model, name)
+
+    def test_foreign_key_both_ends(self):
+        company = self.relation(models.Customer, 'company')
+        self.assertEqual((company.kind, company.reverse, company.related_model,
+                          company.reverse_name, company.on_delete),
+                         ('fk', False, models.Company, 'customers', 'CASCADE'))
+        customers = self.relation(models.Company, 'customers')
+        self.assertEqual((customers.kind, customers.reverse, customers.reverse_name,
+                          customers.sender, customers.to_many),
+                         ('fk', True, 'company', models.Customer, True))
+
+    def test_one_to_one(self):
+        extrajunk = self.relation(models.Customer, 'extrajunk')
+        self.assertEqual((extrajunk.kind, extrajunk.reverse, extrajunk.related_model,
+                          extrajunk.to_many),
+                         ('one_to_one', True, models.CustomerExtraJunk, False))
+
+    def test_many_to_many(self):
+        direct = self.relation(models.Customer, 'categories_direct')
+        self.assertTrue(direct.through._meta.auto_created)
+        self.assertEqual((direct.source_field.related_model, direct.target_field.related_model),
+                         (models.Customer, models.CustomerCategory))
+        indirect = self.relation(models.CustomerCategory, 'customers_indirect')
+        self.assertIs(indirect.through, models.CustomerCategoryRel)
+        self.assertEqual((indirect.source_field.name, indirect.target_field.name,
+                          indirect.reverse_name), ('category', 'customer', 'categories_indirect'))
+
+    def test_pointing_to(self):
+        self.assertEqual(
+            set((r.model, r.name) for r in get_topology().pointing_to(models.Customer)),
+            set([(models.CustomerExtraJunk, 'customer'),
+                 (models.CustomerCategoryRel, 'customer')]))
+
+    def test_receivers_and_json(self):
+        def listener(sender, **kwargs):
+            pass
+        related_changed.connect(listener, sender=models.Customer, weak=False,
+                                dispatch_uid='topology test')
+        self.addCleanup(related_changed.disconnect, sender=models.Customer,
+                        dispatch_uid='topology test')
+        relation = self.relation(models.Company, 'customers')
+        self.assertIn(listener, get_topology().receivers(relation))
+        out = six.StringIO()
+        call_command('signal_topology', '--model', 'exapp.Company', stdout=out)
+        relations = json.loads(out.getvalue())['relations']
+        self.assertEqual([r['name'] for r in relations], ['customers'])
+        self.assertEqual(relations[0]['reverse_name'], 'company')
+        self.assertIn(dispatch.receiver_label(listener), relations[0]['receivers'])
+        data = json.loads(get_topology().as_json())
+        rel = [r for r in data['relations']
+               if (r['model'], r['name']) == ('exapp.Customer', 'categories_indirect')][0]
+        self.assertEqual((rel['through'], rel['through_fields']),
+                         ('exapp.CustomerCategoryRel', ['customer', 'category']))
+
+
+class LoadTestViewTests(TestCase):
+
+    def call(self, method, path, data=None):
+        response = getattr(self.client, method)(
+            '/load/' + path, json.dumps(data) if data is not None else '',
+            content_type='application/json')
+        return response.status_code, json.loads(response.content.decode('utf-8')), response
+
+    def test_create_relate_reassign_delete(self):
+        status, company, _ = self.call('post', 'companies/', {'name': 'acme'})
+        self.assertEqual(status, 201)
+        _, category, _ = self.call('post', 'categories/', {'name': 'gold'})
+        _, customer, _ = self.call('post', 'customers/',
+                                   {'name': 'bob', 'company': company['id']})
+        self.assertEqual(models.Customer.objects.get(pk=customer['id']).company_id,
+                         company['id'])
+        path = 'customers/%d/categories/' % customer['id']
+        status, data, _ = self.call('post', path, {'add': [category['id']]})
+        self.assertEqual((status, data['categories']), (200, [category['id']]))
+        _, data, _ = self.call('post', path, {'add': [category['id']], 'through': True})
+        self.assertEqual(data['categories'], [category['id']])
+        self.assertEqual(models.CustomerCategoryRel.objects.count(), 1)
+        _, data, _ = self.call('post', path, {'remove': [category['id']], 'through': True})
+        self.assertEqual(data['categories'], [])
+
+        status, data, _ = self.call('post', 'customers/%d/' % customer['id'], {'company': None})
+        self.assertEqual((status, data['company']), (200, None))
+        self.assertEqual(self.call('get', 'stats/')[1],
+                         {'companies': 1, 'customers': 1, 'categories': 1})
+        self.assertEqual(self.call('delete', 'customers/%d/' % customer['id'])[0], 200)
+        self.assertEqual(self.call('delete', 'companies/%d/' % company['id'])[0], 200)
+        self.assertFalse(models.Customer.objects.exists())
+
+    def test_errors(self):
+        self.assertEqual(self.call('delete', 'customers/999/')[0], 404)
+        self.assertEqual(self.call('post', 'customers/', {'company': 999})[0], 400)
+        self.assertEqual(self.call('post', 'customers/', {'name': 'a', 'company': 999})[0], 400)
+        response = self.client.post('/load/companies/', '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        status, _, response = self.call('get', 'companies/')
+        self.assertEqual((status, response['Allow']), (405, 'POST'))
+
+    def test_timing_headers(self):
+        _, _, response = self.call('post', 'companies/', {'name': 'acme'})
+        self.assertFalse(response.has_header('X-Request-Time'))
+        loadtest.clock.enable()
+        self.addCleanup(loadtest.clock.disable)
+        _, _, response = self.call('post', 'companies/', {'name': 'acme'})
+        request = float(response['X-Request-Time'])
+        self.assertTrue(0 < float(response['X-Receiver-Time']) <= request)
+
+
+class LoadReportTests(SimpleTestCase):
+
+    def test_parse_workload(self):
+        self.assertEqual(loadtest.parse_workload('create'), loadtest.WORKLOADS['create'])
+        self.assertEqual(loadtest.parse_workload('relate=3, create_customer'),
+                         {'relate': 3, 'create_customer': 1})
+        for spec in ('relate=x', 'frobnicate=1', 'relate=0'):
+            self.assertRaises(ValueError, loadtest.parse_workload, spec)
+
+    def test_report(self):
+        samples = [loadtest.Sample('relate', 200, n / 1000.0, 0.001, 0.00025)
+                   for n in range(1, 101)]
+        samples.append(loadtest.Sample('relate', 500, 0.2, None, None))
+        data = loadtest.LoadReport(samples, seconds=2.0).as_dict()
+        self.assertEqual((data['requests'], data['errors']), (101, 1))
+        self.assertAlmostEqual(data['throughput'], 50.5)
+        self.assertAlmostEqual(data['p50_ms'], 51)
+        self.assertAlmostEqual(data['p99_ms'], 100)
+        self.assertAlmostEqual(data['max_ms'], 200)
+        self.assertAlmostEqual(data['receiver_share'], 0.25)
+        self.assertEqual(data['operations']['relate']['errors'], 1)
+
+
+class LoadTestServerTests(LiveServerTestCase):
+
+    def test_run(self):
+        loadtest.clock.enable()
+        self.addCleanup(loadtest.clock.disable)
+        report = loadtest.run(self.live_server_url + '/load/', threads=1, requests=30, seed=1)
+        self.assertEqual((report.requests, report.errors), (30, 0))
+        operations = report.operations()
+        created = operations['create_customer']['requests']
+        deleted = operations.get('delete_customer', {}).get('requests', 0)
+        self.assertEqual(models.Customer.objects.count(), created - deleted)
+        self.assertTrue(0 < report.receiver_share < 1)
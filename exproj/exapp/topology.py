@@ -0,0 +1,189 @@
+"""
+The relations between installed models, worked out from ``_meta`` once.
+
+    topology = get_topology()
+    relation = topology.get(Customer, 'categories_indirect')
+    relation.reverse_name, relation.through, relation.source_field
+    topology.pointing_to(Customer)      # what deleting a customer touches
+    topology.receivers(relation)        # its related_changed receivers
+
+Every relation is indexed from both ends: ``Customer.company`` and
+``Company.customers`` are two ``Relation``s, each naming the other as
+``reverse_name``.  Lookups are dict reads, so ``exapp.relation_signals``
+and ``exapp.related`` route events with them instead of walking ``_meta``.
+
+``configure()`` builds the index for every installed model at app-ready
+time; ``as_json()`` (and the ``signal_topology`` command) export it.
+"""
+import json
+
+from . import dispatch
+from .compat import remote_field
+from .signals import related_changed
+
+
+FK = 'fk'
+ONE_TO_ONE = 'one_to_one'
+M2M = 'm2m'
+
+
+def _label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name)
+
+
+class Relation(object):
+    """
+    ``model.name``: one end of a relation.  ``field`` is the declaring
+    (forward) field whichever end this is; for many-to-many relations
+    ``source_field`` and ``target_field`` are the ``through`` model's foreign
+    keys to this end and to the other.
+    """
+
+    __slots__ = ('model', 'name', 'kind', 'reverse', 'field', 'related_model',
+                 'reverse_name', 'through', 'source_field', 'target_field', 'on_delete')
+
+    def __init__(self, model, name, kind, reverse, field, related_model, reverse_name,
+                 through=None, source_field=None, target_field=None, on_delete=None):
+        self.model = model
+        self.name = name
+        self.kind = kind
+        self.reverse = reverse
+        self.field = field
+        self.related_model = related_model
+        self.reverse_name = reverse_name
+        self.through = through
+        self.source_field = source_field
+        self.target_field = target_field
+        self.on_delete = on_delete
+
+    @property
+    def sender(self):
+        """The sender of this relation's ``related_changed``."""
+        return self.field.model
+
+    @property
+    def to_many(self):
+        return self.kind == M2M or (self.kind == FK and self.reverse)
+
+    def as_dict(self):
+        return {
+            'model': _label(self.model),
+            'name': self.name,
+            'kind': self.kind,
+            'reverse': self.reverse,
+            'related_model': _label(self.related_model),
+            'reverse_name': self.reverse_name,
+            'through': _label(self.through) if self.through is not None else None,
+            'through_fields': [self.source_field.name, self.target_field.name]
+            if self.through is not None else None,
+            'on_delete': self.on_delete,
+        }
+
+    def __repr__(self):
+        return '<Relation %s.%s>' % (self.model._meta.object_name, self.name)
+
+
+def _on_delete(rel):
+    on_delete = getattr(rel, 'on_delete', None)
+    return getattr(on_delete, '__name__', None)
+
+
+def _relations(model):
+    for field in model._meta.get_fields():
+        if not field.is_relation:
+            continue
+        if field.auto_created and not field.concrete:
+            # The reverse end of a relation declared on field.related_model.
+            forward = field.field
+            if field.many_to_many:
+                through = remote_field(forward).through
+                yield Relation(
+                    model, field.get_accessor_name(), M2M, True, forward, field.related_model,
+                    forward.name, through,
+                    through._meta.get_field(forward.m2m_reverse_field_name()),
+                    through._meta.get_field(forward.m2m_field_name()))
+            else:
+                yield Relation(
+                    model, field.get_accessor_name(), ONE_TO_ONE if field.one_to_one else FK,
+                    True, forward, field.related_model, forward.name,
+                    on_delete=_on_delete(field))
+        elif field.many_to_many:
+            rel = remote_field(field)
+            through = rel.through
+            yield Relation(
+                model, field.name, M2M, False, field, field.related_model,
+                None if rel.is_hidden() else rel.get_accessor_name(), through,
+                through._meta.get_field(field.m2m_field_name()),
+                through._meta.get_field(field.m2m_reverse_field_name()))
+        elif field.concrete and (field.many_to_one or field.one_to_one):
+            rel = remote_field(field)
+            yield Relation(
+                model, field.name, ONE_TO_ONE if field.one_to_one else FK, False, field,
+                field.related_model, None if rel.is_hidden() else rel.get_accessor_name(),
+                on_delete=_on_delete(rel))
+
+
+class Topology(object):
+
+    def __init__(self, models):
+        self._relations = {}
+        self._by_model = {}
+        self._pointing_to = {}
+        for model in models:
+            relations = tuple(_relations(model))
+            self._by_model[model] = relations
+            for relation in relations:
+                self._relations[(model, relation.name)] = relation
+                if not relation.reverse:
+                    self._pointing_to.setdefault(relation.related_model, []).append(relation)
+        self._pointing_to = dict((model, tuple(relations))
+                                 for model, relations in self._pointing_to.items())
+
+    def get(self, model, name):
+        """The ``Relation`` at ``model.name``, or None."""
+        return self._relations.get((model, name))
+
+    def relations(self, model):
+        return self._by_model.get(model, ())
+
+    def pointing_to(self, model):
+        """Forward relations (foreign keys, one-to-ones, many-to-manys) targeting ``model``."""
+        return self._pointing_to.get(model, ())
+
+    def receivers(self, relation):
+        """The ``related_changed`` receivers ``relation``'s changes reach."""
+        return dispatch.receivers_for(related_changed, relation.sender)
+
+    def __iter__(self):
+        return iter(self._relations.values())
+
+    def __len__(self):
+        return len(self._relations)
+
+    def as_dict(self):
+        relations = []
+        for relation in sorted(self, key=lambda r: (_label(r.model), r.name)):
+            data = relation.as_dict()
+            data['receivers'] = [dispatch.receiver_label(r) for r in self.receivers(relation)]
+            relations.append(data)
+        return {'relations': relations}
+
+    def as_json(self, indent=None):
+        return json.dumps(self.as_dict(), indent=indent, sort_keys=True)
+
+
+topology = None
+
+
+def get_topology():
+    """The installed models' ``Topology``, built on first use."""
+    global topology
+    if topology is None:
+        from django.apps import apps
+        topology = Topology(apps.get_models())
+    return topology
+
+
+def configure():
+    """Build the index; called from ``AppConfig.ready``."""
+    return get_topology()
@@ -0,0 +1,16 @@
+from django.conf.urls import url
+
+from . import views
+
+app_name = 'exapp'
+
+urlpatterns = [
+    url(r'^companies/$', views.companies, name='companies'),
+    url(r'^companies/(?P<pk>\d+)/$', views.company, name='company'),
+    url(r'^categories/$', views.categories, name='categories'),
+    url(r'^customers/$', views.customers, name='customers'),
+    url(r'^customers/(?P<pk>\d+)/$', views.customer, name='customer'),
+    url(r'^customers/(?P<pk>\d+)/categories/$', views.customer_categories,
+        name='customer-categories'),
+    url(r'^stats/$', views.stats, name='stats'),
+]
@@ -1,3 +1,173 @@
-from django.shortcuts import render
+"""
+JSON endpoints writing Customers, Companies and CustomerCategories, for
+driving signal dispatch with real requests (see ``exapp.loadtest``).
 
-# Create your views here.
+    POST   companies/                  {"name": ...}
+    DELETE companies/<pk>/
+    POST   categories/                 {"name": ...}
+    POST   customers/                  {"name": ..., "company": <pk or null>}
+    POST   customers/<pk>/             {"name": ..., "company": ...}, either or both
+    DELETE customers/<pk>/
+    POST   customers/<pk>/categories/  {"add": [pks], "remove": [pks], "through": false}
+    GET    stats/
+
+Writes go through the models, so every receiver runs as it would for any
+other caller.  ``through`` relates categories with ``CustomerCategoryRel``
+rows (``categories_indirect``) instead of ``categories_direct``.  Responses
+carry ``X-Request-Time`` and ``X-Receiver-Time`` headers while
+``loadtest.clock`` is enabled.
+"""
+import functools
+import json
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from . import loadtest
+from .models import Company, Customer, CustomerCategory, CustomerCategoryRel
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _body(request):
+    if not request.body:
+        return {}
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except ValueError as e:
+        raise BadRequest("Invalid JSON: %s" % e)
+    if not isinstance(data, dict):
+        raise BadRequest("Expected a JSON object")
+    return data
+
+
+def _get(model, pk):
+    try:
+        return model.objects.get(pk=pk)
+    except model.DoesNotExist:
+        return None
+
+
+def json_view(methods):
+    """
+    Wrap a view returning ``(status, data)``: check the method, decode
+    ``BadRequest`` as 400, and time the request for ``loadtest.clock``.
+    """
+    def decorator(func):
+        @csrf_exempt
+        @functools.wraps(func)
+        def view(request, *args, **kwargs):
+            if request.method not in methods:
+                response = JsonResponse({'error': 'Method not allowed'}, status=405)
+                response['Allow'] = ', '.join(methods)
+                return response
+            with loadtest.clock.measure() as measured:
+                try:
+                    status, data = func(request, *args, **kwargs)
+                except BadRequest as e:
+                    status, data = 400, {'error': str(e)}
+            response = JsonResponse(data, status=status)
+            if measured.request is not None:
+                response['X-Request-Time'] = '%.6f' % measured.request
+                response['X-Receiver-Time'] = '%.6f' % measured.receivers
+            return response
+        return view
+    return decorator
+
+
+def _name(data, default=None):
+    name = data.get('name', default)
+    if name is None:
+        raise BadRequest("'name' is required")
+    return name
+
+
+def _company(data):
+    pk = data.get('company')
+    if pk is None:
+        return None
+    company = _get(Company, pk)
+    if company is None:
+        raise BadRequest("No company %s" % pk)
+    return company
+
+
+@json_view(['POST'])
+def companies(request):
+    company = Company.objects.create(name=_name(_body(request)))
+    return 201, {'id': company.pk}
+
+
+@json_view(['DELETE'])
+def company(request, pk):
+    company = _get(Company, pk)
+    if company is None:
+        return 404, {'error': 'Not found'}
+    company.delete()
+    return 200, {'id': int(pk)}
+
+
+@json_view(['POST'])
+def categories(request):
+    category = CustomerCategory.objects.create(name=_name(_body(request)))
+    return 201, {'id': category.pk}
+
+
+@json_view(['POST'])
+def customers(request):
+    data = _body(request)
+    customer = Customer.objects.create(name=_name(data), company=_company(data))
+    return 201, {'id': customer.pk}
+
+
+@json_view(['POST', 'DELETE'])
+def customer(request, pk):
+    customer = _get(Customer, pk)
+    if customer is None:
+        return 404, {'error': 'Not found'}
+    if request.method == 'DELETE':
+        customer.delete()
+        return 200, {'id': int(pk)}
+    data = _body(request)
+    customer.name = _name(data, customer.name)
+    if 'company' in data:
+        customer.company = _company(data)
+    customer.save()
+    return 200, {'id': customer.pk, 'company': customer.company_id}
+
+
+@json_view(['POST'])
+def customer_categories(request, pk):
+    customer = _get(Customer, pk)
+    if customer is None:
+        return 404, {'error': 'Not found'}
+    data = _body(request)
+    add = list(CustomerCategory.objects.filter(pk__in=data.get('add') or []))
+    remove = data.get('remove') or []
+    if data.get('through'):
+        existing = set(customer.categories_indirect.values_list('pk', flat=True))
+        for category in add:
+            if category.pk not in existing:
+                CustomerCategoryRel.objects.create(customer=customer, category=category)
+        for rel in CustomerCategoryRel.objects.filter(customer=customer, category__in=remove):
+            rel.delete()
+        related = customer.categories_indirect
+    else:
+        if add:
+            customer.categories_direct.add(*add)
+        if remove:
+            customer.categories_direct.remove(*remove)
+        related = customer.categories_direct
+    return 200, {'id': customer.pk,
+                 'categories': sorted(related.values_list('pk', flat=True))}
+
+
+@json_view(['GET'])
+def stats(request):
+    return 200, {
+        'companies': Company.objects.count(),
+        'customers': Customer.objects.count(),
+        'categories': CustomerCategory.objects.count(),
+    }
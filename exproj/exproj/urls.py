@@ -17,4 +17,5 @@ from django.contrib import admin
 
 urlpatterns = [
     url(r'^admin/', include(admin.site.urls)),
+    url(r'^load/', include('exapp.urls', namespace='exapp')),
 ]
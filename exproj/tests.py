@@ -1,20 +1,15 @@
 from django.test import TestCase
 from exapp import models
+from exapp.testing import SignalAssertionsMixin
 
 
-class Tests(TestCase):
+class Tests(SignalAssertionsMixin, TestCase):
 
     @classmethod
     def setUpTestData(cls):
         cls.company = models.Company(name='mycomp')
         cls.company.save()
 
-    def setUp(self):
-        models.signal_log.clear()
-
-    def assert_sent_exact(self, *keys):
-        self.assertItemsEqual(models.signal_log.keys(), keys)
-
     def test_1to1_forward_direct_assignment_obviously_fires(self):
         customer = models.Customer(name='1to1 forward test', company=self.company)
         customer.save()
@@ -25,7 +20,8 @@ class Tests(TestCase):
         extra.customer = customer
         extra.save()
 
-        self.assert_sent_exact('extra junk presave', 'extra junk postsave')
+        self.assert_sent_exact('extra junk presave', 'extra junk postsave',
+                               max_queries_per_signal=0)
 
     def test_1to1_forward_direct_assignment_not_allowed_if_child_unsaved(self):
         customer = models.Customer(name='1to1 unsaved forward test', company=self.company)
@@ -164,7 +160,7 @@ class Tests(TestCase):
         rel.save()
 
         # The 'through' model gets a presave, but not the related model (categories)
-        self.assert_sent_exact('rel presave', 'rel postsave')
+        self.assert_sent_exact('rel presave', 'rel postsave', max_queries_per_signal=0)
 
     def test_m2m_direct_assigment_does_not_allow_unsaved_children(self):
         customer = models.Customer(name='test unsaved m2m children')
@@ -220,7 +216,7 @@ class Tests(TestCase):
 
         extra.delete()
         # No signals on `cust`
-        self.assert_sent_exact('extra predelete', 'extra postdelete')
+        self.assert_sent_exact('extra predelete', 'extra postdelete', max_queries_per_signal=0)
 
     def test_1to1_reverse_deletion_not_allowed(self):
         # This was actually a bug as of django 1.8
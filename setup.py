@@ -8,6 +8,7 @@ setup(
     description="",
     install_requires=[
         "Django>=1.8",
+        "futures>=3.0; python_version < '3.2'",
     ],
     zip_safe=False,
 )